@@ -0,0 +1,126 @@
+"""
+Замеры задержки и пропускной способности основных методов HMP4040 на локальном имитаторе HMP4040Simulator.
+
+    python benchmarks/hmp4040_bench.py --iterations 200 --connections 1 4 --output bench.json
+
+Результат сохраняется в JSON: для каждого сценария и числа соединений - перцентили задержки одного вызова,
+число вызовов и SCPI-команд в секунду. Сравнение файлов двух версий показывает регрессии в горячих путях.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from hmp4040 import HMP4040, HMP4040Simulator  # noqa: E402
+
+CHANNELS = ('1', '2', '3', '4')
+ARB_SEQUENCE = ','.join('%.3f,%.3f,%.2f' % (1 + i * 0.1, 0.5, 0.01) for i in range(128))
+
+SCENARIOS = {
+    'set_channel_params': lambda hmp: hmp.set_channel_params(CHANNELS, 5.0, 1.0),
+    'get_channel_params': lambda hmp: hmp.get_channel_params(CHANNELS),
+    'measure_voltage': lambda hmp: hmp.measure_voltage(('1',)),
+    'snapshot': lambda hmp: hmp.snapshot(CHANNELS),
+    'arb_upload': lambda hmp: hmp.set_arbitrary_sequence(('1',), ARB_SEQUENCE),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(simulator, scenario, iterations, connections, warmup):
+    """
+    Выполняет сценарий iterations раз на каждом из connections соединений, работающих в отдельных потоках
+    :return: словарь с результатами замера
+    """
+    clients = []
+    for _ in range(connections):
+        hmp = HMP4040()
+        if not hmp.connect(*simulator.address):
+            raise RuntimeError('cannot connect to simulator')
+        for _ in range(warmup):
+            scenario(hmp)
+        clients.append(hmp)
+    latencies = [[] for _ in clients]
+    barrier = threading.Barrier(connections + 1)
+
+    def worker(hmp, samples):
+        barrier.wait()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            scenario(hmp)
+            samples.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(hmp, samples)) for hmp, samples in zip(clients, latencies)]
+    for thread in threads:
+        thread.start()
+    received = simulator.received
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    commands = simulator.received - received
+    for hmp in clients:
+        hmp.disconnect()
+    samples = sorted(sample for per_client in latencies for sample in per_client)
+    return {
+        'connections': connections,
+        'calls': len(samples),
+        'elapsed_s': elapsed,
+        'calls_per_s': len(samples) / elapsed,
+        'commands_per_s': commands / elapsed,
+        'latency_ms': {
+            'mean': 1000 * sum(samples) / len(samples),
+            'p50': 1000 * percentile(samples, 0.5),
+            'p90': 1000 * percentile(samples, 0.9),
+            'p99': 1000 * percentile(samples, 0.99),
+            'max': 1000 * samples[-1],
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HMP4040 driver benchmarks against the local simulator')
+    parser.add_argument('--iterations', type=int, default=200, help='calls per connection')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed calls per connection')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 4], help='parallel connection counts')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated reply latency, s')
+    parser.add_argument('--scenario', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'simulator_latency_s': args.latency,
+        'results': {},
+    }
+    with HMP4040Simulator(latency=args.latency) as simulator:
+        for name in args.scenario:
+            report['results'][name] = []
+            for connections in args.connections:
+                result = run_scenario(simulator, SCENARIOS[name], args.iterations, connections, args.warmup)
+                report['results'][name].append(result)
+                print('%-20s x%-3d %9.1f calls/s %9.1f cmd/s  p50 %7.3f ms  p99 %7.3f ms' % (
+                    name, connections, result['calls_per_s'], result['commands_per_s'],
+                    result['latency_ms']['p50'], result['latency_ms']['p99']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from .HMP4040 import HMP4040, _SNAPSHOT_QUERIES
+from .arbitrary import arbitrary_digest, format_arbitrary
+from .cache import MISS
+from .instrumentation import scpi_verb
+from .models import model_from_idn
+from .records import parse_bool, parse_int, parse_str
+from .validation import mask_channels
+
+
+class AsyncHMP4040(HMP4040):
+    """
+    Асинхронный клиент ЛБП на asyncio. Повторяет методы HMP4040 (set_voltage, measure_current, FUSE, OVP, ARB и т.д.),
+    но каждый из них возвращает корутину. На одно соединение одновременно выполняется только один обмен с ЛБП,
+    поэтому один цикл событий может обслуживать десятки блоков питания без отдельного потока на каждый.
+    Команды на несколько каналов отправляются одной посылкой вместе с выбором канала, что делает их атомарными
+    относительно других корутин, работающих с тем же соединением. Кэш уставок (enable_setpoint_cache) работает так
+    же, как в HMP4040; запись обмена (start_recording) не поддерживается.
+    """
+    def __init__(self, ip='192.168.101.4', port="5025", connect_timeout=1.0, read_timeout=1.0):
+        super().__init__(ip, port)
+        self.transport = None
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._stale = False
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._owner = None
+
+    async def connect(self, ip='10.6.1.4', port="5025"):
+        """
+        Устанавливает соединение с ЛБП
+        :param ip: адрес ЛБП
+        :param port: порт ЛБП
+        :return: При успешном подключении возвращает истину, иначе ложь
+        """
+        self.IP = ip
+        self.Port = port
+        self._stale = False
+        self._selected_channel = None
+        self._arb_cache = {}
+        self._myprint("trying to connect to %s : %d", ip, int(port))
+        try:
+            self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(ip, int(port)),
+                                                                self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            self._myprint('Caught exception socket.error : %s', exc)
+            self.connectionStatus = False
+            return False
+        self._myprint('connected to server %s:%s', ip, port)
+        self.connectionStatus = True
+        return True
+
+    def start_recording(self, path):
+        raise RuntimeError('AsyncHMP4040 does not support session recording, use HMP4040.start_recording')
+
+    def stop_recording(self):
+        raise RuntimeError('AsyncHMP4040 does not support session recording, use HMP4040.stop_recording')
+
+    async def reconnect(self):
+        await self.disconnect()
+        return await self.connect(self.get_ip(), self.get_port())
+
+    @property
+    def client(self):
+        return self._writer.get_extra_info('socket') if self._writer is not None else None
+
+    async def disconnect(self):
+        self._pending = []
+        self._selected_channel = None
+        self._arb_cache = {}
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+            self._reader = None
+        self.connectionStatus = False
+        self._myprint('disconnected')
+
+    @asynccontextmanager
+    async def _locked(self):
+        """
+        Захватывает соединение. Внутри pipeline соединение уже захвачено корутиной-владельцем конвейера.
+        """
+        if self._owner is not None and self._owner is asyncio.current_task():
+            yield
+        else:
+            async with self._lock:
+                yield
+
+    async def _exchange(self, cmds):
+        """
+        Отправляет команды одной посылкой и читает ответы на все запросы. Вызывается только под
+        self._locked(). В конвейерном режиме команды без запросов накапливаются и уходят вместе со следующим запросом.
+        :param cmds: список команд
+        :return: список ответов на запросы
+        """
+        for cmd in cmds:
+            self._myprint('client send: %s', cmd)
+            self._track_state(cmd)
+        if self._pipeline_depth:
+            if not any(cmd.find('?') != -1 for cmd in cmds):
+                self._pending.extend(cmds)
+                return []
+            cmds, self._pending = self._pending + list(cmds), []
+        if self._stale:
+            await self._discard_stale()
+        start = time.perf_counter()
+        data = ('\n'.join(cmds) + '\n').encode()
+        received_data = []
+        try:
+            self._writer.write(data)
+            await self._writer.drain()
+            if self.stats is not None:
+                self.stats.record_sent(cmds, len(data))
+            for cmd in cmds:
+                if cmd.find('?') != -1:
+                    try:
+                        line = await asyncio.wait_for(self._reader.readline(), self.read_timeout)
+                    except asyncio.TimeoutError:
+                        self._stale = True
+                        raise
+                    if not line:
+                        raise ConnectionError('connection closed by HMP4040')
+                    received_data.append(line.decode())
+                    if self.stats is not None:
+                        self.stats.record_received(len(line))
+                    self._myprint("received: %r", received_data[-1])
+        except asyncio.TimeoutError:
+            raise
+        except OSError:
+            self.connectionStatus = False
+            if self.setpoint_cache is not None:
+                self.setpoint_cache.clear()
+            raise
+        if self.stats is not None and received_data:
+            self.stats.record_exchange(scpi_verb(cmds[0]) if len(cmds) == 1 else 'BATCH', time.perf_counter() - start)
+        return received_data
+
+    async def _discard_stale(self):
+        """
+        Сбрасывает опоздавшие ответы на запросы, завершившиеся по таймауту
+        """
+        try:
+            while await asyncio.wait_for(self._reader.read(4096), 0.01):
+                pass
+        except asyncio.TimeoutError:
+            pass
+        self._stale = False
+
+    async def send_command(self, cmd):
+        """
+        Отправляет команду на ЛБП и, если это запрос, дожидается ответа
+        :param cmd: Команда для отправки в ЛБП
+        :return: Если ожидается ответ, то возвращается строка с ответом, иначе ничего не возвращает
+        """
+        async with self._locked():
+            received_data = await self._exchange([cmd])
+            if cmd.find('?') != -1:
+                return received_data[0]
+            if not self._pipeline_depth:
+                await asyncio.sleep(self.write_delay)
+            return None
+
+    async def send_batch(self, cmds):
+        """
+        Отправляет список команд одной посылкой и читает ответы на все запросы из списка
+        :param cmds: список команд, в том числе запросов
+        :return: список ответов на запросы в порядке их следования в cmds
+        """
+        if not cmds:
+            return []
+        async with self._locked():
+            return await self._exchange(list(cmds))
+
+    async def _on_channels(self, channels_, *cmds):
+        """
+        Выполняет cmds на каждом из каналов одной посылкой
+        :param channels_: список каналов
+        :param cmds: команды, выполняемые на каждом канале
+        :return: список ответов на запросы
+        """
+        async with self._locked():
+            return await self._exchange(self._channel_commands(channels_, *cmds))
+
+    async def _query(self, cmd, parse=parse_str):
+        value = self._cached(self._selected_channel, cmd)
+        if value is MISS:
+            value = self._remember(self._selected_channel, cmd, parse(await self.send_command(cmd)))
+        return value
+
+    async def _for_each_channel(self, *__check_functions, ch=('1', '2', '3', '4'), cmd='', parse=parse_str):
+        checked = self._check_channel(ch)
+        if checked is None or not all(__check_functions):
+            return False
+        channels, mask = checked
+        if cmd.find('?') != -1:
+            received_data = [self._cached(i, cmd) for i in channels]
+            missing = [i for i, value in zip(channels, received_data) if value is MISS]
+            if missing:
+                replies = iter(await self._on_channels(missing, cmd))
+                received_data = [self._remember(i, cmd, parse(next(replies))) if value is MISS else value
+                                 for i, value in zip(channels, received_data)]
+            return received_data
+        elif cmd == '':
+            return False
+        else:
+            async with self._locked():
+                cmds = self._channel_commands(mask_channels(mask), cmd)
+                await self._exchange(cmds if self._pipeline_depth else cmds + ['*OPC?'])
+            return True
+
+    @asynccontextmanager
+    async def pipeline(self, sync_cmd='*OPC?'):
+        """
+        Конвейерный режим: команды без запросов внутри блока async with не отправляются по одной, а уходят одной
+        посылкой вместе со следующим запросом или синхронизацией sync_cmd при выходе из внешнего блока. На время
+        блока соединение захвачено, команды других корутин ждут его окончания. При исключении внутри блока
+        накопленные команды отбрасываются.
+        :param sync_cmd: запрос синхронизации ('*OPC?' или 'SYST:ERR?')
+        """
+        async with self._locked():
+            owner, self._owner = self._owner, asyncio.current_task()
+            self._pipeline_depth += 1
+            try:
+                yield self
+                if self._pipeline_depth == 1:
+                    await self.flush(sync_cmd)
+            except BaseException:
+                if self._pipeline_depth == 1:
+                    self._pending = []
+                    self._selected_channel = None
+                raise
+            finally:
+                self._pipeline_depth -= 1
+                self._owner = owner
+
+    async def flush(self, sync_cmd='*OPC?'):
+        """
+        Отправляет накопленные в конвейере команды одной посылкой и дожидается ответа на запрос синхронизации
+        :param sync_cmd: запрос синхронизации ('*OPC?' или 'SYST:ERR?')
+        :return: ответ на запрос синхронизации или None, если отправлять было нечего
+        """
+        if not self._pending:
+            return None
+        return await self.send_command(sync_cmd)
+
+    async def check_sound(self):
+        await self.send_command('SYST:BEEP')
+
+    async def set_step_voltage(self, step_="1.0"):
+        step_ = self._check_voltage(step_)
+        if step_:
+            await self.send_command('VOLT:STEP ' + step_)
+            return True
+        else:
+            return False
+
+    async def set_step_current(self, step="0.1"):
+        step = self._check_current(step)
+        if step:
+            await self.send_command('CURR:STEP ' + step)
+            return True
+        else:
+            return False
+
+    async def snapshot(self, channels_=('1', '2', '3', '4')):
+        if not self._check_channel(channels_):
+            return False
+        return self._parse_snapshot(channels_, await self._on_channels(channels_, *_SNAPSHOT_QUERIES))
+
+    async def detect_model(self):
+        model = model_from_idn(await self.get_identification_info())
+        if model is not None:
+            self.model = model
+        return model
+
+    async def enable_protection_events(self, channels_=('1', '2', '3', '4')):
+        if not self._check_channel(channels_):
+            return False
+        await self.send_batch(self._protection_event_commands(channels_))
+        return True
+
+    async def get_questionable_status(self, channels_=('1', '2', '3', '4')):
+        checked = self._check_channel(channels_)
+        if checked is None:
+            return False
+        replies = await self.send_batch([self.model.status_condition[i] for i in checked[0]])
+        return [parse_int(reply) for reply in replies]
+
+    async def reset_hmp4040(self):
+        async with self._locked():
+            self._selected_channel = None
+            self._arb_cache = {}
+            await self._exchange(['*RST'])
+
+    async def upload_arbitrary_sequence(self, channels_=('1', '2', '3', '4'), points=()):
+        checked = self._check_channel(channels_)
+        if checked is None:
+            return False
+        try:
+            data = format_arbitrary(points, self.model.voltage, self.model.current_limit(checked[1]))
+        except (TypeError, ValueError) as exc:
+            self._myprint('invalid ARB table: %s', exc)
+            return False
+        digest = arbitrary_digest(data)
+        uploaded = []
+        for i in channels_:
+            if self._arb_cache.get(str(i)) == digest:
+                continue
+            await self._on_channels([i], 'ARB:DATA ' + data, '*OPC?')
+            self._arb_cache[str(i)] = digest
+            uploaded.append(i)
+        return uploaded
+
+    async def _tripped_channels(self, channels_, cmd):
+        tripped = await self._for_each_channel(ch=channels_, cmd=cmd, parse=parse_bool)
+        if tripped is False:
+            return False
+        return [i for i, state in zip(channels_, tripped) if state]
+
+    async def get_overvoltage_channels_tripped(self, channels_=('1', '2', '3', '4')):
+        return await self._tripped_channels(channels_, 'VOLT:PROT:TRIP?')
+
+    async def get_fuse_channels_tripped(self, channels_=('1', '2', '3', '4')):
+        return await self._tripped_channels(channels_, 'FUSE:TRIP?')
+
+    async def _fuse_link_commands(self, source_channel, channels_, cmd):
+        if not (self._check_channel([source_channel]) and self._check_channel(channels_)):
+            return False
+        events = [(source_channel, cmd + ' ' + str(i)) for i in channels_ if source_channel != i]
+        if not events:
+            return []
+        async with self._locked():
+            return await self._exchange(self._event_commands(events))
+
+    async def set_link_fuse(self, source_channel, channels_=('1', '2', '3', '4')):
+        return await self._fuse_link_commands(source_channel, channels_, 'FUSE:LINK') is not False
+
+    async def get_link_fuse(self, source_channel, channels_=('1', '2', '3', '4')):
+        replies = await self._fuse_link_commands(source_channel, channels_, 'FUSE:LINK?')
+        return replies if replies is False else [parse_bool(reply) for reply in replies]
+
+    async def unlink_fuse(self, source_channel, channels_=('1', '2', '3', '4')):
+        return await self._fuse_link_commands(source_channel, channels_, 'FUSE:UNL') is not False
@@ -1,14 +1,91 @@
+import logging
+import re
 import socket
+import threading
 import time
+from contextlib import contextmanager
+
+from .arbitrary import arbitrary_digest, format_arbitrary
+from .cache import MISS, SETPOINTS, SetpointCache
+from .instrumentation import CommandStats, scpi_verb
+from .recording import RecordingTransport
+from .records import ChannelState, parse_bool, parse_error, parse_float, parse_int, parse_pair, parse_str
+from .transport import SocketTransport
+from .models import MODELS, model_from_idn
+from .validation import format_integer, format_number, mask_channels, normalize_channels
+
+_log = logging.getLogger(__name__)
+
+# Корни команд, которые заведомо не меняют выбранный канал
+_SCPI_HEADER = re.compile(r':?(\*(IDN|STB|ESR|ESE|SRE|OPC|CLS|WAI|TST|SAV)|VOLT(AGE)?|CURR(ENT)?|APPL(Y)?|MEAS(URE)?|'
+                          r'OUTP(UT)?|FUSE|ARB(ITRARY)?|SYST(EM)?|STAT(US)?)(?![A-Z*])|:?INST')
+
+# Команды, которые нельзя повторно отправить после обрыва связи: их повтор меняет результат (в том числе чтение
+# регистров событий, которое их очищает)
+_NOT_REPLAYABLE = re.compile(r'\s(UP|DOWN)\s*$|^:?(\*ESR|SYST(EM)?:ERR)|'
+                             r'^:?STAT(US)?:QUES[A-Z]*(:INST[A-Z]*(:ISUM[A-Z]*\d)?)?(:EVEN[A-Z]*)?\?', re.IGNORECASE)
+
+_SNAPSHOT_QUERIES = ('MEAS:VOLT?', 'MEAS:CURR?', 'OUTP?', 'VOLT:PROT:TRIP?', 'FUSE:TRIP?')
+
+# Биты регистра STAT:QUES:INST:ISUM<n> (срабатывание OVP и предохранителя канала), сводный бит STAT:QUES:INST в
+# регистре STAT:QUES и биты байта состояния *STB?: 3 - STAT:QUES, 5 - *ESR?
+STATUS_OVP = 1 << 9
+STATUS_FUSE = 1 << 10
+QUES_INSTRUMENT = 1 << 13
+STB_QUESTIONABLE = 1 << 3
+STB_EVENT_STATUS = 1 << 5
+
+
+def _selection_after(cmd, selected):
+    """
+    :param cmd: отправляемая команда (в том числе несколько команд через ';' или перевод строки)
+    :param selected: канал, выбранный до команды, или None
+    :return: канал, выбранный после команды: INST/INST:NSEL меняют его, *RST, *RCL и команды, которые не удалось
+    разобрать, делают его неизвестным (None)
+    """
+    for part in cmd.replace('\n', ';').split(';'):
+        header = part.lstrip()[:24].upper()
+        if not header:
+            continue
+        if not _SCPI_HEADER.match(header):
+            selected = None
+        elif header.lstrip(':').startswith('INST') and header.find('?') == -1:
+            value = header.split()[-1]
+            if value.startswith('OUT'):
+                value = value[3:]
+            selected = value if value.isdigit() else None
+    return selected
 
 
 class HMP4040(object):
-    def __init__(self, ip='192.168.101.4', port="5025"):
-        self.Debug = True
+    def __init__(self, ip='192.168.101.4', port="5025", connect_timeout=1.0, read_timeout=1.0):
+        self.Debug = False
+        self.stats = None
         self.IP = ip
         self.Port = port
-        self.client = socket.socket()
+        self.transport = SocketTransport(connect_timeout, read_timeout)
         self.connectionStatus = False
+        self._established = False
+        self.write_delay = 0.05
+        # Повторное подключение при обрыве связи: число попыток и экспоненциальная задержка между ними
+        self.auto_reconnect = True
+        self.reconnect_attempts = 3
+        self.backoff_base = 0.1
+        self.backoff_max = 2.0
+        self.cache_selection = True
+        self.setpoint_cache = None
+        self.model = MODELS['HMP4040']
+        # Содержимое ячеек памяти *SAV, сохраненных через InstrumentConfig.store: {ячейка: InstrumentConfig}.
+        # Ячейки, перезаписанные в обход store, нужно удалить отсюда вручную.
+        self.memory_slots = {}
+        # Блокировка обмена: выбор канала, команды и чтение ответов одного вызова не перемешиваются с другими
+        # потоками. Повторно входимая, поэтому внутри with hmp.lock можно вызывать любые методы драйвера.
+        self.lock = threading.RLock()
+        self._pipeline_depth = 0
+        self._pending = []
+        self._pending_selected = None
+        self._selected_channel = None
+        self._arb_cache = {}
         #if self.connect(ip, port):
             #self.connectionStatus = True
         #else:
@@ -28,6 +105,13 @@ class HMP4040(object):
     def get_port(self):
         return self.Port
 
+    @property
+    def client(self):
+        """
+        :return: сокет текущего соединения с ЛБП или None
+        """
+        return self.transport.sock
+
     def connect(self, ip='10.6.1.4', port="5025"):
         """
         Устанавливает соединение с ЛБП
@@ -37,18 +121,19 @@ class HMP4040(object):
         """
         self.IP = ip
         self.Port = port
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client.settimeout(1)
-        self._myprint("trying to connect to " + str(ip) + " : %d" % int(port))
+        self._selected_channel = None
+        self._arb_cache = {}
+        self._myprint("trying to connect to %s : %d", ip, int(port))
         try:
-            self.client.connect((ip, int(port)))
+            self.transport.connect(ip, port)
         except socket.error as exc:
-            self._myprint('Caught exception socket.error : %s' % exc)
+            self._myprint('Caught exception socket.error : %s', exc)
             self.connectionStatus = False
             return False
         else:
-            self._myprint('connected to server ' + ip + ':' + str(port))
+            self._myprint('connected to server %s:%s', ip, port)
             self.connectionStatus = True
+            self._established = True
             return True
 
     def reconnect(self):
@@ -56,125 +141,386 @@ class HMP4040(object):
         return self.connect(self.get_ip(), self.get_port())
 
     def disconnect(self):
-        self.client.close()
+        self._pending = []
+        self._selected_channel = None
+        self._arb_cache = {}
+        self.transport.close()
         self.connectionStatus = False
+        self._established = False
         self._myprint('disconnected')
 
-    def _myprint(self, text):
+    def _myprint(self, text, *args):
+        """
+        Пишет отладочное сообщение в журнал logging 'hmp4040.HMP4040' с уровнем DEBUG. Сообщение форматируется
+        только при включенном self.Debug и включенном уровне DEBUG.
+        """
         if self.Debug:
-            print(text)
+            _log.debug(text, *args)
+
+    def enable_stats(self, stats=None):
+        """
+        Включает учет команд, байтов и времени обмена с ЛБП
+        :param stats: объект CommandStats, например общий для нескольких ЛБП. По умолчанию создается новый.
+        :return: подключенный объект CommandStats
+        """
+        self.stats = stats if stats is not None else CommandStats()
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
+
+    def enable_setpoint_cache(self, ttl=None):
+        """
+        Включает кэш уставок: повторные get_voltage, get_current, get_overvoltage_protection_value, get_fuse_delay,
+        get_step_voltage и get_step_current отвечают без обмена с ЛБП, пока уставка не менялась. Значения
+        запоминаются при установке через этот объект и сбрасываются командами, после которых они неизвестны
+        (*RST, VOLT UP и т.п.). Если уставки меняются с передней панели или из другого соединения, используйте ttl
+        или invalidate_setpoints.
+        :param ttl: время жизни записи в секундах, None - без ограничения
+        :return: объект SetpointCache
+        """
+        self.setpoint_cache = SetpointCache(ttl)
+        return self.setpoint_cache
+
+    def disable_setpoint_cache(self):
+        self.setpoint_cache = None
+
+    def start_recording(self, path):
+        """
+        Начинает запись обмена с ЛБП (посылки, ответы, задержки, таймауты) в двоичный журнал. Журнал разбирается
+        python -m hmp4040.recording и воспроизводится через recording.ReplayTransport. Если соединение уже открыто,
+        драйвер забывает выбранный канал, таблицы ARB и кэш уставок, чтобы запись начиналась с того же состояния,
+        что и воспроизведение после connect.
+        :param path: путь к журналу; существующий журнал дописывается
+        :return: RecordingTransport
+        """
+        with self.lock:
+            if not isinstance(self.transport, RecordingTransport):
+                self.transport = RecordingTransport(self.transport, path)
+                if self.transport.connected:
+                    self._selected_channel = None
+                    self._arb_cache = {}
+                    if self.setpoint_cache is not None:
+                        self.setpoint_cache.clear()
+                    self.transport.begin_session()
+            return self.transport
+
+    def stop_recording(self):
+        with self.lock:
+            if isinstance(self.transport, RecordingTransport):
+                self.transport.close_log()
+                self.transport = self.transport.inner
+
+    def invalidate_setpoints(self, channels_=None):
+        """
+        :param channels_: список каналов, уставки которых нужно перечитать с ЛБП, по умолчанию все
+        """
+        if self.setpoint_cache is None:
+            return
+        if channels_ is None:
+            self.setpoint_cache.clear()
+        else:
+            for i in channels_:
+                self.setpoint_cache.clear(str(i))
 
-    def __check_voltage(self, voltage="1.0"):
+    def _check_voltage(self, voltage="1.0"):
         """
         Проверяет указанное напряжение на допустимость для данного блока питания
         :param voltage: напряжение на канал
-        :return: При корректно указанном напряжении возвращает истину, иначе ложь
-
+        :return: При корректно указанном напряжении возвращает его строкой для команды SCPI, иначе None
         """
+        return format_number(voltage, self.model.voltage, '%.3f')
 
-        try:
-            float(voltage)
-            if (float(voltage) >= 0) and (float(voltage) <= 30):
-                return True
-            else:
-                return False
-        except ValueError:
-            return False
-
-    def __check_current(self, current="0.1"):
+    def _check_current(self, current="0.1", channels_=None):
         """
         Проверяет указанную величину тока на допустимость для данного блока питания
         :param current: ток на канал
-        :return: При корректно указанном токе возвращает истину, иначе ложь
+        :param channels_: список каналов, на которые устанавливается ток (у некоторых моделей пределы тока каналов
+        различаются), None - проверка по наибольшему пределу модели
+        :return: При корректно указанном токе возвращает его строкой для команды SCPI, иначе None
         """
-        
-        try:
-            float(current)
-            if (float(current) >= 0) and (float(current) <= 10):
-                return True
-            else:
-                return False
-        except ValueError:
-            return False
+        mask = 0
+        if channels_ is not None:
+            checked = self._check_channel(channels_)
+            if checked is None:
+                return None
+            mask = checked[1]
+        return format_number(current, self.model.current_limit(mask), '%.4f')
 
-    def __check_channel(self, channels_=('1', '2', '3', '4')):
+    def _check_channel(self, channels_=('1', '2', '3', '4')):
         """
-        Проверяет передаваемый кортеж на наличие недопустимых значений и соответствие одному из четырех каналов
+        Проверяет передаваемый кортеж на наличие недопустимых значений и соответствие одному из каналов ЛБП
         :param channels_: передаваемый кортеж с номерами каналов
-        :return: в случае ошибки возвращает ложь; в случае успеха истину
+        :return: в случае ошибки возвращает None; в случае успеха пару (кортеж номеров каналов строками, маска
+        каналов), см. normalize_channels
         """
-        for i in channels_:
-            try:
-                int(i)
-                if not((int(i) >= 1) and (int(i) <= 4)):
-                    return False
-            except ValueError:
-                return False
-        return True
+        return normalize_channels(channels_, self.model.channels)
 
-    def __check_fuse_delay(self, delay=50):
-        try:
-            int(delay)
-            if (delay < 0) and (delay > 250):
-                return False
-        except ValueError:
-            return False
-        return True
+    def _check_fuse_delay(self, delay=50):
+        """
+        :param delay: задержка срабатывания предохранителя, мс
+        :return: задержка строкой для команды SCPI или None, если она вне допустимого диапазона
+        """
+        return format_integer(delay, self.model.fuse_delay)
+
+    def _check_memory_slot(self, slot=0):
+        """
+        :param slot: номер ячейки памяти настроек (*SAV/*RCL)
+        :return: номер строкой для команды SCPI или None, если он вне допустимого диапазона
+        """
+        return format_integer(slot, 9)
 
-    def __for_each_channel(self, *__check_functions, ch=('1', '2', '3', '4'), cmd=''):
+    def _for_each_channel(self, *__check_functions, ch=('1', '2', '3', '4'), cmd='', parse=parse_str):
         """
-        Универсальная функция служит для уменьшения количества кода. Производит проверку входящих данных на валидность и
-        в случае некорректных данных возвращает ложь. Если все данные корректны, то проверяет тип отправляемой команды.
-        Обычная команда возвращает истину, а команда запроса возвращает список данных со всех указанных каналов.
-        :param __check_functions: список функций проверки входящих данных
+        Универсальная функция служит для уменьшения количества кода. Проверяет список каналов и результаты проверки
+        остальных аргументов и в случае некорректных данных возвращает ложь. Если все данные корректны, то проверяет
+        тип отправляемой команды. Обычная команда отправляется один раз на каждый канал и возвращает истину, а
+        команда запроса отправляется одной посылкой на все каналы, уставки которых нет в кэше, и возвращает список
+        данных со всех указанных каналов.
+        :param __check_functions: результаты проверки аргументов (None или ложь - аргумент некорректен)
         :param ch: список каналов
         :param cmd: команда, отправляемая на выбранные каналы
+        :param parse: функция разбора ответа на запрос
         :return: В случае корректных входных данных возвращает истину, иначе ложь. Если команда запроса данных, то
-        взвращает список полученных данных
+        взвращает список разобранных ответов
 
         """
-        # Блок проверки входящих данных (начало)
-        for func in __check_functions:
-            if func:
-                continue
-            else:
-                return False
-        # Блок проверки входящих данных (конец)
+        checked = self._check_channel(ch)
+        if checked is None or not all(__check_functions):
+            return False
+        channels, mask = checked
 
         # Проверка типа команды. Для запроса данных возвращает список. Для обычной команды при корректных входных
         # возвращает истину.
         if cmd.find('?') != -1:
-            received_data = []
-            for i in ch:
-                self.send_command("INST OUT" + str(i))
-                received_data.append(self.send_command(cmd))
+            received_data = [self._cached(i, cmd) for i in channels]
+            missing = [i for i, value in zip(channels, received_data) if value is MISS]
+            if missing:
+                replies = iter(self._on_channels(missing, cmd))
+                received_data = [self._remember(i, cmd, parse(next(replies))) if value is MISS else value
+                                 for i, value in zip(channels, received_data)]
             return received_data
         elif cmd == '':
             return False
         else:
-            for i in ch:
-                self.send_command('INST OUT' + str(i))
-                self.send_command(cmd)
+            with self.pipeline():
+                for i in mask_channels(mask):
+                    self._select_channel(i)
+                    self.send_command(cmd)
             return True
 
     def send_command(self, cmd):
         """
         Отправляет команду на ЛБП. Если подразумевается, что должен придти ответ, то исполнение программы
-        приостанавливается до тех пор, пока ответ не будет получен.
+        приостанавливается до тех пор, пока ответ не будет получен. В конвейерном режиме (см. pipeline) обычные команды
+        накапливаются и уходят одной посылкой вместе со следующим запросом или при вызове flush.
         :param cmd: Команда для отправки в ЛБП
         :return: Если ожидается ответ, то возвращается строка с ответом, иначе ничего не возвращает
 
         """
-        self._myprint('client send: ' + cmd)
-        if cmd.find('?') != -1:
-            self.client.send((cmd + '\n').encode())
-            received_data = self.client.recv(1024).decode()
-            self._myprint("received: " + received_data)
-            return received_data
-        else:
-            self.client.send((cmd + '\n').encode())
-            time.sleep(0.05)
+        with self.lock:
+            self._myprint('client send: %s', cmd)
+            self._queue(cmd)
+            if cmd.find('?') != -1:
+                received_data = self._send_pending()[-1]
+                self._myprint("received: %r", received_data)
+                return received_data
+            elif self._pipeline_depth:
+                return None
+            else:
+                self._send_pending()
+                time.sleep(self.write_delay)
+                return None
+
+    def _query(self, cmd, parse=parse_str):
+        """
+        Отправляет запрос и разбирает ответ
+        :param cmd: запрос
+        :param parse: функция разбора ответа
+        :return: разобранный ответ
+        """
+        value = self._cached(self._selected_channel, cmd)
+        if value is MISS:
+            value = self._remember(self._selected_channel, cmd, parse(self.send_command(cmd)))
+        return value
+
+    def _cached(self, channel, cmd):
+        """
+        :return: значение уставки из кэша для запроса cmd на канале channel или MISS
+        """
+        if self.setpoint_cache is None or channel is None:
+            return MISS
+        header = cmd[:-1]
+        if header not in SETPOINTS and header != 'APPL':
+            return MISS
+        return self.setpoint_cache.get(channel, header)
+
+    def _remember(self, channel, cmd, value):
+        if self.setpoint_cache is not None and channel is not None:
+            header = cmd[:-1]
+            if header in SETPOINTS or header == 'APPL':
+                self.setpoint_cache.put(channel, header, value)
+        return value
+
+    def send_batch(self, cmds):
+        """
+        Отправляет список команд одной посылкой и читает ответы на все запросы из списка
+        :param cmds: список команд, в том числе запросов
+        :return: список ответов на запросы в порядке их следования в cmds
+        """
+        if not cmds:
+            return []
+        with self.lock:
+            for cmd in cmds:
+                self._myprint('client send: %s', cmd)
+                self._queue(cmd)
+            received_data = self._send_pending()
+        self._myprint("received: %r", received_data)
+        return received_data
+
+    def _on_channels(self, channels_, *cmds):
+        """
+        Выполняет cmds на каждом из каналов одной посылкой. Выбор каналов вычисляется и отправляется под блокировкой,
+        поэтому другой поток не может сменить канал между ними.
+        :param channels_: список каналов
+        :param cmds: команды, выполняемые на каждом канале
+        :return: список ответов на запросы
+        """
+        with self.lock:
+            return self.send_batch(self._channel_commands(channels_, *cmds))
+
+    def _track_state(self, cmd):
+        """
+        Отслеживает состояние ЛБП по отправляемым командам: выбранный канал и загруженные таблицы ARB. Команды
+        INST/INST:NSEL запоминают канал, ARB:DATA и ARB:CLEAR сбрасывают кэш таблицы выбранного канала, команды
+        установки обновляют кэш уставок (если он включен), а *RST, *RCL и любые команды, которые не удалось разобрать,
+        сбрасывают все запомненное.
+        :param cmd: отправляемая команда
+        """
+        for part in cmd.replace('\n', ';').split(';'):
+            header = part.lstrip()[:24].upper()
+            if not header:
+                continue
+            if not _SCPI_HEADER.match(header):
+                self._selected_channel = None
+                self._arb_cache = {}
+                if self.setpoint_cache is not None:
+                    self.setpoint_cache.clear()
+            elif header.lstrip(':').startswith('ARB'):
+                if header.find('?') != -1 or (header.find('DATA') == -1 and header.find('CLE') == -1):
+                    continue
+                if self._selected_channel is None:
+                    self._arb_cache = {}
+                else:
+                    self._arb_cache.pop(self._selected_channel, None)
+            elif header.lstrip(':').startswith('INST'):
+                self._selected_channel = _selection_after(part, self._selected_channel)
+            elif self.setpoint_cache is not None:
+                self.setpoint_cache.track(self._selected_channel, part)
+
+    def _select_channel(self, channel):
+        """
+        Выбирает канал командой INST OUTn, если он еще не выбран
+        :param channel: номер канала
+        """
+        if not self.cache_selection or str(channel) != self._selected_channel:
+            channel = str(channel)
+            self.send_command(self.model.select.get(channel) or 'INST OUT' + channel)
+
+    def _queue(self, cmd):
+        """
+        Ставит команду в очередь следующей посылки и учитывает ее в отслеживаемом состоянии ЛБП
+        :param cmd: команда
+        """
+        if not self._pending:
+            self._pending_selected = self._selected_channel
+        self._track_state(cmd)
+        self._pending.append(cmd)
+
+    def _send_pending(self):
+        """
+        Отправляет накопленные команды одной посылкой. При обрыве связи переподключается с экспоненциально растущей
+        задержкой и повторяет посылку, если в ней нет команд, повтор которых меняет результат (VOLT UP, *ESR?,
+        SYST:ERR? и т.п.). Перед повтором восстанавливается выбор канала, действовавший до посылки. Переподключение
+        выполняется, только если соединение было установлено методом connect и с тех пор не закрыто disconnect.
+        :return: список ответов на запросы посылки
+        """
+        cmds, self._pending = self._pending, []
+        selected = self._pending_selected
+        attempt = 0
+        while True:
+            try:
+                return self._exchange(cmds)
+            except socket.timeout:
+                raise
+            except OSError as exc:
+                attempt += 1
+                if not self.auto_reconnect or not self._established or attempt > self.reconnect_attempts or \
+                        any(_NOT_REPLAYABLE.search(cmd) for cmd in cmds):
+                    self.connectionStatus = False
+                    if self.setpoint_cache is not None:
+                        self.setpoint_cache.clear()
+                    raise
+                self._myprint('connection lost (%s), reconnect attempt %d', exc, attempt)
+                time.sleep(min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+                if self.connect(self.IP, self.Port):
+                    if selected is not None and not cmds[0].lstrip(':').upper().startswith('INST'):
+                        cmds = [self.model.select.get(selected) or 'INST OUT' + selected] + cmds
+                    for cmd in cmds:
+                        self._track_state(cmd)
+
+    def _exchange(self, cmds):
+        """
+        Отправляет команды одной посылкой и читает ответы на все запросы из нее
+        :param cmds: список команд
+        :return: список ответов на запросы
+        """
+        transport = self.transport
+        if transport.stale:
+            transport.discard_stale()
+        start = time.perf_counter()
+        data = ('\n'.join(cmds) + '\n').encode()
+        transport.send(data)
+        received_data = [transport.read_line() for cmd in cmds if cmd.find('?') != -1]
+        if self.stats is not None:
+            self.stats.record_sent(cmds, len(data))
+            if received_data:
+                self.stats.record_received(sum(map(len, received_data)))
+                verb = scpi_verb(cmds[-1]) if len(received_data) == 1 else 'BATCH'
+                self.stats.record_exchange(verb, time.perf_counter() - start)
+        return received_data
+
+    @contextmanager
+    def pipeline(self, sync_cmd='*OPC?'):
+        """
+        Конвейерный режим: обычные команды внутри блока with не отправляются по одной с задержкой write_delay, а
+        склеиваются через перевод строки и уходят одной посылкой. При выходе из внешнего блока выполняется
+        синхронизация командой sync_cmd. При исключении внутри блока накопленные команды отбрасываются.
+        :param sync_cmd: запрос синхронизации ('*OPC?' или 'SYST:ERR?')
+        """
+        with self.lock:
+            self._pipeline_depth += 1
+            try:
+                yield self
+            except BaseException:
+                if self._pipeline_depth == 1:
+                    self._pending = []
+                    self._selected_channel = None
+                raise
+            finally:
+                self._pipeline_depth -= 1
+            if not self._pipeline_depth:
+                self.flush(sync_cmd)
+
+    def flush(self, sync_cmd='*OPC?'):
+        """
+        Отправляет накопленные в конвейере команды одной посылкой и дожидается ответа на запрос синхронизации
+        :param sync_cmd: запрос синхронизации ('*OPC?' или 'SYST:ERR?')
+        :return: ответ на запрос синхронизации или None, если отправлять было нечего
+        """
+        if not self._pending:
             return None
+        return self.send_command(sync_cmd)
 
     def set_voltage(self, channels_=('1', '2', '3', '4'), voltage="0.0"):
         """
@@ -183,8 +529,8 @@ class HMP4040(object):
         :param voltage: уровень напряжения для выбранных каналов
         :return: При отсутствии ошибок возвращает истину. При указании недопустимого канала возвращает ложь
         """
-        return self.__for_each_channel((self.__check_channel(channels_), self.__check_voltage(voltage)),
-                                       ch=channels_, cmd="VOLT " + str(voltage))
+        voltage = self._check_voltage(voltage)
+        return self._for_each_channel(voltage, ch=channels_, cmd='VOLT %s' % voltage)
 
     def get_voltage(self, channels_=('1', '2', '3', '4')):
         """
@@ -193,7 +539,7 @@ class HMP4040(object):
         :return: В случае корректных аргументов возвращает кортеж значений напряжений для каждого указанного канала,
         иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd="VOLT?")
+        return self._for_each_channel(ch=channels_, cmd="VOLT?", parse=parse_float)
             
     def set_current(self, channels_=('1', '2', '3', '4'), current="0.1"):
         """
@@ -202,8 +548,8 @@ class HMP4040(object):
         :param current: величина тока
         :return: истина при вводе корректных данных, иначе ложь
         """
-        return self.__for_each_channel((self.__check_channel(channels_), self.__check_current(current)),
-                                       ch=channels_, cmd="CURR " + str(current))
+        current = self._check_current(current, channels_)
+        return self._for_each_channel(current, ch=channels_, cmd='CURR %s' % current)
 
     def get_current(self, channels_=('1', '2', '3', '4')):
         """
@@ -212,13 +558,49 @@ class HMP4040(object):
         :return: В случае корректных аргументов возвращает кортеж значений тока для каждого указанного канала,
         иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd="CURR?")
+        return self._for_each_channel(ch=channels_, cmd="CURR?", parse=parse_float)
 
     def get_status_byte(self):
-        return self.send_command('*STB?')
+        return self._query('*STB?', parse_int)
 
     def get_event_status(self):
-        return self.send_command('*ESR?')
+        return self._query('*ESR?', parse_int)
+
+    def enable_protection_events(self, channels_=('1', '2', '3', '4')):
+        """
+        Настраивает регистры STAT:QUES так, чтобы срабатывание и сброс OVP и предохранителя на указанных каналах
+        выставляли бит 3 байта состояния *STB?. Выбор канала не требуется: регистр ISUM<n> адресуется номером.
+        :param channels_: список каналов
+        :return: В случае корректных аргументов возвращает истину, иначе ложь
+        """
+        if not self._check_channel(channels_):
+            return False
+        self.send_batch(self._protection_event_commands(channels_))
+        return True
+
+    @staticmethod
+    def _protection_event_commands(channels_):
+        bits = STATUS_OVP | STATUS_FUSE
+        cmds = []
+        for i in channels_:
+            cmds.extend(('STAT:QUES:INST:ISUM%s:PTR %d' % (i, bits), 'STAT:QUES:INST:ISUM%s:NTR %d' % (i, bits),
+                         'STAT:QUES:INST:ISUM%s:ENAB %d' % (i, bits)))
+        cmds.append('STAT:QUES:INST:ENAB %d' % sum(1 << int(i) for i in channels_))
+        cmds.append('STAT:QUES:ENAB %d' % QUES_INSTRUMENT)
+        return cmds
+
+    def get_questionable_status(self, channels_=('1', '2', '3', '4')):
+        """
+        Читает регистры условий STAT:QUES:INST:ISUM<n>:COND? указанных каналов одной посылкой
+        :param channels_: список каналов
+        :return: В случае корректных аргументов возвращает список значений регистров (биты STATUS_OVP и
+        STATUS_FUSE), иначе ложь
+        """
+        checked = self._check_channel(channels_)
+        if checked is None:
+            return False
+        condition = self.model.status_condition
+        return [parse_int(reply) for reply in self.send_batch([condition[i] for i in checked[0]])]
 
     def check_sound(self):
         self.send_command('SYST:BEEP')
@@ -227,26 +609,37 @@ class HMP4040(object):
         """
         :return: возвращает номер версии SCPI
         """
-        return self.send_command('SYST:VERS?')
+        return self._query('SYST:VERS?')
 
     def get_errors(self):
         """
-        :return: возврощает код ошибки 0 - нет ошибок; -100 - ошибка команды;
+        :return: возврощает SCPIErrorRecord(код, текст), где код 0 - нет ошибок; -100 - ошибка команды;
                  -102 - синтаксическая ошибка; -350 - переполнение очереди
         """
-        return self.send_command('SYST:ERR?')
+        return self._query('SYST:ERR?', parse_error)
 
     def get_identification_info(self):
         """
         :return: возвращает тип устройства, серийный номер и номер прошивки
         """
-        return self.send_command('*IDN?')
+        return self._query('*IDN?')
+
+    def detect_model(self):
+        """
+        Определяет модель ЛБП серии HMP по ответу *IDN? и настраивает под нее число каналов, пределы уставок и
+        команды выбора каналов
+        :return: HMPModel или None, если модель не известна (тогда настройки не меняются)
+        """
+        model = model_from_idn(self.get_identification_info())
+        if model is not None:
+            self.model = model
+        return model
 
     def get_last_channel(self):
         """
         :return: возвращает номер активного канала в виде строки "OUTx", где х - номер канала
         """
-        return self.send_command('INST?')
+        return self._query('INST?')
 
     def set_step_voltage(self, step_="1.0"):  # Переделать для списка каналов
         """
@@ -254,8 +647,9 @@ class HMP4040(object):
         :param step_: шаг напряжения
         :return: При корректных аргументах возвращает истину, иначе ложь
         """
-        if self.__check_voltage(step_):
-            self.send_command('VOLT:STEP ' + str(step_))
+        step_ = self._check_voltage(step_)
+        if step_:
+            self.send_command('VOLT:STEP ' + step_)
             return True
         else:
             return False
@@ -264,7 +658,7 @@ class HMP4040(object):
         """
         :return: Возвращает величину шага напряжения.
         """
-        return self.send_command('VOLT:STEP?')
+        return self._query('VOLT:STEP?', parse_float)
 
     def voltage_up(self, channels_=('1', '2', '3', '4')):
         """
@@ -273,7 +667,7 @@ class HMP4040(object):
         :param channels_: каналы, на которых будет изменять напряжение
         :return: Возвращает истину при корректных аргументах, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='VOLT UP')
+        return self._for_each_channel(ch=channels_, cmd='VOLT UP')
 
     def voltage_down(self, channels_=('1', '2', '3', '4')):
         """
@@ -281,7 +675,7 @@ class HMP4040(object):
         :param channels_: Каналы, на которых уменьшится напряжение
         :return: Возвращает истину при корректных аргументах, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='VOLT DOWN')
+        return self._for_each_channel(ch=channels_, cmd='VOLT DOWN')
 
     def set_step_current(self, step="0.1"):
         """
@@ -290,8 +684,9 @@ class HMP4040(object):
         :param step: значение шага тока.
         :return: При корректных аргументах возвращает истину, иначе ложь.
         """
-        if self.__check_current(step):
-            self.send_command('CURR:STEP ' + str(step))
+        step = self._check_current(step)
+        if step:
+            self.send_command('CURR:STEP ' + step)
             return True
         else:
             return False
@@ -300,14 +695,14 @@ class HMP4040(object):
         """
         :return: Возвращает текущее значение шага тока
         """
-        return self.send_command('CURR:STEP?')
+        return self._query('CURR:STEP?', parse_float)
 
     def current_up(self, channels_=('1', '2', '3', '4')):
         """
         Увеличивает величину тока тока на выбранных каналах
         :return: В случае корректных аргументов возвращает истину, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='CURR UP')
+        return self._for_each_channel(ch=channels_, cmd='CURR UP')
 
     def current_down(self, channels_=('1', '2', '3', '4')):
         """
@@ -315,7 +710,7 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: В случае корректных аргументов возвращает истину, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='CURR DOWN')
+        return self._for_each_channel(ch=channels_, cmd='CURR DOWN')
 
     def set_channel_params(self, channels_=('1', '2', '3', '4'), voltage="1.0", current="1.0"):
         """
@@ -326,21 +721,21 @@ class HMP4040(object):
         :return: В случае корректных аргументов возвращает истину, иначе ложь
 
         """
-        return self.__for_each_channel(
-            (self.__check_channel(channels_), self.__check_voltage(voltage), self.__check_current(current)),
-            ch=channels_, cmd='APPL ' + str(voltage) + ',' + str(current))
+        voltage = self._check_voltage(voltage)
+        current = self._check_current(current, channels_)
+        return self._for_each_channel(voltage, current, ch=channels_, cmd='APPL %s,%s' % (voltage, current))
 
     def get_channel_params(self, channels_=('1', '2', '3', '4')):
         """
         Возвращает текущие значения напряжения и тока для списка выбранных каналов
         :param channels_: список каналов
-        :return: В случае корректных аргументов возвращает список, содержащий данные напряжения и тока
+        :return: В случае корректных аргументов возвращает список кортежей (напряжение, ток)
         для каждого указанного канала, иначе возвращает ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='APPL?')
+        return self._for_each_channel(ch=channels_, cmd='APPL?', parse=parse_pair)
 
     def is_output_turned_on(self):
-        return self.send_command('OUTP:GEN?')
+        return self._query('OUTP:GEN?', parse_bool)
 
     def turn_on_selected_channels(self):
         """
@@ -362,7 +757,7 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: В случае корректных аргументов возвращает истину, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='OUTP:SEL 1')
+        return self._for_each_channel(ch=channels_, cmd='OUTP:SEL 1')
 
     def select_off_channel(self, channels_=('1', '2', '3', '4')):
         """
@@ -370,15 +765,15 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: В случае корректных аргументов возвращает истину, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='OUTP:SEL 0')
+        return self._for_each_channel(ch=channels_, cmd='OUTP:SEL 0')
 
     def get_active_channel(self, channels_=('1', '2', '3', '4')):
         """
-        Возвращает список элементов, где 1 - канал включен, 0 - выключен
+        Возвращает список элементов, где истина - канал включен, ложь - выключен
         :param channels_: список каналов
         :return: В случае корректных аргументов возвращает истину, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), cmd='OUTP?')
+        return self._for_each_channel(ch=channels_, cmd='OUTP?', parse=parse_bool)
 
     def set_overvoltage_protection_value(self, channels_=('1', '2', '3', '4'), max_voltage="10.0"):
         """
@@ -387,15 +782,15 @@ class HMP4040(object):
         :param max_voltage: уровень срабатывания предохранителя
         :return: В случае корректных аргументов возвращает истину, иначе ложь
         """
-        return self.__for_each_channel((self.__check_channel(channels_), self.__check_voltage(max_voltage)),
-                                       ch=channels_, cmd='VOLT:PROT ' + str(max_voltage))
+        max_voltage = self._check_voltage(max_voltage)
+        return self._for_each_channel(max_voltage, ch=channels_, cmd='VOLT:PROT %s' % max_voltage)
 
     def get_overvoltage_protection_value(self, channels_=('1', '2', '3', '4')):
         """
         :param channels_: список каналов
         :return: Возвращает список значений уровня срабатывания защиты по напряжению для каждого канала
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='VOLT:PROT?')
+        return self._for_each_channel(ch=channels_, cmd='VOLT:PROT?', parse=parse_float)
 
     def clear_overvoltage_protection(self, channels_=('1', '2', '3', '4')):
         """
@@ -404,7 +799,7 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: В случае корректных аргументов возвращает список, хранящий значения состояния каналов. Иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='VOLT:PROT:CLE')
+        return self._for_each_channel(ch=channels_, cmd='VOLT:PROT:CLE')
 
     def get_overvoltage_channels_tripped(self, channels_=('1', '2', '3', '4')):
         """
@@ -412,15 +807,10 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: При корректных данных возвращает список, содержащий состояния защиты от перенапряжения каналов.
         """
-        tripped_channels = []
-        if self.__check_channel(channels_):
-            for i in channels_:
-                self.send_command('INST OUT' + str(i))
-                if int(self.send_command('VOLT:PROT:TRIP?')):
-                    tripped_channels.append(i)
-            return tripped_channels
-        else:
+        tripped = self._for_each_channel(ch=channels_, cmd='VOLT:PROT:TRIP?', parse=parse_bool)
+        if tripped is False:
             return False
+        return [i for i, state in zip(channels_, tripped) if state]
 
     def is_overvoltege_channel_tripped(self, channels_=('1', '2', '3', '4')):
         """
@@ -428,7 +818,7 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: При корректных данных возвращает список, содержащий состояния защиты от перенапряжения каналов.
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='VOLT:PROT:TRIP?')
+        return self._for_each_channel(ch=channels_, cmd='VOLT:PROT:TRIP?', parse=parse_bool)
 
     def meas_overvoltage_protection(self, channels_=('1', '2', '3', '4')):
         """
@@ -439,14 +829,14 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: При корректных данных возвращает список, содержащий состояния защиты от перенапряжения каналов.
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='VOLT:PROT:MODE MEAS')
+        return self._for_each_channel(ch=channels_, cmd='VOLT:PROT:MODE MEAS')
 
     def is_overvoltage_protection_active(self, channels_=('1', '2', '3', '4')):
         """
         :param channels_: список каналов
-        :return: Возвращает режим работы предохранителя для указанных каналов
+        :return: Возвращает режим работы защиты от перенапряжения ('MEAS' или 'PROT') для указанных каналов
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='VOLT:PROT:MODE MEAS?')
+        return self._for_each_channel(ch=channels_, cmd='VOLT:PROT:MODE?')
 
     def measure_voltage(self, channels_=('1', '2', '3', '4')):
         """
@@ -454,9 +844,65 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: список напряжений на каждом канале
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='MEAS:VOLT?')
+        return self._for_each_channel(ch=channels_, cmd='MEAS:VOLT?', parse=parse_float)
+
+    def snapshot(self, channels_=('1', '2', '3', '4')):
+        """
+        Опрашивает измеренные напряжение и ток, состояние выхода и срабатывание защит OVP и предохранителя на всех
+        указанных каналах за одну посылку
+        :param channels_: список каналов
+        :return: В случае корректных аргументов возвращает список ChannelState для каждого канала, иначе ложь
+        """
+        if not self._check_channel(channels_):
+            return False
+        return self._parse_snapshot(channels_, self._on_channels(channels_, *_SNAPSHOT_QUERIES))
+
+    def _channel_commands(self, channels_, *cmds):
+        """
+        Собирает список команд, выполняющий cmds на каждом из каналов. Выбор канала добавляется только там, где он
+        меняется.
+        :param channels_: список каналов
+        :param cmds: команды, выполняемые на каждом канале
+        :return: список команд для send_batch
+        """
+        return self._event_commands([(i, cmd) for i in channels_ for cmd in cmds])
+
+    def _event_commands(self, events, selected=MISS):
+        """
+        Собирает список команд из пар (канал, команда), добавляя выбор канала только там, где он меняется
+        :param events: список пар (канал или None для команд без канала, команда); команда без канала может сама
+        сменить выбор (INST OUTn) или сделать его неизвестным (*RST, *RCL)
+        :param selected: канал, выбранный перед посылкой; по умолчанию выбранный в драйвере, None - неизвестен
+        :return: список команд для send_batch
+        """
+        batch = []
+        select = self.model.select
+        if selected is MISS:
+            selected = self._selected_channel
+        for channel, cmd in events:
+            if channel is not None:
+                channel = str(channel)
+                if not self.cache_selection or channel != selected:
+                    selected = channel
+                    batch.append(select.get(channel) or 'INST OUT' + channel)
+            else:
+                selected = _selection_after(cmd, selected)
+            batch.append(cmd)
+        return batch
+
+    @staticmethod
+    def _parse_snapshot(channels_, replies):
+        states = []
+        for n, i in enumerate(channels_):
+            voltage, current, output, ovp, fuse = replies[n * 5:n * 5 + 5]
+            states.append(ChannelState(int(i), float(voltage), float(current), parse_bool(output), parse_bool(ovp),
+                                       parse_bool(fuse)))
+        return states
 
     def reset_hmp4040(self):
+        self._selected_channel = None
+        self._arb_cache = {}
+        self.invalidate_setpoints()
         return self.send_command("*RST")
 
     def measure_current(self, channels_=('1', '2', '3', '4')):
@@ -465,7 +911,7 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: список значений токов на каждом канале
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='MEAS:CURR?')
+        return self._for_each_channel(ch=channels_, cmd='MEAS:CURR?', parse=parse_float)
 
     def set_fuse_delay(self, channels_=('1', '2', '3', '4'), delay_=10):
         """
@@ -474,15 +920,15 @@ class HMP4040(object):
         :param delay_: время задержки в миллисекундах
         :return: При корректных данных возвращает список, содержащий состояния защиты от перенапряжения каналов.
         """
-        return self.__for_each_channel((self.__check_channel(channels_), self.__check_fuse_delay(delay_)),
-                                       ch=channels_, cmd='FUSE:DEL ' + str(delay_))
+        delay_ = self._check_fuse_delay(delay_)
+        return self._for_each_channel(delay_, ch=channels_, cmd='FUSE:DEL %s' % delay_)
 
     def get_fuse_delay(self, channels_=('1', '2', '3', '4')):
         """
         :param channels_: список каналов
         :return: Возвращает список, содержащий время задержки для каждого из указанных каналов
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='FUSE:DEL?')
+        return self._for_each_channel(ch=channels_, cmd='FUSE:DEL?', parse=parse_int)
 
     def set_link_fuse(self, source_channel, channels_=('1', '2', '3', '4')):
         """
@@ -492,11 +938,12 @@ class HMP4040(object):
         :param channels_: список каналов, которые связывают с каналом-источником
         :return: При корректных данных возвращает список, содержащий состояния защиты от перенапряжения каналов.
         """
-        if self.__check_channel([source_channel]) and self.__check_channel(channels_):
-            self.send_command('INST OUT' + str(source_channel))
-            for i in channels_:
-                if source_channel != i:
-                    self.send_command('FUSE:LINK ' + str(i))
+        if self._check_channel([source_channel]) and self._check_channel(channels_):
+            with self.pipeline():
+                self._select_channel(source_channel)
+                for i in channels_:
+                    if source_channel != i:
+                        self.send_command('FUSE:LINK ' + str(i))
             return True
         else:
             return False
@@ -505,15 +952,13 @@ class HMP4040(object):
         """
         :param source_channel: канал-источник
         :param channels_: список каналов
-        :return: Взвращает список привязанных каналов к каналу-источнику. Если входные данные некорректны, то ложь
+        :return: Взвращает список признаков привязки каждого канала к каналу-источнику. Если входные данные
+        некорректны, то ложь
         """
-        if self.__check_channel([source_channel]) and self.__check_channel(channels_):
-            self.send_command('INST OUT' + str(source_channel))
-            linked_chennels = []
-            for i in channels_:
-                if source_channel != i:
-                    linked_chennels.append(self.send_command('FUSE:LINK? ' + str(i)))
-            return linked_chennels
+        if self._check_channel([source_channel]) and self._check_channel(channels_):
+            events = [(source_channel, 'FUSE:LINK? ' + str(i)) for i in channels_ if source_channel != i]
+            with self.lock:
+                return [parse_bool(reply) for reply in self.send_batch(self._event_commands(events))]
         else:
             return False
 
@@ -524,11 +969,12 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: При корректных данных возвращает истину, иначе ложь
         """
-        if self.__check_channel([source_channel]) and self.__check_channel(channels_):
-            self.send_command('INST OUT' + str(source_channel))
-            for i in channels_:
-                if source_channel != i:
-                    self.send_command('FUSE:UNL ' + str(i))
+        if self._check_channel([source_channel]) and self._check_channel(channels_):
+            with self.pipeline():
+                self._select_channel(source_channel)
+                for i in channels_:
+                    if source_channel != i:
+                        self.send_command('FUSE:UNL ' + str(i))
             return True
         else:
             return False
@@ -539,15 +985,10 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: При корректных данных возвращает список, содержащий состояния защиты по току каналов.
         """
-        tripped_channels = []
-        if self.__check_channel(channels_):
-            for i in channels_:
-                self.send_command('INST OUT' + str(i))
-                if int(self.send_command('FUSE:TRIP?')):
-                    tripped_channels.append(i)
-            return tripped_channels
-        else:
+        tripped = self._for_each_channel(ch=channels_, cmd='FUSE:TRIP?', parse=parse_bool)
+        if tripped is False:
             return False
+        return [i for i, state in zip(channels_, tripped) if state]
 
     def set_on_fuse_channels(self, channels_=('1', '2', '3', '4')):
         """
@@ -555,7 +996,7 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: При корректных данных возвращает истину, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='FUSE 1')
+        return self._for_each_channel(ch=channels_, cmd='FUSE 1')
 
     def set_off_fuse_channels(self, channels_=('1', '2', '3', '4')):
         """
@@ -563,61 +1004,54 @@ class HMP4040(object):
         :param channels_: список каналов
         :return: При корректных данных возвращает истину, иначе ложь
         """
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='FUSE 0')
+        return self._for_each_channel(ch=channels_, cmd='FUSE 0')
 
     def clear_arbitrary_data(self, channels_=('1', '2', '3', '4')):
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='ARB:CLEAR 1')
+        return self._for_each_channel(ch=channels_, cmd='ARB:CLEAR 1')
 
     def set_arbitrary_sequence(self, channels_=('1', '2', '3', '4'), sequence=""):
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='ARB:DATA ' + str(sequence))
+        return self._for_each_channel(ch=channels_, cmd='ARB:DATA ' + str(sequence))
+
+    def upload_arbitrary_sequence(self, channels_=('1', '2', '3', '4'), points=()):
+        """
+        Загружает таблицу ARB на выбранные каналы. Точки проверяются на допустимость и форматируются один раз для
+        всех каналов, загрузка на каждый канал идет одной посылкой с синхронизацией *OPC?, чтобы не переполнить
+        входной буфер ЛБП. Если такая же таблица уже загружена на канал этим объектом, повторно она не отправляется.
+        :param channels_: список каналов
+        :param points: numpy.ndarray формы (N, 3) или последовательность троек (напряжение, ток, время удержания, с)
+        :return: список каналов, на которые таблица действительно была отправлена, или ложь при некорректных данных
+        """
+        checked = self._check_channel(channels_)
+        if checked is None:
+            return False
+        try:
+            data = format_arbitrary(points, self.model.voltage, self.model.current_limit(checked[1]))
+        except (TypeError, ValueError) as exc:
+            self._myprint('invalid ARB table: %s', exc)
+            return False
+        digest = arbitrary_digest(data)
+        uploaded = []
+        for i in channels_:
+            if self._arb_cache.get(str(i)) == digest:
+                continue
+            self._on_channels([i], 'ARB:DATA ' + data, '*OPC?')
+            self._arb_cache[str(i)] = digest
+            uploaded.append(i)
+        return uploaded
 
     def set_arbitrary_sequence_repeat(self, channels_=('1', '2', '3', '4'), repeat="1"):
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='ARB:REP ' + str(repeat))
+        return self._for_each_channel(ch=channels_, cmd='ARB:REP ' + str(repeat))
 
     def start_arbitrary_sequence(self, channels_=('1', '2', '3', '4')):
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='ARB:STAR 1')
+        return self._for_each_channel(ch=channels_, cmd='ARB:STAR 1')
 
     def stop_arbitrary_sequence(self, channels_=('1', '2', '3', '4')):
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='ARB:STOP 1')
+        return self._for_each_channel(ch=channels_, cmd='ARB:STOP 1')
 
     def transfer_arbitrary(self, channels_=('1', '2', '3', '4')):
-        return self.__for_each_channel(self.__check_channel(channels_), ch=channels_, cmd='ARB:TRAN 1')
+        return self._for_each_channel(ch=channels_, cmd='ARB:TRAN 1')
 
 if __name__ == "__main__":
-    LBS = HMP4040()
-    print(LBS)
-    if LBS.connect(ip="10.6.1.4", port='5025'):
-        #LBS.check_sound()
-        LBS.get_version()
-        print(LBS.get_identification_info())
-        LBS.get_errors()
-        print(LBS.get_status_byte())
-
-        channels = ['1', '2', '3', '4']
-        # LBS.set_voltage(channels, 3.1)
-       #  LBS.set_current(channels, 1.5)
-       #  LBS.turn_off_selected_channels()
-       #  LBS.select_off_channel(channels)
-        # LBS.select_on_channel(channels)
-        # LBS.turn_on_selected_channels()
-        # print(LBS.set_overvoltage_protection_value(['1', '2', '3'], 5.1))
-        # LBS.meas_overvoltage_protection(['1'])
-        # LBS.set_voltage(['1', '3'], 5.3)
-       #  LBS.is_overvoltage_protection_active(['1'])
-       #  print(LBS.get_overvoltage_channels_tripped(channels))
-        # LBS.clear_overvoltage_protection(channels)
-        # LBS.voltage_up(channels)
-        # LBS.set_on_fuse_channels(channels)
-        # LBS.set_link_fuse(1, channels)
-        # LBS.set_link_fuse(2, ['3', '4'])
-        # print(LBS.get_link_fuse(1))
-        # print(LBS.get_link_fuse(2))
-        # LBS.set_off_fuse_channels(channels)
-        # print(LBS.get_active_channel(channels))
-        # LBS.currentDown()
-        while True:
-            req = input('enter some text: ')
-            if req == 'exit':
-                break
-            LBS.send_command(req)
-        LBS.disconnect()
+    import sys
+    from .script import main
+    sys.exit(main())
@@ -0,0 +1,107 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+
+from .HMP4040 import HMP4040
+
+# Результат операции на одном ЛБП: значение либо исключение, помешавшее его получить
+DeviceResult = namedtuple('DeviceResult', ['value', 'error'])
+
+
+class HMP4040Fleet(object):
+    """
+    Группа ЛБП, над которыми одна и та же операция выполняется параллельно в пуле потоков. Каждый ЛБП обслуживается
+    не более чем одним потоком одновременно, поэтому сами объекты HMP4040 не требуют блокировок. Любой метод HMP4040
+    можно вызвать у группы: fleet.measure_voltage(['1']) вернет словарь {"ip:port": DeviceResult}.
+    """
+    def __init__(self, addresses=(), timeout=5, max_workers=None):
+        """
+        :param addresses: список пар (ip, port)
+        :param timeout: время ожидания ответа от каждого ЛБП по умолчанию, в секундах
+        :param max_workers: размер пула потоков, по умолчанию по потоку на каждый ЛБП, добавленный до первого вызова
+        """
+        self.timeout = timeout
+        self.devices = {}
+        for ip, port in addresses:
+            self.add(ip, port)
+        self.max_workers = max_workers
+        self._executor = None
+        self._busy = {}
+
+    def __str__(self):
+        return "HMP4040 fleet: " + ', '.join(self.devices)
+
+    def __repr__(self):
+        return str(self)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def add(self, ip, port="5025"):
+        """
+        Добавляет ЛБП в группу. Соединение устанавливается методом connect.
+        :return: ключ ЛБП вида "ip:port"
+        """
+        key = str(ip) + ':' + str(port)
+        self.devices[key] = HMP4040(ip, port)
+        return key
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers or max(len(self.devices), 1))
+        return self._executor
+
+    def run(self, operation, *args, timeout=None, **kwargs):
+        """
+        Параллельно выполняет операцию на всех ЛБП группы
+        :param operation: имя метода HMP4040 или функция, принимающая объект HMP4040 первым аргументом
+        :param timeout: время ожидания в секундах, по умолчанию self.timeout
+        :return: словарь {"ip:port": DeviceResult}. ЛБП, не успевший ответить или еще занятый предыдущей
+        операцией, получает DeviceResult(None, TimeoutError)
+        """
+        if timeout is None:
+            timeout = self.timeout
+        futures = {}
+        results = {}
+        for key, device in self.devices.items():
+            busy = self._busy.get(key)
+            if busy is not None and not busy.done():
+                results[key] = DeviceResult(None, TimeoutError(key + ' is still busy with a previous operation'))
+                continue
+            if isinstance(operation, str):
+                future = self._get_executor().submit(getattr(device, operation), *args, **kwargs)
+            else:
+                future = self._get_executor().submit(operation, device, *args, **kwargs)
+            futures[key] = self._busy[key] = future
+        wait(futures.values(), timeout)
+        for key, future in futures.items():
+            if not future.done():
+                results[key] = DeviceResult(None, TimeoutError(key + ' did not answer in %s s' % timeout))
+            elif future.exception() is not None:
+                results[key] = DeviceResult(None, future.exception())
+            else:
+                results[key] = DeviceResult(future.result(), None)
+        return {key: results[key] for key in self.devices}
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(HMP4040, name, None)):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.run(name, *args, **kwargs)
+
+    def connect(self, timeout=None):
+        """
+        Подключается ко всем ЛБП группы по адресам, указанным при добавлении
+        :return: словарь {"ip:port": DeviceResult}, значение которого истинно при успешном подключении
+        """
+        return self.run(lambda device: device.connect(device.get_ip(), device.get_port()), timeout=timeout)
+
+    def disconnect(self, timeout=None):
+        return self.run('disconnect', timeout=timeout)
+
+    def close(self):
+        """
+        Отключается от всех ЛБП и останавливает пул потоков
+        """
+        self.disconnect()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
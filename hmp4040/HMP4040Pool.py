@@ -0,0 +1,109 @@
+import threading
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+
+from .HMP4040 import HMP4040
+
+
+class _PooledHMP4040(HMP4040):
+    """
+    Соединение пула. Выбранный канал - общее состояние прибора для всех соединений, поэтому соединение не кэширует
+    его, а посылки с выбором канала выполняются под общей блокировкой пула и заканчиваются запросом: блокировка
+    снимается только после того, как прибор выполнил всю посылку, и другое соединение не может сменить канал
+    посреди нее.
+    """
+    def __init__(self, channel_lock, ip, port, connect_timeout, read_timeout):
+        super().__init__(ip, port, connect_timeout, read_timeout)
+        self.cache_selection = False
+        self.channel_lock = channel_lock
+
+    def _exchange(self, cmds):
+        if not any(cmd.lstrip(':').upper().startswith('INST') for cmd in cmds):
+            return super()._exchange(cmds)
+        if cmds[-1].find('?') != -1:
+            with self.channel_lock:
+                return super()._exchange(cmds)
+        with self.channel_lock:
+            return super()._exchange(cmds + ['*OPC?'])[:-1]
+
+
+class HMP4040Pool(object):
+    """
+    Небольшой пул соединений с одним ЛБП, чтобы опрос и управление из разных потоков не ждали друг друга.
+    Посылки без выбора канала (*STB?, SYST:ERR?, OUTP:GEN, STAT:QUES и т.п.) идут по соединениям параллельно.
+    Выбранный канал - общее состояние прибора, поэтому посылки с INST OUTn выполняются по очереди: каждая под общей
+    блокировкой пула до ответа прибора на ее последний запрос.
+    """
+    def __init__(self, ip='10.6.1.4', port="5025", size=2, connect_timeout=1.0, read_timeout=1.0):
+        """
+        :param ip: адрес ЛБП
+        :param port: порт ЛБП
+        :param size: максимальное число одновременно открытых соединений
+        :param connect_timeout: таймаут установки соединения, в секундах
+        :param read_timeout: таймаут ожидания ответа, в секундах
+        """
+        self.IP = ip
+        self.Port = port
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._all = []
+        self._lock = threading.Lock()
+        self._channel_lock = threading.Lock()
+
+    def __str__(self):
+        return "HMP4040 pool %s:%s, %d connections" % (self.IP, self.Port, len(self._all))
+
+    def __repr__(self):
+        return str(self)
+
+    def _open(self):
+        hmp = _PooledHMP4040(self._channel_lock, self.IP, self.Port, self.connect_timeout, self.read_timeout)
+        if not hmp.connect(self.IP, self.Port):
+            raise ConnectionError('cannot connect to HMP4040 at %s:%s' % (self.IP, self.Port))
+        with self._lock:
+            self._all.append(hmp)
+        return hmp
+
+    def acquire(self, timeout=None):
+        """
+        Выдает свободное соединение, при необходимости открывая новое
+        :param timeout: время ожидания свободного соединения, в секундах
+        :return: объект HMP4040
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError('no free HMP4040 connection in pool')
+        try:
+            try:
+                hmp = self._idle.get_nowait()
+            except Empty:
+                return self._open()
+            if not hmp.connectionStatus and not hmp.reconnect():
+                raise ConnectionError('cannot reconnect to HMP4040 at %s:%s' % (self.IP, self.Port))
+            return hmp
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, hmp):
+        self._idle.put(hmp)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        with pool.connection() as hmp: hmp.measure_voltage()
+        """
+        hmp = self.acquire(timeout)
+        try:
+            yield hmp
+        finally:
+            self.release(hmp)
+
+    def close(self):
+        with self._lock:
+            connections, self._all = self._all, []
+        for hmp in connections:
+            hmp.disconnect()
@@ -0,0 +1,539 @@
+import random
+import socket
+import socketserver
+import threading
+import time
+
+# Полные формы узлов SCPI, которые приводятся к коротким
+_LONG_NODES = {
+    'INSTRUMENT': 'INST', 'SELECT': 'SEL', 'VOLTAGE': 'VOLT', 'CURRENT': 'CURR', 'APPLY': 'APPL', 'MEASURE': 'MEAS',
+    'OUTPUT': 'OUTP', 'GENERAL': 'GEN', 'STATE': 'STAT', 'PROTECTION': 'PROT', 'CLEAR': 'CLE', 'LEVEL': 'LEV',
+    'AMPLITUDE': 'AMPL', 'IMMEDIATE': 'IMM', 'SCALAR': 'SCAL', 'SYSTEM': 'SYST', 'ERROR': 'ERR', 'VERSION': 'VERS',
+    'ARBITRARY': 'ARB', 'REPETITIONS': 'REP', 'START': 'STAR', 'TRANSFER': 'TRAN', 'DELAY': 'DEL',
+    'UNLINK': 'UNL', 'STATUS': 'STAT', 'QUESTIONABLE': 'QUES', 'CONDITION': 'COND', 'EVENT': 'EVEN',
+    'ENABLE': 'ENAB', 'ISUMMARY': 'ISUM', 'OPERATION': 'OPER', 'NSELECT': 'NSEL',
+}
+# Необязательные узлы, которые опускаются при разборе
+_DEFAULT_NODES = ('LEV', 'AMPL', 'IMM', 'SCAL', 'DC', 'STAT')
+
+_ERRORS = {
+    -100: 'Command error',
+    -102: 'Syntax error',
+    -113: 'Undefined header',
+    -222: 'Data out of range',
+    -350: 'Queue overflow',
+}
+
+MAX_VOLTAGE = 32.05
+MAX_CURRENT = 10.0
+
+# Биты регистра STAT:QUES:INST:ISUM<n> и сводные биты регистров STAT:QUES и *STB
+ISUM_OVP = 1 << 9
+ISUM_FUSE = 1 << 10
+QUES_INST = 1 << 13
+STB_QUES = 1 << 3
+
+
+class SCPIError(Exception):
+    def __init__(self, code):
+        super().__init__(code, _ERRORS.get(code, 'Error'))
+        self.code = code
+
+
+class _Channel(object):
+    def __init__(self):
+        self.reset()
+        # Регистр ISUM не сбрасывается по *RST, как и остальные регистры состояния SCPI
+        self.isum_cond = 0
+        self.isum_event = 0
+        self.isum_enable = 0
+        self.isum_ptr = 0x7FFF
+        self.isum_ntr = 0
+
+    def status(self):
+        return (ISUM_OVP if self.ovp_tripped else 0) | (ISUM_FUSE if self.fuse_tripped else 0)
+
+    def reset(self):
+        self.voltage = 0.0
+        self.current = 0.1
+        self.volt_step = 1.0
+        self.curr_step = 0.1
+        self.selected = False
+        self.ovp = MAX_VOLTAGE
+        self.ovp_mode = 'PROT'
+        self.ovp_tripped = False
+        self.fuse = False
+        self.fuse_delay = 0
+        self.fuse_tripped = False
+        self.links = set()
+        self.arb_data = ''
+        self.arb_repeat = 0
+        self.arb_running = False
+        self.load = 100.0
+        self.lead = 0.0
+
+    def settings(self):
+        return (self.voltage, self.current, self.selected, self.ovp, self.ovp_mode, self.fuse, self.fuse_delay,
+                set(self.links))
+
+    def restore(self, settings):
+        (self.voltage, self.current, self.selected, self.ovp, self.ovp_mode, self.fuse, self.fuse_delay,
+         links) = settings
+        self.links = set(links)
+
+
+class HMP4040Simulator(object):
+    """
+    Имитатор ЛБП HMP4040 на локальном TCP-сокете для отладки и замеров без реального прибора. Поддерживает то
+    подмножество SCPI, которое использует HMP4040: INST, VOLT, CURR, APPL, MEAS, OUTP, VOLT:PROT, FUSE, ARB, *IDN?,
+    *STB?, *ESR?, *OPC?, *RST, *SAV/*RCL, SYST:ERR? и регистры STAT:QUES. Состояние общее для всех соединений, как у реального прибора.
+    Нагрузка каждого канала моделируется резистором _Channel.load, подключенным проводами сопротивлением
+    _Channel.lead; напряжение измеряется на нагрузке. При токе выше уставки канал переходит в режим стабилизации тока.
+    """
+    def __init__(self, host='127.0.0.1', port=0, channels=4, model='HMP4040', latency=0.0, fragment=0,
+                 fragment_delay=0.0, drop_rate=0.0, error_rate=0.0, seed=None):
+        """
+        :param host: адрес, на котором слушает имитатор
+        :param port: порт, 0 - выбрать свободный
+        :param channels: число каналов
+        :param model: название модели в ответе *IDN?
+        :param latency: задержка перед каждым ответом, в секундах
+        :param fragment: если больше нуля, ответы отправляются кусками не длиннее fragment байт
+        :param fragment_delay: пауза между кусками ответа, в секундах
+        :param drop_rate: вероятность потерять ответ на запрос
+        :param error_rate: вероятность отклонить команду с ошибкой -100
+        :param seed: зерно генератора случайных чисел для воспроизводимого внесения ошибок
+        """
+        self.host = host
+        self.port = port
+        self.model = model
+        self.latency = latency
+        self.fragment = fragment
+        self.fragment_delay = fragment_delay
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.received = 0
+        self.channels = [_Channel() for _ in range(channels)]
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+        self._memory = {}
+        self.inst_event = self.inst_enable = self.inst_cond = 0
+        self.ques_event = self.ques_enable = self.ques_cond = 0
+        self.reset()
+
+    def __str__(self):
+        return "HMP4040 simulator at %s:%s" % self.address
+
+    def __repr__(self):
+        return str(self)
+
+    @property
+    def address(self):
+        if self._server is not None:
+            return self._server.server_address[:2]
+        return self.host, self.port
+
+    def reset(self):
+        with self._lock:
+            for channel in self.channels:
+                channel.reset()
+            self.selected = 1
+            self.output = False
+            self.errors = []
+            self.esr = 0
+
+    def start(self):
+        """
+        Запускает имитатор в фоновом потоке
+        :return: пара (адрес, порт), на которых слушает имитатор
+        """
+        simulator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                simulator._serve(self.request)
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='HMP4040Simulator', daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _serve(self, client):
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        buffer = bytearray()
+        while True:
+            try:
+                chunk = client.recv(65536)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+            end = buffer.find(b'\n')
+            while end != -1:
+                line = buffer[:end].decode(errors='replace').strip()
+                del buffer[:end + 1]
+                reply = self.execute(line)
+                if reply is not None:
+                    try:
+                        self._reply(client, reply)
+                    except OSError:
+                        return
+                end = buffer.find(b'\n')
+
+    def _reply(self, client, reply):
+        if self.drop_rate and self._random.random() < self.drop_rate:
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        data = (reply + '\n').encode()
+        if self.fragment <= 0:
+            client.sendall(data)
+            return
+        for start in range(0, len(data), self.fragment):
+            client.sendall(data[start:start + self.fragment])
+            if self.fragment_delay:
+                time.sleep(self.fragment_delay)
+
+    def execute(self, line):
+        """
+        Выполняет одну строку команд, разделенных ';'
+        :param line: строка команд
+        :return: строка ответа на запросы или None, если запросов в строке не было
+        """
+        replies = []
+        with self._lock:
+            for cmd in line.split(';'):
+                cmd = cmd.strip()
+                if not cmd:
+                    continue
+                self.received += 1
+                try:
+                    if self.error_rate and self._random.random() < self.error_rate:
+                        raise SCPIError(-100)
+                    reply = self._execute(cmd)
+                except SCPIError as exc:
+                    self._push_error(exc.code)
+                    continue
+                if reply is not None:
+                    replies.append(reply)
+                self._update()
+        return ';'.join(replies) if replies else None
+
+    def _push_error(self, code):
+        if len(self.errors) >= 10:
+            self.errors[-1] = -350
+        else:
+            self.errors.append(code)
+        # Биты ESR: 5 - ошибка команды, 4 - ошибка выполнения
+        self.esr |= 16 if code == -222 else 32
+
+    @staticmethod
+    def _parse(cmd):
+        parts = cmd.split(None, 1)
+        header = parts[0].upper().lstrip(':')
+        args = [a.strip() for a in parts[1].split(',')] if len(parts) > 1 else []
+        query = header.endswith('?')
+        nodes = [_LONG_NODES.get(node, node) for node in header.rstrip('?').split(':')]
+        nodes = [nodes[0]] + [node for node in nodes[1:] if node not in _DEFAULT_NODES]
+        return ':'.join(nodes), query, args
+
+    @staticmethod
+    def _number(args, low, high, step=None, current=None):
+        if not args:
+            raise SCPIError(-102)
+        value = args[0].upper()
+        if value in ('MIN', 'MINIMUM'):
+            return low
+        if value in ('MAX', 'MAXIMUM'):
+            return high
+        if step is not None and value == 'UP':
+            return min(current + step, high)
+        if step is not None and value == 'DOWN':
+            return max(current - step, low)
+        try:
+            number = float(value)
+        except ValueError:
+            raise SCPIError(-102)
+        if not low <= number <= high:
+            raise SCPIError(-222)
+        return number
+
+    def _channel_number(self, args):
+        value = args[0].upper() if args else ''
+        if value.startswith('OUT'):
+            value = value[3:].lstrip('P')
+        if not value.isdigit() or not 1 <= int(value) <= len(self.channels):
+            raise SCPIError(-222)
+        return int(value)
+
+    @staticmethod
+    def _flag(args):
+        value = args[0].upper() if args else ''
+        if value in ('1', 'ON'):
+            return True
+        if value in ('0', 'OFF'):
+            return False
+        raise SCPIError(-102)
+
+    def _measure(self, channel):
+        """
+        :return: измеренные на нагрузке напряжение и ток канала с учетом падения на проводах и режима стабилизации
+        тока
+        """
+        if not (self.output and channel.selected):
+            return 0.0, 0.0
+        current = min(channel.voltage / (channel.load + channel.lead), channel.current)
+        return current * channel.load, current
+
+    def _update(self):
+        for number, channel in enumerate(self.channels, 1):
+            if not (self.output and channel.selected):
+                continue
+            voltage, current = self._measure(channel)
+            level = voltage if channel.ovp_mode == 'MEAS' else channel.voltage
+            if level > channel.ovp:
+                channel.ovp_tripped = True
+                channel.selected = False
+            elif channel.fuse and current >= channel.current and voltage < channel.voltage:
+                channel.fuse_tripped = True
+                channel.selected = False
+                for linked in channel.links:
+                    self.channels[linked - 1].selected = False
+        self._update_status()
+
+    def _update_status(self):
+        """
+        Обновляет регистры состояния: события ISUM<n> фиксируются по переходам условия через фильтры PTR/NTR,
+        события STAT:QUES:INST и STAT:QUES - по появлению разрешенных событий на уровне ниже
+        """
+        inst_cond = 0
+        for number, channel in enumerate(self.channels, 1):
+            cond = channel.status()
+            channel.isum_event |= (cond & ~channel.isum_cond & channel.isum_ptr) | \
+                                  (~cond & channel.isum_cond & channel.isum_ntr)
+            channel.isum_cond = cond
+            if channel.isum_event & channel.isum_enable:
+                inst_cond |= 1 << number
+        self.inst_event |= inst_cond & ~self.inst_cond
+        self.inst_cond = inst_cond
+        ques_cond = QUES_INST if self.inst_event & self.inst_enable else 0
+        self.ques_event |= ques_cond & ~self.ques_cond
+        self.ques_cond = ques_cond
+
+    def _status(self, header, query, args):
+        """
+        Команды STAT:QUES[:INST[:ISUM<n>]][:EVEN|:COND|:ENAB|:PTR|:NTR]
+        """
+        nodes = header.split(':')[2:]
+        owner = None
+        if nodes and nodes[0] == 'INST':
+            nodes = nodes[1:]
+            owner = 'INST'
+            if nodes and nodes[0].startswith('ISUM'):
+                owner = self.channels[self._channel_number([nodes[0][4:]]) - 1]
+                nodes = nodes[1:]
+        register = nodes[0] if nodes else 'EVEN'
+        if owner is None:
+            names = {'EVEN': 'ques_event', 'COND': 'ques_cond', 'ENAB': 'ques_enable'}
+        elif owner == 'INST':
+            names = {'EVEN': 'inst_event', 'COND': 'inst_cond', 'ENAB': 'inst_enable'}
+        else:
+            names = {'EVEN': 'isum_event', 'COND': 'isum_cond', 'ENAB': 'isum_enable', 'PTR': 'isum_ptr',
+                     'NTR': 'isum_ntr'}
+        if len(nodes) > 1 or register not in names:
+            raise SCPIError(-113)
+        target = self if owner in (None, 'INST') else owner
+        if query:
+            value = getattr(target, names[register])
+            if register == 'EVEN':
+                setattr(target, names[register], 0)
+            return str(value)
+        if register in ('EVEN', 'COND'):
+            raise SCPIError(-100)
+        setattr(target, names[register], int(self._number(args, 0, 0x7FFF)))
+        return None
+
+    def _execute(self, cmd):
+        header, query, args = self._parse(cmd)
+        channel = self.channels[self.selected - 1]
+        if header == '*IDN':
+            return 'ROHDE&SCHWARZ,%s,000000000,HW50020001/SW2.51' % self.model
+        if header == '*OPC':
+            return '1' if query else None
+        if header == '*STB':
+            return str((4 if self.errors else 0) | (STB_QUES if self.ques_event & self.ques_enable else 0) |
+                       (32 if self.esr else 0))
+        if header == '*ESR':
+            esr, self.esr = self.esr, 0
+            return str(esr)
+        if header == '*CLS':
+            self.errors = []
+            self.esr = 0
+            self.inst_event = self.ques_event = 0
+            for c in self.channels:
+                c.isum_event = 0
+            return None
+        if header == '*RST':
+            self.reset()
+            return None
+        if header in ('*WAI', '*TST'):
+            return '0' if query else None
+        if header == '*SAV':
+            self._memory[int(self._number(args, 0, 9))] = [c.settings() for c in self.channels]
+            return None
+        if header == '*RCL':
+            slot = int(self._number(args, 0, 9))
+            if slot not in self._memory:
+                raise SCPIError(-222)
+            for c, settings in zip(self.channels, self._memory[slot]):
+                c.restore(settings)
+            return None
+        if header == 'SYST:ERR':
+            if not self.errors:
+                return '0,"No error"'
+            code = self.errors.pop(0)
+            return '%d,"%s"' % (code, _ERRORS.get(code, 'Error'))
+        if header == 'SYST:VERS':
+            return '1999.0'
+        if header in ('SYST:BEEP', 'SYST:REM', 'SYST:LOC', 'SYST:MIX', 'SYST:RWL'):
+            return None
+        if header in ('INST', 'INST:SEL', 'INST:NSEL'):
+            if query:
+                return str(self.selected) if header == 'INST:NSEL' else 'OUT%d' % self.selected
+            self.selected = self._channel_number(args)
+            return None
+        if header == 'VOLT':
+            if query:
+                return '%.3f' % channel.voltage
+            channel.voltage = self._number(args, 0, MAX_VOLTAGE, channel.volt_step, channel.voltage)
+            return None
+        if header == 'VOLT:STEP':
+            if query:
+                return '%.3f' % channel.volt_step
+            channel.volt_step = self._number(args, 0, MAX_VOLTAGE)
+            return None
+        if header == 'CURR':
+            if query:
+                return '%.4f' % channel.current
+            channel.current = self._number(args, 0, MAX_CURRENT, channel.curr_step, channel.current)
+            return None
+        if header == 'CURR:STEP':
+            if query:
+                return '%.4f' % channel.curr_step
+            channel.curr_step = self._number(args, 0, MAX_CURRENT)
+            return None
+        if header == 'APPL':
+            if query:
+                return '%.3f,%.4f' % (channel.voltage, channel.current)
+            if len(args) != 2:
+                raise SCPIError(-102)
+            voltage = self._number(args[:1], 0, MAX_VOLTAGE)
+            channel.current = self._number(args[1:], 0, MAX_CURRENT)
+            channel.voltage = voltage
+            return None
+        if header == 'MEAS:VOLT':
+            return '%.4f' % self._measure(channel)[0]
+        if header == 'MEAS:CURR':
+            return '%.4f' % self._measure(channel)[1]
+        if header in ('OUTP', 'OUTP:SEL'):
+            if query:
+                return '1' if channel.selected else '0'
+            channel.selected = self._flag(args)
+            if channel.selected:
+                channel.ovp_tripped = False
+                channel.fuse_tripped = False
+            return None
+        if header == 'OUTP:GEN':
+            if query:
+                return '1' if self.output else '0'
+            self.output = self._flag(args)
+            return None
+        if header == 'VOLT:PROT':
+            if query:
+                return '%.3f' % channel.ovp
+            channel.ovp = self._number(args, 0, MAX_VOLTAGE)
+            return None
+        if header == 'VOLT:PROT:CLE':
+            channel.ovp_tripped = False
+            return None
+        if header == 'VOLT:PROT:TRIP':
+            return '1' if channel.ovp_tripped else '0'
+        if header == 'VOLT:PROT:MODE':
+            if query:
+                return channel.ovp_mode
+            mode = args[0].upper() if args else ''
+            if mode not in ('MEAS', 'PROT'):
+                raise SCPIError(-102)
+            channel.ovp_mode = mode
+            return None
+        if header == 'FUSE':
+            if query:
+                return '1' if channel.fuse else '0'
+            channel.fuse = self._flag(args)
+            return None
+        if header == 'FUSE:DEL':
+            if query:
+                return str(channel.fuse_delay)
+            channel.fuse_delay = int(self._number(args, 0, 250))
+            return None
+        if header == 'FUSE:LINK':
+            number = self._channel_number(args)
+            if query:
+                return '1' if number in channel.links else '0'
+            channel.links.add(number)
+            return None
+        if header == 'FUSE:UNL':
+            channel.links.discard(self._channel_number(args))
+            return None
+        if header == 'FUSE:TRIP':
+            return '1' if channel.fuse_tripped else '0'
+        if header == 'ARB:DATA':
+            if query:
+                return channel.arb_data
+            channel.arb_data = ','.join(args)
+            return None
+        if header in ('ARB:CLEAR', 'ARB:CLE'):
+            channel.arb_data = ''
+            return None
+        if header == 'ARB:REP':
+            if query:
+                return str(channel.arb_repeat)
+            channel.arb_repeat = int(self._number(args, 0, 255))
+            return None
+        if header in ('ARB:STAR', 'ARB:STOP', 'ARB:TRAN'):
+            channel = self.channels[self._channel_number(args) - 1] if args else channel
+            channel.arb_running = header == 'ARB:STAR'
+            return None
+        if header.startswith('STAT:QUES'):
+            return self._status(header, query, args)
+        raise SCPIError(-113)
+
+
+if __name__ == "__main__":
+    simulator = HMP4040Simulator(port=5025)
+    print(simulator.start())
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -0,0 +1,352 @@
+import json
+
+from .cache import MISS
+from .records import ConfigReport, parse_bool, parse_float, parse_int, parse_str
+
+# Поля настройки канала, которые читаются одним запросом: (поле, запрос, функция разбора)
+_QUERIES = (
+    ('voltage', 'VOLT?', parse_float),
+    ('current', 'CURR?', parse_float),
+    ('ovp', 'VOLT:PROT?', parse_float),
+    ('ovp_mode', 'VOLT:PROT:MODE?', parse_str),
+    ('fuse', 'FUSE?', parse_bool),
+    ('fuse_delay', 'FUSE:DEL?', parse_int),
+    ('output', 'OUTP?', parse_bool),
+)
+
+
+class ChannelConfig(object):
+    """
+    Желаемые настройки одного канала. Поле со значением None не задано: оно не читается, не сравнивается и не
+    отправляется. fuse_links - номера каналов, связанных с предохранителем этого канала (FUSE:LINK).
+    """
+    FIELDS = ('voltage', 'current', 'ovp', 'ovp_mode', 'fuse', 'fuse_delay', 'fuse_links', 'output')
+
+    def __init__(self, voltage=None, current=None, ovp=None, ovp_mode=None, fuse=None, fuse_delay=None,
+                 fuse_links=None, output=None):
+        self.voltage = voltage
+        self.current = current
+        self.ovp = ovp
+        self.ovp_mode = ovp_mode.upper() if ovp_mode is not None else None
+        self.fuse = fuse
+        self.fuse_delay = fuse_delay
+        self.fuse_links = tuple(sorted(str(i) for i in fuse_links)) if fuse_links is not None else None
+        self.output = output
+
+    def __str__(self):
+        return "ChannelConfig(%s)" % ', '.join('%s=%r' % item for item in self.to_dict().items())
+
+    def __repr__(self):
+        return str(self)
+
+    def __eq__(self, other):
+        return isinstance(other, ChannelConfig) and self.to_dict() == other.to_dict()
+
+    def to_dict(self):
+        """
+        :return: словарь заданных полей
+        """
+        return {name: list(value) if name == 'fuse_links' else value
+                for name, value in ((name, getattr(self, name)) for name in self.FIELDS) if value is not None}
+
+    def without(self, *names):
+        """
+        :return: копия настроек без указанных полей
+        """
+        data = self.to_dict()
+        for name in names:
+            data.pop(name, None)
+        return ChannelConfig(**data)
+
+
+class InstrumentConfig(object):
+    """
+    Желаемое состояние всего ЛБП: настройки каналов (ChannelConfig) и общий выход OUTP:GEN. apply читает текущее
+    состояние заданных полей одной посылкой и отправляет одной посылкой только отличающиеся настройки. Если в
+    памяти прибора есть ячейка *SAV, из которой состояние получается меньшим числом команд, сначала выполняется
+    *RCL, а затем досылается разница. Конфигурация сохраняется в файл JSON (dump/load).
+    """
+    def __init__(self, channels=None, output=None):
+        """
+        :param channels: словарь {канал: ChannelConfig или словарь полей}
+        :param output: состояние общего выхода OUTP:GEN, None - не задано
+        """
+        self.channels = {}
+        for i, config in (channels or {}).items():
+            self.channels[str(i)] = config if isinstance(config, ChannelConfig) else ChannelConfig(**config)
+        self.output = output
+
+    def __str__(self):
+        return "InstrumentConfig(%s, output=%r)" % (self.channels, self.output)
+
+    def __repr__(self):
+        return str(self)
+
+    def __eq__(self, other):
+        return isinstance(other, InstrumentConfig) and self.to_dict() == other.to_dict()
+
+    def channel(self, i):
+        """
+        :return: ChannelConfig канала, созданный при первом обращении
+        """
+        return self.channels.setdefault(str(i), ChannelConfig())
+
+    def to_dict(self):
+        data = {'channels': {i: config.to_dict() for i, config in sorted(self.channels.items())}}
+        if self.output is not None:
+            data['output'] = self.output
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('channels'), data.get('output'))
+
+    def dump(self, path):
+        """
+        Сохраняет конфигурацию в файл JSON
+        :param path: путь к файлу
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: путь к файлу, записанному dump
+        :return: InstrumentConfig
+        """
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def read(cls, hmp, channels_=None, fields=ChannelConfig.FIELDS, output=True):
+        """
+        Читает состояние ЛБП одной посылкой. Уставки, которые есть в кэше уставок драйвера, не запрашиваются.
+        :param hmp: подключенный объект HMP4040
+        :param channels_: список каналов, по умолчанию все каналы модели
+        :param fields: читаемые поля каналов из ChannelConfig.FIELDS
+        :param output: читать ли состояние общего выхода
+        :return: InstrumentConfig или ложь, если список каналов некорректен
+        """
+        if channels_ is None:
+            channels_ = tuple(hmp.model.select)
+        checked = hmp._check_channel(channels_)
+        if checked is None:
+            return False
+        wanted = {i: fields for i in checked[0]}
+        return cls._read(hmp, wanted, output)
+
+    @classmethod
+    def _read(cls, hmp, wanted, output):
+        """
+        :param wanted: словарь {канал: читаемые поля}
+        :param output: читать ли состояние общего выхода
+        """
+        numbers = tuple(hmp.model.select)
+        values = {i: {} for i in wanted}
+        events = []
+        parsers = []
+        for i, fields in wanted.items():
+            for name, cmd, parse in _QUERIES:
+                if name not in fields:
+                    continue
+                value = hmp._cached(i, cmd)
+                if value is not MISS:
+                    values[i][name] = value
+                    continue
+                events.append((i, cmd))
+                parsers.append((i, name, cmd, parse))
+            if 'fuse_links' in fields:
+                for n in numbers:
+                    if n != i:
+                        events.append((i, 'FUSE:LINK? ' + n))
+                        parsers.append((i, 'fuse_links', n, parse_bool))
+        if output:
+            events.append((None, 'OUTP:GEN?'))
+            parsers.append((None, 'output', None, parse_bool))
+        general = None
+        if events:
+            with hmp.lock:
+                replies = hmp.send_batch(hmp._event_commands(events))
+            for (i, name, cmd, parse), reply in zip(parsers, replies):
+                value = parse(reply)
+                if i is None:
+                    general = value
+                elif name == 'fuse_links':
+                    if value:
+                        values[i].setdefault('fuse_links', []).append(cmd)
+                    else:
+                        values[i].setdefault('fuse_links', [])
+                else:
+                    values[i][name] = hmp._remember(i, cmd, value)
+        return cls({i: ChannelConfig(**fields) for i, fields in values.items()}, general)
+
+    def diff(self, hmp, current):
+        """
+        Команды перехода из состояния current в это состояние. Сначала отключаются выходы, которые должны быть
+        выключены, затем меняются уставки (порог OVP поднимается до напряжения и опускается после него, напряжение и
+        ток вместе задаются одной командой APPL), в конце включаются выходы. Поле, неизвестное в current, отправляется
+        всегда.
+        :param hmp: объект HMP4040, по модели которого проверяются значения
+        :param current: InstrumentConfig с текущим состоянием
+        :return: список событий (канал или None, команда) или None, если значение какого-либо поля недопустимо
+        """
+        off = []
+        settings = []
+        on = []
+        if self.output is False and current.output is not False:
+            off.append((None, 'OUTP:GEN 0'))
+        for i, target in sorted(self.channels.items()):
+            if hmp._check_channel([i]) is None:
+                return None
+            now = current.channels.get(i) or ChannelConfig()
+            if target.output is not None and target.output != now.output:
+                (on if target.output else off).append((i, 'OUTP:SEL %d' % target.output))
+            cmds = self._channel_diff(hmp, i, target, now)
+            if cmds is None:
+                return None
+            settings.extend((i, cmd) for cmd in cmds)
+        if self.output and current.output is not True:
+            on.append((None, 'OUTP:GEN 1'))
+        return off + settings + on
+
+    @staticmethod
+    def _channel_diff(hmp, i, target, now):
+        """
+        :return: список команд канала i или None, если значение какого-либо поля недопустимо
+        """
+        checks = (
+            ('voltage', hmp._check_voltage),
+            ('current', lambda value: hmp._check_current(value, [i])),
+            ('ovp', hmp._check_voltage),
+            ('fuse_delay', hmp._check_fuse_delay),
+        )
+        changed = {}
+        for name, check in checks:
+            value = getattr(target, name)
+            if value is None:
+                continue
+            formatted = check(value)
+            if formatted is None:
+                return None
+            previous = getattr(now, name)
+            if previous is None or check(previous) != formatted:
+                changed[name] = formatted
+        cmds = []
+        ovp = changed.pop('ovp', None)
+        raise_ovp = ovp is not None and (now.ovp is None or float(ovp) > now.ovp)
+        if raise_ovp:
+            cmds.append('VOLT:PROT ' + ovp)
+        if 'voltage' in changed and 'current' in changed:
+            cmds.append('APPL %s,%s' % (changed['voltage'], changed['current']))
+        elif 'voltage' in changed:
+            cmds.append('VOLT ' + changed['voltage'])
+        elif 'current' in changed:
+            cmds.append('CURR ' + changed['current'])
+        if ovp is not None and not raise_ovp:
+            cmds.append('VOLT:PROT ' + ovp)
+        if target.ovp_mode is not None and target.ovp_mode != now.ovp_mode:
+            if target.ovp_mode not in ('MEAS', 'PROT'):
+                return None
+            cmds.append('VOLT:PROT:MODE ' + target.ovp_mode)
+        if 'fuse_delay' in changed:
+            cmds.append('FUSE:DEL ' + changed['fuse_delay'])
+        if target.fuse is not None and target.fuse != now.fuse:
+            cmds.append('FUSE %d' % target.fuse)
+        if target.fuse_links is not None:
+            if hmp._check_channel(target.fuse_links) is None or i in target.fuse_links:
+                return None
+            linked = set(now.fuse_links) if now.fuse_links is not None else None
+            for n in tuple(hmp.model.select):
+                if n == i:
+                    continue
+                if n in target.fuse_links and (linked is None or n not in linked):
+                    cmds.append('FUSE:LINK ' + n)
+                elif n not in target.fuse_links and (linked is None or n in linked):
+                    cmds.append('FUSE:UNL ' + n)
+        return cmds
+
+    def apply(self, hmp, slots=None, recall_cost=4):
+        """
+        Приводит ЛБП к этому состоянию: одна посылка чтения заданных полей и одна посылка с отличающимися
+        настройками и синхронизацией *OPC?.
+        :param hmp: подключенный объект HMP4040
+        :param slots: словарь {ячейка памяти: InstrumentConfig}, из которых можно восстановить состояние командой
+        *RCL, по умолчанию hmp.memory_slots (заполняется методом store). Если ячейки есть, читается полное состояние
+        каналов: *RCL восстанавливает все настройки и выходы каналов, поэтому ячейка годится, только если каждое
+        незаданное в этой конфигурации поле каждого канала в ней совпадает с текущим значением.
+        :param recall_cost: цена *RCL в командах; восстановление выбирается, если вместе с досылаемой разницей оно
+        дешевле прямой отправки разницы
+        :return: ConfigReport или ложь, если конфигурация некорректна для модели ЛБП
+        """
+        if slots is None:
+            slots = hmp.memory_slots
+        if any(hmp._check_channel([i]) is None for i in self.channels):
+            return False
+        if slots:
+            wanted = {i: ChannelConfig.FIELDS for i in hmp.model.select}
+        else:
+            wanted = {i: [name for name in ChannelConfig.FIELDS if getattr(config, name) is not None]
+                      for i, config in self.channels.items()}
+        current = self._read(hmp, wanted, self.output is not None)
+        events = self.diff(hmp, current)
+        if events is None:
+            return False
+        recalled = None
+        cost = len(hmp._event_commands(events))
+        for slot, stored in sorted(slots.items()):
+            if not self._recallable(stored, current):
+                continue
+            # Общий выход командой *RCL не меняется
+            recall = self.diff(hmp, InstrumentConfig(stored.channels, current.output))
+            if recall is not None and recall_cost + len(hmp._event_commands(recall, None)) < cost:
+                recalled, events = slot, recall
+                cost = recall_cost + len(hmp._event_commands(recall, None))
+        with hmp.lock:
+            if recalled is not None:
+                # После *RCL выбранный канал неизвестен
+                cmds = ['*RCL %d' % recalled] + hmp._event_commands(events, None)
+            else:
+                cmds = hmp._event_commands(events)
+            if cmds:
+                cmds.append('*OPC?')
+                hmp.send_batch(cmds)
+        return ConfigReport(len(cmds), len(events), recalled)
+
+    def _recallable(self, stored, current):
+        """
+        :return: истина, если *RCL ячейки stored не меняет ни одного поля, которое не задано в этой конфигурации, и
+        сразу оставляет выходы каналов в конечном состоянии, чтобы не включить их даже на время
+        """
+        for i, now in current.channels.items():
+            saved = stored.channels.get(i)
+            target = self.channels.get(i) or ChannelConfig()
+            if saved is None:
+                return False
+            for name in ChannelConfig.FIELDS:
+                value = getattr(target, name)
+                if value is None or name == 'output':
+                    expected = value if value is not None else getattr(now, name)
+                    if getattr(saved, name) is None or getattr(saved, name) != expected:
+                        return False
+        return True
+
+    def store(self, hmp, slot):
+        """
+        Приводит ЛБП к этому состоянию, сохраняет его в ячейку памяти прибора командой *SAV и запоминает полное
+        состояние ячейки в hmp.memory_slots для apply
+        :param hmp: подключенный объект HMP4040
+        :param slot: номер ячейки памяти
+        :return: ConfigReport или ложь, если конфигурация или номер ячейки некорректны
+        """
+        if hmp._check_memory_slot(slot) is None:
+            return False
+        slot = int(slot)
+        report = self.apply(hmp, {})
+        if report is False:
+            return False
+        stored = self.read(hmp, output=False)
+        hmp.send_batch(['*SAV %d' % slot, '*OPC?'])
+        hmp.memory_slots[slot] = stored
+        return report
+
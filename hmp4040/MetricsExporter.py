@@ -0,0 +1,313 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .HMP4040 import HMP4040, _SNAPSHOT_QUERIES
+from .SharedHMP4040 import SharedHMP4040
+from .records import parse_bool, parse_error
+
+# Метрики каналов: (имя, поле ChannelState, описание)
+_CHANNEL_METRICS = (
+    ('voltage_volts', 'voltage', 'Measured channel voltage'),
+    ('current_amperes', 'current', 'Measured channel current'),
+    ('output_enabled', 'output', 'Channel output is selected (OUTP:SEL)'),
+    ('ovp_tripped', 'ovp_tripped', 'Overvoltage protection has tripped'),
+    ('fuse_tripped', 'fuse_tripped', 'Electronic fuse has tripped'),
+)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Reading(object):
+    __slots__ = ('time', 'states', 'general', 'errors')
+
+    def __init__(self, time_, states, general, errors):
+        self.time = time_
+        self.states = states
+        self.general = general
+        self.errors = errors
+
+
+class _Device(object):
+    """
+    Состояние опроса одного ЛБП: последний результат и признак идущего опроса. Пока опрос идет, остальные запросы
+    метрик ждут его результата, а не опрашивают ЛБП сами.
+    """
+    def __init__(self, name, device, channels_):
+        self.name = name
+        self.device = device
+        self.hmp = device.hmp if isinstance(device, SharedHMP4040) else device
+        self.channels = channels_
+        self.reading = None
+        self.failure = None
+        self.polling = False
+        self.generation = 0
+        self.polls = 0
+        self.failures = 0
+        self.errors = {}
+        self.last_error = 0
+        self.cond = threading.Condition()
+
+
+class MetricsExporter(object):
+    """
+    HTTP-сервер метрик в текстовом формате Prometheus для одного или нескольких ЛБП (HMP4040 или SharedHMP4040).
+    Каждый опрос ЛБП - одна посылка: измеренные напряжение и ток, состояние выходов, срабатывание OVP и
+    предохранителей на всех каналах, общий выход и чтение очереди ошибок SYST:ERR?. Результат опроса используется
+    повторно, пока ему не больше max_age секунд; одновременные запросы метрик ждут уже идущего опроса, поэтому
+    ЛБП опрашивается не чаще, чем приходят запросы, и не более одного раза одновременно. Разные ЛБП опрашиваются
+    параллельно. Ошибки SCPI копятся в счетчике по кодам. Если у ЛБП включена статистика (enable_stats), ее
+    счетчики тоже выводятся.
+    """
+    def __init__(self, devices, host='127.0.0.1', port=9464, max_age=1.0, channels_=None, error_reads=4,
+                 timeout=5.0, prefix='hmp4040'):
+        """
+        :param devices: список объектов HMP4040/SharedHMP4040 или словарь {метка device: объект}
+        :param host: адрес HTTP-сервера
+        :param port: порт HTTP-сервера, 0 - выбрать свободный
+        :param max_age: наибольший возраст результата опроса, который отдается без нового опроса, в секундах
+        :param channels_: опрашиваемые каналы, по умолчанию все каналы модели каждого ЛБП
+        :param error_reads: число запросов SYST:ERR? в одном опросе
+        :param timeout: время ожидания опроса одного ЛБП, в секундах
+        :param prefix: префикс имен метрик
+        """
+        if not isinstance(devices, dict):
+            devices = {self._label(device): device for device in devices}
+        self.devices = []
+        for name, device in devices.items():
+            hmp = device.hmp if isinstance(device, SharedHMP4040) else device
+            channels = hmp._check_channel(channels_ if channels_ is not None else tuple(hmp.model.select))
+            if channels is None:
+                raise ValueError('invalid channels for %s: %r' % (name, channels_))
+            self.devices.append(_Device(name, device, channels[0]))
+        self.host = host
+        self.port = port
+        self.max_age = max_age
+        self.error_reads = error_reads
+        self.timeout = timeout
+        self.prefix = prefix
+        self.scrapes = 0
+        self._executor = None
+        self._server = None
+        self._thread = None
+
+    def __str__(self):
+        return "HMP4040 metrics exporter at http://%s:%s/metrics" % self.address
+
+    def __repr__(self):
+        return str(self)
+
+    @staticmethod
+    def _label(device):
+        hmp = device.hmp if isinstance(device, SharedHMP4040) else device
+        return '%s:%s' % (hmp.get_ip(), hmp.get_port())
+
+    @property
+    def address(self):
+        if self._server is not None:
+            return self._server.server_address[:2]
+        return self.host, self.port
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Запускает HTTP-сервер в фоновом потоке
+        :return: пара (адрес, порт), на которых слушает сервер
+        """
+        if self.running:
+            return self.address
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exporter.collect().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+            request_queue_size = 64
+
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.devices), 1))
+        self._server = Server((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='MetricsExporter', daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _poll(self, entry):
+        """
+        Опрашивает ЛБП одной посылкой
+        :return: _Reading
+        """
+        hmp = entry.hmp
+        tail = ['OUTP:GEN?'] + ['SYST:ERR?'] * self.error_reads
+        if isinstance(entry.device, SharedHMP4040):
+            priority = SharedHMP4040.TELEMETRY
+            states = entry.device.submit_channels(entry.channels, *_SNAPSHOT_QUERIES, priority=priority)
+            rest = entry.device.submit_batch(tail, priority=priority)
+            replies = states.result(self.timeout) + rest.result(self.timeout)
+        else:
+            with hmp.lock:
+                replies = hmp.send_batch(hmp._channel_commands(entry.channels, *_SNAPSHOT_QUERIES) + tail)
+        count = len(entry.channels) * len(_SNAPSHOT_QUERIES)
+        errors = [error for error in map(parse_error, replies[count + 1:]) if error.code]
+        return _Reading(time.time(), HMP4040._parse_snapshot(entry.channels, replies[:count]),
+                        parse_bool(replies[count]), errors)
+
+    def read(self, entry):
+        """
+        Возвращает результат опроса ЛБП не старше max_age; если его нет, опрашивает ЛБП или дожидается уже
+        идущего опроса
+        :param entry: опрашиваемый ЛБП из self.devices
+        :return: пара (_Reading или None, истина, если последний опрос удался)
+        """
+        with entry.cond:
+            generation = entry.generation
+            if not entry.cond.wait_for(lambda: not entry.polling, self.timeout):
+                return entry.reading, False
+            if entry.generation != generation:
+                return entry.reading, entry.failure is None
+            reading = entry.reading
+            if reading is not None and entry.failure is None and time.time() - reading.time <= self.max_age:
+                return reading, True
+            entry.polling = True
+        reading = failure = None
+        try:
+            reading = self._poll(entry)
+        except Exception as exc:
+            failure = exc
+        with entry.cond:
+            entry.polling = False
+            entry.generation += 1
+            entry.polls += 1
+            entry.failure = failure
+            if failure is not None:
+                entry.failures += 1
+            else:
+                entry.reading = reading
+                for error in reading.errors:
+                    entry.errors[error.code] = entry.errors.get(error.code, 0) + 1
+                    entry.last_error = error.code
+            entry.cond.notify_all()
+            return entry.reading, failure is None
+
+    def collect(self):
+        """
+        Опрашивает ЛБП (с учетом max_age и идущих опросов) и собирает метрики
+        :return: метрики в текстовом формате Prometheus
+        """
+        self.scrapes += 1
+        if self._executor is not None and len(self.devices) > 1:
+            results = list(self._executor.map(self.read, self.devices))
+        else:
+            results = [self.read(entry) for entry in self.devices]
+        families = {}
+        p = self.prefix
+
+        def add(name, kind, help_, labels, value):
+            family = families.get(name)
+            if family is None:
+                family = families[name] = ['# HELP %s %s' % (name, help_), '# TYPE %s %s' % (name, kind)]
+            family.append('%s{%s} %s' % (name, labels, value))
+
+        now = time.time()
+        for entry, (reading, up) in zip(self.devices, results):
+            device = 'device="%s"' % _escape(entry.name)
+            add(p + '_up', 'gauge', 'Last poll of the supply succeeded', device, int(up))
+            add(p + '_polls_total', 'counter', 'Polls of the supply', device, entry.polls)
+            add(p + '_poll_failures_total', 'counter', 'Failed polls of the supply', device, entry.failures)
+            if reading is None:
+                continue
+            add(p + '_reading_age_seconds', 'gauge', 'Age of the exported reading', device,
+                '%.3f' % (now - reading.time))
+            add(p + '_general_output_enabled', 'gauge', 'General output is on (OUTP:GEN)', device,
+                int(reading.general))
+            for state in reading.states:
+                labels = '%s,channel="%d"' % (device, state.channel)
+                for name, field, help_ in _CHANNEL_METRICS:
+                    value = getattr(state, field)
+                    add('%s_%s' % (p, name), 'gauge', help_, labels,
+                        int(value) if isinstance(value, bool) else repr(value))
+            add(p + '_scpi_last_error_code', 'gauge', 'Last SCPI error code read from SYST:ERR?', device,
+                entry.last_error)
+            for code, count in sorted(entry.errors.items()):
+                add(p + '_scpi_errors_total', 'counter', 'SCPI errors read from SYST:ERR?',
+                    '%s,code="%d"' % (device, code), count)
+            if entry.hmp.stats is not None:
+                self._merge(families, entry.hmp.stats.prometheus(p, device))
+        lines = []
+        for family in families.values():
+            lines.extend(family)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _merge(families, text):
+        """
+        Добавляет метрики в текстовом формате Prometheus в families так, что строка TYPE каждой метрики выводится один
+        раз, а ее значения всех ЛБП идут подряд
+        """
+        family = None
+        for line in text.splitlines():
+            if line.startswith('# TYPE '):
+                name = line.split()[2]
+                family = families.get(name)
+                if family is None:
+                    family = families[name] = [line]
+            elif line and family is not None:
+                family.append(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Prometheus metrics exporter for HMP power supplies')
+    parser.add_argument('-d', '--device', action='append', required=True, help='supply address ip[:port]')
+    parser.add_argument('--listen', default='127.0.0.1:9464', help='HTTP address host:port')
+    parser.add_argument('--max-age', type=float, default=1.0, help='reuse readings not older than this, s')
+    args = parser.parse_args()
+    supplies = []
+    for address in args.device:
+        ip, _, port = address.partition(':')
+        supply = HMP4040(ip, port or '5025')
+        supply.connect(supply.get_ip(), supply.get_port())
+        supply.enable_stats()
+        supplies.append(supply)
+    host, _, port = args.listen.rpartition(':')
+    exporter = MetricsExporter(supplies, host or '127.0.0.1', int(port), args.max_age)
+    print(exporter.start())
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        exporter.stop()
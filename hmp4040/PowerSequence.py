@@ -0,0 +1,283 @@
+import time
+from collections import namedtuple
+
+from .records import parse_float
+
+# Итог выполнения плана: длительность, число отправленных команд и посылок, максимальное опоздание посылки
+SequenceReport = namedtuple('SequenceReport', ['duration', 'commands', 'batches', 'max_lateness'])
+
+
+class Step(object):
+    """
+    Шаг плана включения. По умолчанию шаг начинается после окончания предыдущего; after задает имена шагов,
+    после окончания которых он начинается (пустой кортеж - одновременно с началом плана или последнего WaitFor).
+    """
+    duration = 0.0
+
+    def __init__(self, name=None, after=None):
+        self.name = name
+        self.after = after
+
+    def commands(self, start):
+        """
+        :param start: напряжение канала перед шагом (для Ramp)
+        :return: список событий (смещение от начала шага, канал или None, команда)
+        """
+        return []
+
+
+class Set(Step):
+    def __init__(self, channel, voltage=None, current=None, **kwargs):
+        super().__init__(**kwargs)
+        self.channel = str(channel)
+        self.voltage = voltage
+        self.current = current
+
+    def commands(self, start):
+        if self.voltage is not None and self.current is not None:
+            return [(0.0, self.channel, 'APPL %.3f,%.4f' % (self.voltage, self.current))]
+        if self.voltage is not None:
+            return [(0.0, self.channel, 'VOLT %.3f' % self.voltage)]
+        if self.current is not None:
+            return [(0.0, self.channel, 'CURR %.4f' % self.current)]
+        return []
+
+
+class Output(Step):
+    """
+    Подключает (on=True) или отключает каналы. При general=True также включается или выключается общий выход
+    OUTP:GEN.
+    """
+    def __init__(self, channels_, on=True, general=True, **kwargs):
+        super().__init__(**kwargs)
+        self.channels = tuple(str(i) for i in channels_)
+        self.on = on
+        self.general = general
+
+    def commands(self, start):
+        events = [(0.0, i, 'OUTP:SEL %d' % self.on) for i in self.channels]
+        if self.general:
+            events.append((0.0, None, 'OUTP:GEN %d' % self.on))
+        return events
+
+
+class Delay(Step):
+    def __init__(self, seconds, **kwargs):
+        super().__init__(**kwargs)
+        self.duration = float(seconds)
+
+
+class Ramp(Step):
+    """
+    Линейное изменение напряжения канала до target за duration секунд шагами не чаще resolution секунд.
+    Если задан start, рампа начинается с установки этого напряжения. Если в своем отрезке плана канал меняется
+    один, равные шаги отправляются короткой командой VOLT UP/DOWN после однократной установки VOLT:STEP, последний
+    шаг всегда задается абсолютным значением, после него восстанавливается прежний VOLT:STEP канала.
+    """
+    def __init__(self, channel, target, duration, start=None, resolution=0.02, **kwargs):
+        """
+        :param channel: канал
+        :param target: конечное напряжение
+        :param duration: длительность, в секундах
+        :param start: начальное напряжение, по умолчанию текущая уставка канала
+        :param resolution: минимальный интервал между шагами, в секундах
+        """
+        super().__init__(**kwargs)
+        self.channel = str(channel)
+        self.target = float(target)
+        self.duration = float(duration)
+        self.start = start
+        self.resolution = resolution
+        # Заполняются при компиляции плана: можно ли шагать VOLT UP/DOWN и прежний VOLT:STEP канала
+        self.use_step = False
+        self.step_voltage = None
+
+    def stepped(self, start):
+        """
+        :return: истина, если рампа от start отправляется командами VOLT UP/DOWN
+        """
+        if self.start is not None:
+            start = float(self.start)
+        steps = max(1, int(self.duration / self.resolution))
+        return self.use_step and steps > 1 and round(abs(self.target - start) / steps, 3) > 0
+
+    def commands(self, start):
+        stepped = self.stepped(start)
+        events = []
+        if self.start is not None:
+            start = float(self.start)
+            events.append((0.0, self.channel, 'VOLT %.3f' % start))
+        steps = max(1, int(self.duration / self.resolution))
+        delta = (self.target - start) / steps
+        interval = self.duration / steps
+        if stepped:
+            events.append((0.0, self.channel, 'VOLT:STEP %.3f' % abs(delta)))
+            verb = 'VOLT UP' if delta > 0 else 'VOLT DOWN'
+            events.extend((k * interval, self.channel, verb) for k in range(1, steps))
+        else:
+            events.extend((k * interval, self.channel, 'VOLT %.3f' % (start + k * delta)) for k in range(1, steps))
+        events.append((self.duration, self.channel, 'VOLT %.3f' % self.target))
+        if stepped and self.step_voltage is not None:
+            events.append((self.duration, self.channel, 'VOLT:STEP %.3f' % self.step_voltage))
+        return events
+
+
+class WaitFor(Step):
+    """
+    Ожидание, пока измеренное напряжение (quantity='VOLT') или ток (quantity='CURR') канала не окажется в пределах
+    target +- tolerance. Отправленные до него команды синхронизируются запросом *OPC?.
+    """
+    def __init__(self, channel, quantity='VOLT', target=0.0, tolerance=0.05, timeout=5.0, poll=0.02, **kwargs):
+        super().__init__(**kwargs)
+        self.channel = str(channel)
+        self.query = 'MEAS:%s?' % quantity.upper()
+        self.target = float(target)
+        self.tolerance = float(tolerance)
+        self.timeout = timeout
+        self.poll = poll
+
+
+class PowerSequence(object):
+    """
+    Декларативный план включения ЛБП: шаги Set, Output, Ramp, Delay и WaitFor с порядком, заданным параметрами
+    after. План компилируется в расписание посылок: команды всех каналов, приходящиеся на один момент времени,
+    уходят одной посылкой, выбор канала добавляется только при смене канала. Расписание выполняется по монотонным
+    часам, без фиксированных задержек после каждой команды.
+    """
+    def __init__(self, steps=()):
+        self.steps = list(steps)
+
+    def add(self, step):
+        self.steps.append(step)
+        return self
+
+    def compile(self, hmp):
+        """
+        :param hmp: объект HMP4040, по модели которого проверяются шаги и у которого читаются текущие уставки для
+        рамп без start и VOLT:STEP для рамп командами VOLT UP/DOWN
+        :return: список отрезков (события [(время, [(канал, команда)])], WaitFor или None)
+        :raise ValueError: если канал или значение шага недопустимы для модели ЛБП
+        """
+        for step in self.steps:
+            self._check(hmp, step)
+        segments = []
+        current = []
+        for step in self.steps:
+            current.append(step)
+            if isinstance(step, WaitFor):
+                segments.append(current)
+                current = []
+        if current:
+            segments.append(current)
+        voltages = {}
+        compiled = []
+        for segment in segments:
+            waits = segment[-1] if isinstance(segment[-1], WaitFor) else None
+            steps = segment[:-1] if waits is not None else segment
+            ramps = [step for step in steps if isinstance(step, Ramp)]
+            for ramp in ramps:
+                ramp.use_step = len(set(r.channel for r in ramps)) == 1
+            starts = self._schedule(steps)
+            events = {}
+            for step, start in zip(steps, starts):
+                if isinstance(step, Ramp):
+                    if step.start is None and step.channel not in voltages:
+                        voltages[step.channel] = hmp.get_voltage([step.channel])[0]
+                    if step.stepped(voltages.get(step.channel)):
+                        step.step_voltage = hmp._for_each_channel(ch=[step.channel], cmd='VOLT:STEP?',
+                                                                  parse=parse_float)[0]
+                for offset, channel, cmd in step.commands(voltages.get(getattr(step, 'channel', None))):
+                    events.setdefault(round(start + offset, 6), []).append((channel, cmd))
+                if isinstance(step, Ramp):
+                    voltages[step.channel] = step.target
+                elif isinstance(step, Set) and step.voltage is not None:
+                    voltages[step.channel] = float(step.voltage)
+            compiled.append((sorted(events.items()), waits))
+        return compiled
+
+    @staticmethod
+    def _check(hmp, step):
+        if isinstance(step, Output):
+            channels = step.channels
+        elif hasattr(step, 'channel'):
+            channels = [step.channel]
+        else:
+            return
+        if hmp._check_channel(channels) is None:
+            raise ValueError('invalid channels %r in %s' % (channels, type(step).__name__))
+        voltages = []
+        currents = []
+        if isinstance(step, Set):
+            voltages.append(step.voltage)
+            currents.append(step.current)
+        elif isinstance(step, Ramp):
+            voltages.extend((step.start, step.target))
+        for value in voltages:
+            if value is not None and hmp._check_voltage(value) is None:
+                raise ValueError('invalid voltage %r on channel %s' % (value, step.channel))
+        for value in currents:
+            if value is not None and hmp._check_current(value, channels) is None:
+                raise ValueError('invalid current %r on channel %s' % (value, step.channel))
+
+    @staticmethod
+    def _schedule(steps):
+        """
+        :return: время начала каждого шага от начала отрезка
+        """
+        ends = {}
+        starts = []
+        previous_end = 0.0
+        for step in steps:
+            if step.after is None:
+                start = previous_end
+            else:
+                after = (step.after,) if isinstance(step.after, str) else step.after
+                start = max([ends.get(name, 0.0) for name in after] or [0.0])
+            starts.append(start)
+            previous_end = start + step.duration
+            if step.name is not None:
+                ends[step.name] = previous_end
+        return starts
+
+    def run(self, hmp):
+        """
+        Выполняет план
+        :param hmp: подключенный объект HMP4040
+        :return: SequenceReport
+        :raise TimeoutError: если условие WaitFor не выполнилось за отведенное время
+        """
+        commands = 0
+        batches = 0
+        max_lateness = 0.0
+        started = time.monotonic()
+        for events, wait in self.compile(hmp):
+            origin = time.monotonic()
+            for offset, tick in events:
+                delay = origin + offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lateness = max(max_lateness, -delay)
+                with hmp.lock:
+                    cmds = hmp._event_commands(tick)
+                    hmp.send_batch(cmds)
+                commands += len(cmds)
+                batches += 1
+            if wait is None:
+                continue
+            hmp.send_batch(['*OPC?'])
+            deadline = time.monotonic() + wait.timeout
+            while True:
+                with hmp.lock:
+                    cmds = hmp._event_commands([(wait.channel, wait.query)])
+                    value = parse_float(hmp.send_batch(cmds)[0])
+                commands += len(cmds)
+                batches += 1
+                if abs(value - wait.target) <= wait.tolerance:
+                    break
+                if time.monotonic() > deadline:
+                    raise TimeoutError('%s on channel %s is %s, expected %s +- %s' % (
+                        wait.query, wait.channel, value, wait.target, wait.tolerance))
+                time.sleep(wait.poll)
+        hmp.send_batch(['*OPC?'])
+        return SequenceReport(time.monotonic() - started, commands, batches + 1, max_lateness)
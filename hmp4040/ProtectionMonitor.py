@@ -0,0 +1,141 @@
+import threading
+import time
+
+from .HMP4040 import STATUS_FUSE, STATUS_OVP, STB_EVENT_STATUS, STB_QUESTIONABLE
+from .records import ProtectionEvent, parse_int
+
+_KINDS = (('ovp', STATUS_OVP), ('fuse', STATUS_FUSE))
+
+
+class ProtectionMonitor(object):
+    """
+    Отслеживание срабатывания OVP и предохранителя по регистрам состояния вместо опроса VOLT:PROT:TRIP? и
+    FUSE:TRIP? на каждом канале. В обычном цикле читается только байт состояния *STB?; регистры STAT:QUES и
+    ISUM<n> читаются одной посылкой лишь тогда, когда выставлен бит STAT:QUES, и только для каналов, отмеченных в
+    STAT:QUES:INST. При каждом изменении состояния защиты вызываются обработчики on_trip(ProtectionEvent).
+    """
+    def __init__(self, hmp, channels_=('1', '2', '3', '4'), interval=0.05, on_trip=None, on_event_status=None):
+        """
+        :param hmp: подключенный объект HMP4040
+        :param channels_: список отслеживаемых каналов
+        :param interval: период опроса *STB?, в секундах
+        :param on_trip: обработчик изменения состояния защиты, вызывается с ProtectionEvent
+        :param on_event_status: обработчик значения *ESR?, вызывается при выставленном бите 5 байта состояния (на
+        приборе бит выставляется для событий, разрешенных командой *ESE)
+        """
+        self.hmp = hmp
+        self.channels = tuple(str(i) for i in channels_)
+        if not hmp._check_channel(self.channels):
+            raise ValueError('invalid channels: %r' % (self.channels,))
+        self.interval = interval
+        self.callbacks = [on_trip] if on_trip is not None else []
+        self.on_event_status = on_event_status
+        self.state = {}
+        self.polls = 0
+        self.drilldowns = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def tripped(self, kind=None):
+        """
+        :param kind: 'ovp', 'fuse' или None - любая защита
+        :return: список каналов, на которых защита сейчас сработала
+        """
+        return [i for i in self.channels
+                if any(tripped for k, tripped in self.state.get(i, {}).items() if kind in (None, k))]
+
+    def arm(self):
+        """
+        Включает события защиты на приборе, сбрасывает накопленные события и запоминает текущее состояние каналов.
+        Вызывается из start; для опроса без фонового потока (poll) вызывается вручную.
+        """
+        self.hmp.enable_protection_events(self.channels)
+        model = self.hmp.model
+        cmds = ['STAT:QUES:EVEN?', 'STAT:QUES:INST:EVEN?']
+        for i in self.channels:
+            cmds.extend((model.status_event[i], model.status_condition[i]))
+        replies = self.hmp.send_batch(cmds)
+        for n, i in enumerate(self.channels):
+            condition = parse_int(replies[3 + 2 * n])
+            self.state[i] = {kind: bool(condition & bit) for kind, bit in _KINDS}
+
+    def poll(self):
+        """
+        Один цикл опроса: *STB? и, если он указывает на новые события, чтение регистров затронутых каналов
+        :return: список ProtectionEvent, обнаруженных за этот цикл
+        """
+        self.polls += 1
+        status = self.hmp.get_status_byte()
+        if status & STB_EVENT_STATUS and self.on_event_status is not None:
+            self.on_event_status(self.hmp.get_event_status())
+        if not status & STB_QUESTIONABLE:
+            return []
+        self.drilldowns += 1
+        replies = self.hmp.send_batch(['STAT:QUES:EVEN?', 'STAT:QUES:INST:EVEN?'])
+        summary = parse_int(replies[1])
+        affected = [i for i in self.channels if summary & (1 << int(i))]
+        if not affected:
+            return []
+        model = self.hmp.model
+        cmds = []
+        for i in affected:
+            cmds.extend((model.status_event[i], model.status_condition[i]))
+        replies = self.hmp.send_batch(cmds)
+        now = time.time()
+        events = []
+        for n, i in enumerate(affected):
+            event, condition = parse_int(replies[2 * n]), parse_int(replies[2 * n + 1])
+            state = self.state.setdefault(i, {})
+            for kind, bit in _KINDS:
+                was, now_tripped = state.get(kind, False), bool(condition & bit)
+                if was != now_tripped:
+                    events.append(ProtectionEvent(int(i), kind, now_tripped, now))
+                elif event & bit:
+                    # Защита сработала и была сброшена (или наоборот) между двумя опросами
+                    events.append(ProtectionEvent(int(i), kind, not was, now))
+                    events.append(ProtectionEvent(int(i), kind, was, now))
+                state[kind] = now_tripped
+        for event in events:
+            for callback in self.callbacks:
+                callback(event)
+        return events
+
+    def start(self):
+        if self.running:
+            return
+        self.arm()
+        self._stop.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name='ProtectionMonitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as exc:
+                self.error = exc
+                break
+            deadline = max(deadline + self.interval, time.monotonic())
+            self._stop.wait(deadline - time.monotonic())
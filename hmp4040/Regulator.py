@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+
+from .records import LoopStats
+
+
+class PILaw(object):
+    """
+    Пропорционально-интегральный закон в приращениях: поправка уставки напряжения за итерацию
+    kp * (e - e_prev) + ki * e * dt, где e - ошибка регулирования. Для регулирования напряжения при длинных проводах
+    коэффициент передачи объекта близок к единице, и по умолчанию закон чисто интегральный.
+    Законом может быть любая функция law(канал, ошибка, dt) -> поправка уставки, В.
+    """
+    def __init__(self, kp=0.0, ki=20.0):
+        self.kp = kp
+        self.ki = ki
+        self._previous = {}
+
+    def __call__(self, channel, error, dt):
+        previous = self._previous.get(channel, error)
+        self._previous[channel] = error
+        return self.kp * (error - previous) + self.ki * error * dt
+
+
+class Regulator(object):
+    """
+    Программное регулирование измеренного напряжения (quantity='VOLT') или тока (quantity='CURR') на выбранных
+    каналах изменением уставки напряжения. Каждая итерация - одна посылка с запросами MEAS всех каналов и, если
+    уставки изменились больше чем на resolution, посылка команд VOLT без ожидания ответа и без задержки
+    write_delay. Поправка ограничивается скоростью max_slew, а уставка - диапазоном от 0 до порога OVP канала за
+    вычетом ovp_margin (порог читается при запуске) и max_voltage.
+    """
+    def __init__(self, hmp, targets, quantity='VOLT', law=None, rate=50.0, max_slew=5.0, max_voltage=None,
+                 ovp_margin=0.1, resolution=0.001):
+        """
+        :param hmp: подключенный объект HMP4040
+        :param targets: словарь {канал: целевое значение измеряемой величины}
+        :param quantity: регулируемая величина, 'VOLT' или 'CURR'; иначе ValueError
+        :param law: закон регулирования law(канал, ошибка, dt) -> поправка уставки, по умолчанию PILaw()
+        :param rate: частота итераций, Гц
+        :param max_slew: наибольшая скорость изменения уставки, В/с
+        :param max_voltage: наибольшая уставка, по умолчанию предел модели
+        :param ovp_margin: запас до порога OVP, В
+        :param resolution: наименьшее изменение уставки, которое отправляется на ЛБП, В
+        """
+        quantity = str(quantity).upper()
+        if quantity not in ('VOLT', 'CURR'):
+            raise ValueError('invalid quantity: %r' % (quantity,))
+        self.hmp = hmp
+        self.targets = {str(i): float(value) for i, value in targets.items()}
+        self.channels = tuple(self.targets)
+        self.query = 'MEAS:%s?' % quantity
+        self.law = law if law is not None else PILaw()
+        self.rate = float(rate)
+        self.max_slew = max_slew
+        self.max_voltage = max_voltage
+        self.ovp_margin = ovp_margin
+        self.resolution = resolution
+        self.setpoints = {}
+        self.sent = {}
+        self.limits = {}
+        self.measured = {}
+        self.errors = {}
+        self.error = None
+        self._last_time = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.reset_stats()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def reset_stats(self):
+        self._iterations = 0
+        self._periods = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._max_period = 0.0
+        self._overruns = 0
+        self._exchange = 0.0
+
+    def stats(self):
+        """
+        :return: LoopStats
+        """
+        jitter = math.sqrt(self._m2 / self._periods) if self._periods else 0.0
+        return LoopStats(self._iterations, self._mean, jitter, self._max_period, self._overruns,
+                         self._exchange / self._iterations if self._iterations else 0.0)
+
+    def converged(self, tolerance):
+        """
+        :return: истина, если на всех каналах последняя ошибка регулирования не больше tolerance
+        """
+        return len(self.errors) == len(self.channels) and all(abs(e) <= tolerance for e in self.errors.values())
+
+    def prepare(self):
+        """
+        Читает текущие уставки напряжения и пороги OVP каналов. Вызывается из start; для итераций без фонового
+        потока (step) вызывается вручную.
+        """
+        if not self.hmp._check_channel(self.channels):
+            raise ValueError('invalid channels: %r' % (self.channels,))
+        voltages = self.hmp.get_voltage(self.channels)
+        ovp = self.hmp.get_overvoltage_protection_value(self.channels)
+        ceiling = self.hmp.model.voltage if self.max_voltage is None else self.max_voltage
+        for i, voltage, protection in zip(self.channels, voltages, ovp):
+            self.setpoints[i] = self.sent[i] = voltage
+            self.limits[i] = max(0.0, min(ceiling, protection - self.ovp_margin))
+        self._last_time = None
+
+    def step(self):
+        """
+        Одна итерация регулирования: измерение, расчет поправок и отправка изменившихся уставок
+        :return: словарь {канал: измеренное значение}
+        """
+        hmp = self.hmp
+        start = time.monotonic()
+        replies = hmp._on_channels(self.channels, self.query)
+        now = time.monotonic()
+        self._exchange += now - start
+        dt = now - self._last_time if self._last_time is not None else 1.0 / self.rate
+        if self._last_time is not None:
+            self._record_period(dt)
+        self._last_time = now
+        self._iterations += 1
+        step_limit = self.max_slew * dt if self.max_slew is not None else float('inf')
+        events = []
+        with hmp.lock:
+            for i, reply in zip(self.channels, replies):
+                value = float(reply)
+                self.measured[i] = value
+                error = self.targets[i] - value
+                self.errors[i] = error
+                delta = max(-step_limit, min(step_limit, self.law(i, error, dt)))
+                setpoint = max(0.0, min(self.limits[i], self.setpoints[i] + delta))
+                self.setpoints[i] = setpoint
+                if abs(setpoint - self.sent[i]) >= self.resolution:
+                    events.append((i, 'VOLT %.3f' % setpoint))
+                    self.sent[i] = setpoint
+            if events:
+                hmp.send_batch(hmp._event_commands(events))
+        return dict(self.measured)
+
+    def _record_period(self, period):
+        self._periods += 1
+        delta = period - self._mean
+        self._mean += delta / self._periods
+        self._m2 += delta * (period - self._mean)
+        self._max_period = max(self._max_period, period)
+        if period > 1.5 / self.rate:
+            self._overruns += 1
+
+    def start(self):
+        if self.running:
+            return
+        self.prepare()
+        self._stop.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name='Regulator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        period = 1.0 / self.rate
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except Exception as exc:
+                self.error = exc
+                break
+            deadline = max(deadline + period, time.monotonic())
+            self._stop.wait(deadline - time.monotonic())
@@ -0,0 +1,278 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+from .HMP4040 import HMP4040
+
+
+class _Request(object):
+    __slots__ = ('future', 'method', 'args', 'kwargs', 'channels', 'cmds', 'priority', 'deadline', 'cost',
+                 'submitted')
+
+    def __init__(self, method=None, args=(), kwargs=None, channels=None, cmds=(), priority=1, deadline=None):
+        self.future = Future()
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.channels = channels
+        self.cmds = cmds
+        self.priority = priority
+        self.deadline = deadline
+        if method is not None:
+            self.cost = 1
+        elif channels is not None:
+            self.cost = len(channels) * (len(cmds) + 1)
+        else:
+            self.cost = len(cmds)
+        self.submitted = time.monotonic()
+
+
+class SharedHMP4040(object):
+    """
+    Одно соединение с ЛБП, разделяемое многими потоками. Запросы потоков ставятся в очередь и выполняются одним
+    потоком ввода-вывода; каждый запрос неделим: выбор канала, его команды и чтение ответов не перемешиваются с
+    чужими. Вызывающий поток сразу получает concurrent.futures.Future. Пакеты команд (submit_batch,
+    submit_channels) одного класса приоритета, стоящие в очереди подряд, уходят одной посылкой.
+    Очередь упорядочена по классу приоритета (EMERGENCY, CONTROL, TELEMETRY, BULK), внутри класса - по сроку
+    (deadline), затем по порядку поступления. Запрос, срок которого истек до отправки, не отправляется, а
+    завершается TimeoutError. Если задан rate, число команд в секунду ограничивается (с запасом burst); запросы
+    EMERGENCY идут без ожидания, но учитываются в бюджете. Объединенная посылка ограничена max_coalesce командами,
+    а запросы BULK не объединяются.
+    Любой метод HMP4040 можно вызвать через объект: shared.measure_voltage(['1']) вернет Future. Вызов метода
+    (submit с именем метода или функцией) выполняется в потоке ввода-вывода целиком, со всеми своими посылками:
+    например, upload_arbitrary_sequence на четыре канала - четыре обмена с ЛБП. Срочный запрос ждет окончания
+    выполняемого запроса, то есть одной посылки для submit_batch/submit_channels и всего вызова для метода, поэтому
+    длительные операции лучше разбивать на пакеты.
+    """
+    EMERGENCY = 0
+    CONTROL = 1
+    TELEMETRY = 2
+    BULK = 3
+
+    def __init__(self, hmp, max_coalesce=32, rate=None, burst=None):
+        """
+        :param hmp: подключенный объект HMP4040
+        :param max_coalesce: максимальное число команд в посылке, собранной из нескольких пакетов
+        :param rate: бюджет команд в секунду на прибор, None - без ограничения
+        :param burst: сколько команд можно отправить подряд без ожидания, по умолчанию rate
+        """
+        self.hmp = hmp
+        self.max_coalesce = max_coalesce
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.requests = 0
+        self.exchanges = 0
+        self.expired = 0
+        # Время ожидания в очереди по классам приоритета: [число запросов, суммарное, наибольшее], в секундах
+        self.waits = {priority: [0, 0.0, 0.0] for priority in range(4)}
+        self._heap = []
+        self._seq = itertools.count()
+        self._tokens = self.burst or 0.0
+        self._refilled = time.monotonic()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def __str__(self):
+        return "shared " + str(self.hmp)
+
+    def __repr__(self):
+        return str(self)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(HMP4040, name, None)):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.submit(name, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _put(self, request, timeout):
+        if timeout is not None:
+            request.deadline = request.submitted + timeout
+        deadline = request.deadline if request.deadline is not None else float('inf')
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('SharedHMP4040 is closed')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='SharedHMP4040', daemon=True)
+                self._thread.start()
+            self.requests += 1
+            heapq.heappush(self._heap, (request.priority, deadline, next(self._seq), request))
+            self._cond.notify()
+        return request.future
+
+    def submit(self, method, *args, priority=CONTROL, timeout=None, **kwargs):
+        """
+        :param method: имя метода HMP4040 или функция, принимающая объект HMP4040 первым аргументом
+        :param priority: класс приоритета
+        :param timeout: срок, за который запрос должен быть отправлен, в секундах
+        :return: Future с результатом вызова
+        """
+        return self._put(_Request(method, args, kwargs, priority=priority), timeout)
+
+    def submit_batch(self, cmds, priority=CONTROL, timeout=None):
+        """
+        :param cmds: список команд, как у HMP4040.send_batch
+        :return: Future со списком ответов на запросы из cmds
+        """
+        return self._put(_Request(cmds=list(cmds), priority=priority), timeout)
+
+    def submit_channels(self, channels_, *cmds, priority=CONTROL, timeout=None):
+        """
+        Выполняет cmds на каждом из каналов. Выбор каналов добавляется в момент отправки, с учетом канала,
+        выбранного предыдущими запросами.
+        :return: Future со списком ответов на запросы или с ложью, если список каналов некорректен
+        """
+        checked = self.hmp._check_channel(channels_)
+        if checked is None:
+            future = Future()
+            future.set_result(False)
+            return future
+        return self._put(_Request(channels=checked[0], cmds=cmds, priority=priority), timeout)
+
+    def emergency_off(self):
+        """
+        Отключает общий выход ЛБП (OUTP:GEN 0) раньше всех запросов в очереди и без ожидания бюджета команд
+        :return: Future
+        """
+        return self.submit_batch(['OUTP:GEN 0', '*OPC?'], priority=self.EMERGENCY)
+
+    def call(self, method, *args, timeout=None, **kwargs):
+        """
+        Вызывает метод и ждет результата
+        :param timeout: время ожидания, в секундах
+        """
+        return self.submit(method, *args, **kwargs).result(timeout)
+
+    def close(self):
+        """
+        Выполняет уже поставленные в очередь запросы и останавливает поток ввода-вывода. Соединение не закрывается.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _next(self):
+        """
+        Ждет очередной запрос с учетом сроков и бюджета команд
+        :return: (список запросов для отправки одной посылкой, список просроченных запросов); пустой первый
+        список означает остановку
+        """
+        expired = []
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if not self._heap:
+                    if self._closed or expired:
+                        return [], expired
+                    self._cond.wait()
+                    continue
+                request = self._heap[0][3]
+                if request.deadline is not None and request.deadline < now:
+                    heapq.heappop(self._heap)
+                    expired.append(request)
+                    continue
+                if self.rate and request.priority != self.EMERGENCY:
+                    self._refill(now)
+                    if self._tokens < min(request.cost, self.burst):
+                        wait = (min(request.cost, self.burst) - self._tokens) / self.rate
+                        if request.deadline is not None:
+                            wait = min(wait, request.deadline - now)
+                        self._cond.wait(wait)
+                        continue
+                heapq.heappop(self._heap)
+                group = [request]
+                cost = request.cost
+                while request.method is None and request.priority != self.BULK and self._heap:
+                    following = self._heap[0][3]
+                    if following.method is not None or following.priority != request.priority or \
+                            cost + following.cost > self.max_coalesce or \
+                            (following.deadline is not None and following.deadline < now) or \
+                            (self.rate and following.priority != self.EMERGENCY and
+                             self._tokens < cost + following.cost):
+                        break
+                    heapq.heappop(self._heap)
+                    group.append(following)
+                    cost += following.cost
+                if self.rate:
+                    self._tokens -= cost
+                for item in group:
+                    stats = self.waits[item.priority]
+                    waited = now - item.submitted
+                    stats[0] += 1
+                    stats[1] += waited
+                    stats[2] = max(stats[2], waited)
+                return group, expired
+
+    def _run(self):
+        while True:
+            group, expired = self._next()
+            for request in expired:
+                self.expired += 1
+                if request.future.set_running_or_notify_cancel():
+                    request.future.set_exception(TimeoutError('request was not sent before its deadline'))
+            if not group:
+                if expired:
+                    continue
+                return
+            if group[0].method is not None:
+                self._call(group[0])
+            else:
+                self._exchange(group)
+
+    def _call(self, request):
+        if not request.future.set_running_or_notify_cancel():
+            return
+        try:
+            if isinstance(request.method, str):
+                result = getattr(self.hmp, request.method)(*request.args, **request.kwargs)
+            else:
+                result = request.method(self.hmp, *request.args, **request.kwargs)
+        except Exception as exc:
+            request.future.set_exception(exc)
+        else:
+            request.future.set_result(result)
+
+    def _exchange(self, group):
+        group = [request for request in group if request.future.set_running_or_notify_cancel()]
+        if not group:
+            return
+        hmp = self.hmp
+        counts = []
+        try:
+            with hmp.lock:
+                for request in group:
+                    cmds = request.cmds
+                    if request.channels is not None:
+                        cmds = hmp._channel_commands(request.channels, *cmds)
+                    for cmd in cmds:
+                        hmp._queue(cmd)
+                    counts.append(sum(1 for cmd in cmds if cmd.find('?') != -1))
+                replies = hmp._send_pending() if hmp._pending else []
+        except Exception as exc:
+            if hmp._pending:
+                hmp._pending = []
+                hmp._selected_channel = None
+            for request in group:
+                request.future.set_exception(exc)
+            return
+        self.exchanges += 1
+        start = 0
+        for request, count in zip(group, counts):
+            request.future.set_result(replies[start:start + count])
+            start += count
@@ -0,0 +1,166 @@
+import threading
+import time
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TelemetrySampler(object):
+    """
+    Фоновый опрос MEAS:VOLT? и MEAS:CURR? на выбранных каналах с заданной частотой. Каждый опрос всех каналов идет
+    одной посылкой, результаты складываются в заранее выделенный кольцевой буфер array('d') без создания строк и
+    списков на каждый отсчет. Строка буфера: [время, U1, I1, U2, I2, ...] в порядке каналов из channels.
+    """
+    def __init__(self, hmp, channels_=('1', '2', '3', '4'), rate=10.0, capacity=10000):
+        """
+        :param hmp: подключенный объект HMP4040
+        :param channels_: список опрашиваемых каналов
+        :param rate: частота опроса, Гц
+        :param capacity: число хранимых отсчетов
+        """
+        self.hmp = hmp
+        self.channels = tuple(str(i) for i in channels_)
+        if not hmp._check_channel(self.channels):
+            raise ValueError('invalid channels: %r' % (self.channels,))
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.width = 1 + 2 * len(self.channels)
+        self.dropped = 0
+        self.overwritten = 0
+        self.error = None
+        self._data = array('d', bytes(8 * capacity * self.width))
+        self._count = 0
+        self._first_time = None
+        self._last_time = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def count(self):
+        """
+        :return: общее число отсчетов с момента запуска, включая вытесненные из буфера
+        """
+        return self._count
+
+    @property
+    def achieved_rate(self):
+        """
+        :return: фактическая частота опроса, Гц
+        """
+        if self._count < 2 or self._last_time == self._first_time:
+            return 0.0
+        return (self._count - 1) / (self._last_time - self._first_time)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name='TelemetrySampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._cond:
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        period = 1.0 / self.rate
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                replies = self.hmp._on_channels(self.channels, 'MEAS:VOLT?', 'MEAS:CURR?')
+            except Exception as exc:
+                self.error = exc
+                break
+            self._store(time.time(), replies)
+            deadline += period
+            late = time.monotonic() - deadline
+            if late > 0:
+                missed = int(late / period)
+                self.dropped += missed
+                deadline += missed * period
+            self._stop.wait(deadline - time.monotonic())
+        with self._cond:
+            self._cond.notify_all()
+
+    def _store(self, timestamp, replies):
+        row = (self._count % self.capacity) * self.width
+        data = self._data
+        data[row] = timestamp
+        for k, reply in enumerate(replies, row + 1):
+            data[k] = float(reply)
+        if self._first_time is None:
+            self._first_time = timestamp
+        self._last_time = timestamp
+        with self._cond:
+            self._count += 1
+            self._cond.notify_all()
+
+    def iter_new(self, timeout=None):
+        """
+        Генератор новых отсчетов. Ждет поступления данных, пока опрос запущен. Если потребитель отстал больше чем на
+        capacity отсчетов, вытесненные отсчеты пропускаются и учитываются в overwritten.
+        :param timeout: максимальное время ожидания очередного отсчета, в секундах
+        :return: кортежи (время, array('d', [U1, I1, U2, I2, ...]))
+        """
+        cursor = self._count
+        while True:
+            with self._cond:
+                if cursor == self._count:
+                    if not self.running:
+                        return
+                    if not self._cond.wait_for(lambda: cursor != self._count or not self.running, timeout):
+                        return
+                available = self._count
+            if available - cursor > self.capacity:
+                self.overwritten += available - cursor - self.capacity
+                cursor = available - self.capacity
+            while cursor < available:
+                row = (cursor % self.capacity) * self.width
+                yield self._data[row], self._data[row + 1:row + self.width]
+                cursor += 1
+
+    def view(self):
+        """
+        Представление буфера без копирования: numpy.ndarray формы (capacity, width), если установлен numpy, иначе
+        плоский memoryview длиной capacity * width. Строки расположены кольцом; последний отсчет находится в строке
+        (count - 1) % capacity.
+        """
+        if numpy is not None:
+            return numpy.frombuffer(self._data, dtype=numpy.float64).reshape(self.capacity, self.width)
+        return memoryview(self._data)
+
+    def to_numpy(self):
+        """
+        :return: numpy.ndarray формы (len(self), width) с отсчетами в хронологическом порядке. Копирование
+        происходит, только если буфер уже перезаписывался по кругу.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required for TelemetrySampler.to_numpy')
+        buffer = self.view()
+        count = self._count
+        if count <= self.capacity:
+            return buffer[:count]
+        head = count % self.capacity
+        return numpy.concatenate((buffer[head:], buffer[:head]))
@@ -1 +1,16 @@
-from .HMP4040 import HMP4040
\ No newline at end of file
+from .HMP4040 import HMP4040
+from .AsyncHMP4040 import AsyncHMP4040
+from .HMP4040Fleet import HMP4040Fleet, DeviceResult
+from .HMP4040Pool import HMP4040Pool
+from .HMP4040Simulator import HMP4040Simulator
+from .InstrumentConfig import ChannelConfig, InstrumentConfig
+from .MetricsExporter import MetricsExporter
+from .ProtectionMonitor import ProtectionMonitor
+from .PowerSequence import PowerSequence, SequenceReport, Set, Output, Ramp, Delay, WaitFor
+from .Regulator import PILaw, Regulator
+from .SharedHMP4040 import SharedHMP4040
+from .TelemetrySampler import TelemetrySampler
+from .instrumentation import CommandStats
+from .models import HMPModel, MODELS
+from .records import ChannelState, ConfigReport, LoopStats, ProtectionEvent, SCPIErrorRecord
+from .transport import SocketTransport
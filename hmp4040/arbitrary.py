@@ -0,0 +1,61 @@
+import hashlib
+import math
+from itertools import chain
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Ограничения таблицы ARB: число точек и время удержания точки в секундах
+ARB_MAX_POINTS = 128
+ARB_MIN_DWELL = 0.01
+ARB_MAX_DWELL = 60.0
+
+_POINT_FORMAT = '%.3f,%.4f,%.2f'
+
+
+def format_arbitrary(points, max_voltage=30.0, max_current=10.0):
+    """
+    Проверяет точки таблицы ARB на допустимость (в том числе отсутствие NaN и бесконечностей) за один проход и
+    форматирует их в аргумент команды ARB:DATA
+    :param points: numpy.ndarray формы (N, 3) или последовательность троек (напряжение, ток, время удержания)
+    :param max_voltage: максимальное напряжение канала
+    :param max_current: максимальный ток канала
+    :return: строка вида "U1,I1,t1,U2,I2,t2,..."
+    """
+    if numpy is not None and isinstance(points, numpy.ndarray):
+        table = points.astype(numpy.float64, copy=False).reshape(-1, 3)
+        count = len(table)
+        low = table.min(axis=0) if count else None
+        high = table.max(axis=0) if count else None
+        finite = bool(numpy.isfinite(table).all())
+        flat = table.ravel().tolist()
+    else:
+        flat = [float(value) for value in chain.from_iterable(points)]
+        count, tail = divmod(len(flat), 3)
+        if tail:
+            raise ValueError('ARB points must be (voltage, current, dwell) triples')
+        columns = (flat[0::3], flat[1::3], flat[2::3])
+        low = [min(column) for column in columns] if count else None
+        high = [max(column) for column in columns] if count else None
+        finite = all(map(math.isfinite, flat))
+    if not 0 < count <= ARB_MAX_POINTS:
+        raise ValueError('ARB table must hold 1..%d points, got %d' % (ARB_MAX_POINTS, count))
+    if not finite:
+        raise ValueError('ARB points must be finite numbers')
+    if low[0] < 0 or high[0] > max_voltage:
+        raise ValueError('ARB voltage out of range 0..%s' % max_voltage)
+    if low[1] < 0 or high[1] > max_current:
+        raise ValueError('ARB current out of range 0..%s' % max_current)
+    if low[2] < ARB_MIN_DWELL or high[2] > ARB_MAX_DWELL:
+        raise ValueError('ARB dwell time out of range %s..%s' % (ARB_MIN_DWELL, ARB_MAX_DWELL))
+    return ','.join([_POINT_FORMAT] * count) % tuple(flat)
+
+
+def arbitrary_digest(data):
+    """
+    :param data: отформатированная таблица ARB
+    :return: хэш содержимого таблицы для проверки, загружена ли она уже в ЛБП
+    """
+    return hashlib.blake2b(data.encode(), digest_size=16).digest()
@@ -0,0 +1,100 @@
+import time
+
+from .records import parse_float, parse_int
+
+# Уставки, которые кэшируются, и функции разбора их значений
+SETPOINTS = {
+    'VOLT': parse_float,
+    'CURR': parse_float,
+    'VOLT:PROT': parse_float,
+    'FUSE:DEL': parse_int,
+    'VOLT:STEP': parse_float,
+    'CURR:STEP': parse_float,
+}
+# Корни команд, способных менять кэшируемые уставки, и команды с этими корнями, которые уставок не меняют
+_AFFECTING_ROOTS = ('VOLT', 'CURR', 'APPL', 'FUSE', 'SOUR')
+_HARMLESS = ('VOLT:PROT:CLE', 'VOLT:PROT:MODE', 'FUSE', 'FUSE:LINK', 'FUSE:UNL')
+
+MISS = object()
+
+
+class SetpointCache(object):
+    """
+    Кэш уставок ЛБП по каналам: напряжение, ток, порог OVP, задержка предохранителя и шаги напряжения и тока.
+    Заполняется при отправке команд установки (write-through) и при чтении уставок. Записи устаревают через ttl
+    секунд. Измерения MEAS:* не кэшируются никогда.
+    """
+    def __init__(self, ttl=None):
+        """
+        :param ttl: время жизни записи в секундах, None - без ограничения
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self, channel=None):
+        """
+        :param channel: канал, уставки которого сбрасываются, по умолчанию все
+        """
+        if channel is None:
+            self._entries = {}
+        else:
+            for key in [key for key in self._entries if key[0] == channel]:
+                del self._entries[key]
+
+    def get(self, channel, header):
+        """
+        :param channel: номер канала строкой
+        :param header: заголовок запроса без '?', например 'VOLT'; 'APPL' собирается из 'VOLT' и 'CURR'
+        :return: значение уставки или MISS
+        """
+        if header == 'APPL':
+            voltage = self.get(channel, 'VOLT')
+            current = self.get(channel, 'CURR') if voltage is not MISS else MISS
+            return MISS if current is MISS else (voltage, current)
+        entry = self._entries.get((channel, header))
+        if entry is None or (entry[1] is not None and entry[1] < time.monotonic()):
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        return entry[0]
+
+    def put(self, channel, header, value):
+        if header == 'APPL':
+            self.put(channel, 'VOLT', value[0])
+            self.put(channel, 'CURR', value[1])
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[(channel, header)] = (value, expires)
+
+    def track(self, channel, cmd):
+        """
+        Учитывает отправляемую команду установки: запоминает новое значение уставки или сбрасывает те записи,
+        значение которых после команды неизвестно (VOLT UP, CURR MAX, длинные формы команд и т.п.)
+        :param channel: выбранный канал или None, если он неизвестен
+        :param cmd: команда
+        """
+        header, _, args = cmd.strip().partition(' ')
+        header = header.upper().lstrip(':')
+        if header.endswith('?') or not header.startswith(_AFFECTING_ROOTS):
+            return
+        if channel is None:
+            self._entries = {}
+            return
+        if header == 'APPL':
+            try:
+                voltage, current = args.split(',')
+                self.put(channel, 'APPL', (parse_float(voltage), parse_float(current)))
+            except ValueError:
+                self.clear(channel)
+        elif header in SETPOINTS:
+            try:
+                self.put(channel, header, SETPOINTS[header](args))
+            except ValueError:
+                self._entries.pop((channel, header), None)
+        elif header not in _HARMLESS:
+            self.clear(channel)
@@ -0,0 +1,103 @@
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+# Верхние границы корзин гистограммы времени обмена, в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, float('inf'))
+
+
+def scpi_verb(cmd):
+    """
+    :param cmd: команда SCPI
+    :return: заголовок команды без аргументов в верхнем регистре, например 'MEAS:VOLT?' или 'INST'
+    """
+    end = cmd.find(' ')
+    return (cmd if end == -1 else cmd[:end]).upper()
+
+
+class CommandStats(object):
+    """
+    Счетчики обмена с ЛБП: число команд по заголовкам SCPI, отправленные и принятые байты и гистограммы времени
+    обмена (от отправки до получения последнего ответа) по заголовкам запросов. Подключается к HMP4040 через
+    enable_stats; пока она не подключена, драйвер не тратит время на учет.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.commands = Counter()
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.exchanges = 0
+            self._latency = {}
+
+    def record_sent(self, cmds, nbytes):
+        with self._lock:
+            for cmd in cmds:
+                self.commands[scpi_verb(cmd)] += 1
+            self.bytes_sent += nbytes
+
+    def record_received(self, nbytes):
+        with self._lock:
+            self.bytes_received += nbytes
+
+    def record_exchange(self, verb, seconds):
+        """
+        :param verb: заголовок запроса или 'BATCH' для посылки из нескольких команд
+        :param seconds: время обмена
+        """
+        with self._lock:
+            self.exchanges += 1
+            histogram = self._latency.get(verb)
+            if histogram is None:
+                histogram = self._latency[verb] = [[0] * len(LATENCY_BUCKETS), 0, 0.0]
+            histogram[0][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+
+    def latency(self, verb):
+        """
+        :return: словарь {'buckets': [(граница, накопленное число)], 'count': число, 'sum': сумма секунд}
+        """
+        with self._lock:
+            counts, count, total = self._latency.get(verb, ([0] * len(LATENCY_BUCKETS), 0, 0.0))
+            cumulative = []
+            running = 0
+            for bound, n in zip(LATENCY_BUCKETS, counts):
+                running += n
+                cumulative.append((bound, running))
+            return {'buckets': cumulative, 'count': count, 'sum': total}
+
+    def as_dict(self):
+        with self._lock:
+            verbs = list(self._latency)
+            result = {'commands': dict(self.commands), 'bytes_sent': self.bytes_sent,
+                      'bytes_received': self.bytes_received, 'exchanges': self.exchanges}
+        result['latency'] = {verb: self.latency(verb) for verb in verbs}
+        return result
+
+    def prometheus(self, prefix='hmp4040', labels=''):
+        """
+        :param prefix: префикс имен метрик
+        :param labels: дополнительные метки вида 'device="10.6.1.4:5025"'
+        :return: счетчики в текстовом формате Prometheus
+        """
+        data = self.as_dict()
+        extra = ',' + labels if labels else ''
+        lines = ['# TYPE %s_commands_total counter' % prefix]
+        for verb, count in sorted(data['commands'].items()):
+            lines.append('%s_commands_total{verb="%s"%s} %d' % (prefix, verb, extra, count))
+        lines.append('# TYPE %s_bytes_sent_total counter' % prefix)
+        lines.append('%s_bytes_sent_total{%s} %d' % (prefix, labels, data['bytes_sent']))
+        lines.append('# TYPE %s_bytes_received_total counter' % prefix)
+        lines.append('%s_bytes_received_total{%s} %d' % (prefix, labels, data['bytes_received']))
+        lines.append('# TYPE %s_exchange_seconds histogram' % prefix)
+        for verb, histogram in sorted(data['latency'].items()):
+            for bound, count in histogram['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_exchange_seconds_bucket{verb="%s",le="%s"%s} %d' % (prefix, verb, le, extra, count))
+            lines.append('%s_exchange_seconds_count{verb="%s"%s} %d' % (prefix, verb, extra, histogram['count']))
+            lines.append('%s_exchange_seconds_sum{verb="%s"%s} %r' % (prefix, verb, extra, histogram['sum']))
+        return '\n'.join(lines) + '\n'
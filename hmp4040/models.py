@@ -0,0 +1,63 @@
+import sys
+
+
+class HMPModel(object):
+    """
+    Описание модели ЛБП серии HMP: число каналов, пределы уставок и заранее собранные (интернированные) команды для
+    каждого канала, чтобы горячие пути не собирали строки на каждый вызов.
+    """
+    def __init__(self, name, currents, voltage=32.05, fuse_delay=250):
+        """
+        :param name: название модели, как в ответе *IDN?
+        :param currents: максимальный ток каждого канала, по порядку каналов
+        :param voltage: максимальное напряжение канала
+        :param fuse_delay: максимальная задержка срабатывания предохранителя, мс
+        """
+        self.name = name
+        self.channels = len(currents)
+        self.currents = tuple(currents)
+        self.current = max(self.currents)
+        self.voltage = voltage
+        self.fuse_delay = fuse_delay
+        numbers = [str(n) for n in range(1, self.channels + 1)]
+        self.select = {n: sys.intern('INST OUT' + n) for n in numbers}
+        self.status_condition = {n: sys.intern('STAT:QUES:INST:ISUM%s:COND?' % n) for n in numbers}
+        self.status_event = {n: sys.intern('STAT:QUES:INST:ISUM%s:EVEN?' % n) for n in numbers}
+        # Предел тока для каждой маски каналов (бит n - канал n): наименьший из пределов каналов маски
+        self._current_by_mask = {}
+        for mask in range(2, 2 << self.channels, 2):
+            self._current_by_mask[mask] = min(self.currents[n - 1] for n in range(1, self.channels + 1)
+                                              if mask >> n & 1)
+
+    def __str__(self):
+        return "%s: %d channels, %.2f V, %s A" % (self.name, self.channels, self.voltage,
+                                                   '/'.join('%g' % i for i in self.currents))
+
+    def __repr__(self):
+        return str(self)
+
+    def current_limit(self, mask=0):
+        """
+        :param mask: маска каналов, 0 - без учета каналов
+        :return: максимальный ток, допустимый на всех каналах маски
+        """
+        return self._current_by_mask.get(mask, self.current)
+
+
+MODELS = {model.name: model for model in (
+    HMPModel('HMP2020', (10.0, 5.0)),
+    HMPModel('HMP2030', (5.0, 5.0, 5.0)),
+    HMPModel('HMP4030', (10.0, 10.0, 10.0)),
+    HMPModel('HMP4040', (10.0, 10.0, 10.0, 10.0)),
+)}
+
+
+def model_from_idn(reply):
+    """
+    :param reply: ответ *IDN? вида 'ROHDE&SCHWARZ,HMP4040,123456,HW50020001/SW2.51'
+    :return: HMPModel или None, если модель не известна
+    """
+    parts = reply.split(',')
+    if len(parts) < 2:
+        return None
+    return MODELS.get(parts[1].strip().upper())
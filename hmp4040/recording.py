@@ -0,0 +1,299 @@
+"""
+Запись сеансов обмена с ЛБП в компактный двоичный журнал, воспроизведение записанного сеанса и сводка по журналу.
+
+    python -m hmp4040.recording session.hmplog --top 10 --outliers 10
+
+Журнал пишется только дописыванием: сигнатура файла, затем записи с заголовком struct '<BQfI' (тип записи,
+микросекунды от начала сеанса, время от последней посылки до ответа в секундах, длина данных) и данными.
+Каждое подключение начинается записью SESSION с временем начала сеанса по часам UNIX.
+"""
+import argparse
+import socket
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+from .instrumentation import scpi_verb
+
+MAGIC = b'HMPLOG1\n'
+_HEADER = struct.Struct('<BQfI')
+_EPOCH = struct.Struct('<d')
+
+# Типы записей журнала
+SESSION, SENT, REPLY, TIMEOUT, CLOSED = range(5)
+KIND_NAMES = ('session', 'sent', 'reply', 'timeout', 'closed')
+
+# Запись журнала: тип, время от начала сеанса (с), задержка ответа (с), данные
+LogRecord = namedtuple('LogRecord', ['kind', 'time', 'latency', 'data'])
+
+
+class ReplayMismatch(Exception):
+    """
+    Драйвер отправил не то, что было записано в журнале
+    """
+
+
+def read_log(path):
+    """
+    :param path: путь к журналу
+    :return: генератор LogRecord; для записей SESSION data - время начала сеанса по часам UNIX
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not an HMP4040 session log' % path)
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            kind, offset, latency, length = _HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            if kind == SESSION:
+                data = _EPOCH.unpack(data)[0]
+            yield LogRecord(kind, offset / 1e6, latency, data)
+
+
+class RecordingTransport(object):
+    """
+    Обертка транспорта HMP4040 (SocketTransport), которая пишет в журнал каждую посылку, каждую строку ответа с
+    временем от посылки до ее получения, таймауты и закрытие соединения. Подключается методом
+    HMP4040.start_recording.
+    """
+    def __init__(self, inner, path):
+        """
+        :param inner: транспорт, через который идет обмен
+        :param path: путь к журналу; существующий журнал дописывается
+        """
+        self.inner = inner
+        self.path = path
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._sent_at = self._start
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    @property
+    def stale(self):
+        return self.inner.stale
+
+    @stale.setter
+    def stale(self, value):
+        self.inner.stale = value
+
+    @property
+    def connected(self):
+        return self.inner.connected
+
+    def _write(self, kind, data=b'', latency=0.0, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(_HEADER.pack(kind, int((now - self._start) * 1e6), latency, len(data)))
+            self._file.write(data)
+
+    def begin_session(self):
+        """
+        Отмечает в журнале начало сеанса: с этого места журнал воспроизводится драйвером, у которого не выбран ни один
+        канал
+        """
+        self._start = self._sent_at = time.monotonic()
+        self._write(SESSION, _EPOCH.pack(time.time()), now=self._start)
+
+    def connect(self, ip, port):
+        self.inner.connect(ip, port)
+        self.begin_session()
+
+    def close(self):
+        self.inner.close()
+        self._write(CLOSED)
+        self.flush()
+
+    def send(self, data):
+        self._sent_at = time.monotonic()
+        self.inner.send(data)
+        self._write(SENT, data, now=self._sent_at)
+
+    def read_line(self):
+        try:
+            line = self.inner.read_line()
+        except (socket.timeout, ConnectionError):
+            now = time.monotonic()
+            self._write(TIMEOUT, latency=now - self._sent_at, now=now)
+            self.flush()
+            raise
+        now = time.monotonic()
+        self._write(REPLY, line.encode(), now - self._sent_at, now)
+        return line
+
+    def discard_stale(self):
+        self.inner.discard_stale()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close_log(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ReplayTransport(object):
+    """
+    Транспорт, который вместо ЛБП отвечает записанным в журнале: HMP4040 с ним выполняет тот же код, что и в
+    записанном сеансе, и получает те же ответы и таймауты. При strict посылки драйвера сверяются с записанными.
+    hmp.transport = ReplayTransport('session.hmplog'); hmp.connect()
+    """
+    def __init__(self, path, strict=True, realtime=False):
+        """
+        :param path: путь к журналу
+        :param strict: выбрасывать ReplayMismatch, если посылка драйвера отличается от записанной
+        :param realtime: выдерживать записанные задержки ответов
+        """
+        self.path = path
+        self.strict = strict
+        self.realtime = realtime
+        self.stale = False
+        self.sock = None
+        self._records = deque(record for record in read_log(path) if record.kind in (SENT, REPLY, TIMEOUT))
+        self._connected = False
+        self._sent_at = time.monotonic()
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @property
+    def remaining(self):
+        """
+        :return: число еще не воспроизведенных записей
+        """
+        return len(self._records)
+
+    def connect(self, ip, port):
+        self._connected = True
+
+    def close(self):
+        self._connected = False
+
+    def send(self, data):
+        if not self._connected:
+            raise ConnectionError('not connected to HMP4040')
+        while self._records and self._records[0].kind != SENT:
+            self._records.popleft()
+        if not self._records:
+            raise ReplayMismatch('recorded session is over, got %r' % data)
+        record = self._records.popleft()
+        if self.strict and record.data != data:
+            raise ReplayMismatch('expected %r, got %r' % (record.data, data))
+        self._sent_at = time.monotonic()
+
+    def read_line(self):
+        if not self._records or self._records[0].kind == SENT:
+            raise ReplayMismatch('no recorded reply left for this request')
+        record = self._records.popleft()
+        if self.realtime:
+            delay = self._sent_at + record.latency - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if record.kind == TIMEOUT:
+            self.stale = True
+            raise socket.timeout('timed out (recorded)')
+        return record.data.decode()
+
+    def discard_stale(self):
+        self.stale = False
+
+
+def summarize(path, top=10, outliers=10):
+    """
+    Сводка по журналу: число посылок, команд, ответов и таймаутов, самые частые команды с задержкой ответа и самые
+    медленные ответы
+    :param path: путь к журналу
+    :param top: число команд в списке самых частых
+    :param outliers: число самых медленных ответов
+    :return: словарь со сводкой
+    """
+    counts = {}
+    latencies = {}
+    slowest = []
+    pending = deque()
+    summary = {'sessions': 0, 'sends': 0, 'commands': 0, 'replies': 0, 'timeouts': 0, 'duration_s': 0.0}
+    for record in read_log(path):
+        if record.kind == SESSION:
+            summary['sessions'] += 1
+            pending.clear()
+            continue
+        summary['duration_s'] = max(summary['duration_s'], record.time)
+        if record.kind == SENT:
+            summary['sends'] += 1
+            for line in record.data.decode(errors='replace').split('\n'):
+                if not line:
+                    continue
+                verb = scpi_verb(line)
+                summary['commands'] += 1
+                counts[verb] = counts.get(verb, 0) + 1
+                if line.find('?') != -1:
+                    pending.append((verb, line))
+        elif record.kind in (REPLY, TIMEOUT):
+            verb, line = pending.popleft() if pending else ('?', '?')
+            latencies.setdefault(verb, []).append(record.latency)
+            slowest.append((record.latency, record.time, line, record.kind == TIMEOUT))
+            summary['replies' if record.kind == REPLY else 'timeouts'] += 1
+        elif record.kind == CLOSED:
+            pending.clear()
+    hot = []
+    for verb, count in sorted(counts.items(), key=lambda item: -item[1])[:top]:
+        values = sorted(latencies.get(verb, ()))
+        hot.append({
+            'verb': verb,
+            'count': count,
+            'replies': len(values),
+            'mean_ms': 1000 * sum(values) / len(values) if values else None,
+            'p99_ms': 1000 * values[min(int(round(0.99 * (len(values) - 1))), len(values) - 1)] if values else None,
+            'max_ms': 1000 * values[-1] if values else None,
+        })
+    slowest.sort(reverse=True)
+    summary['hot_commands'] = hot
+    summary['outliers'] = [{'latency_ms': 1000 * latency, 'time_s': at, 'command': line, 'timeout': timeout}
+                           for latency, at, line, timeout in slowest[:outliers]]
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize an HMP4040 session log')
+    parser.add_argument('log', help='session log written by HMP4040.start_recording')
+    parser.add_argument('--top', type=int, default=10, help='number of most frequent commands')
+    parser.add_argument('--outliers', type=int, default=10, help='number of slowest replies')
+    args = parser.parse_args(argv)
+
+    summary = summarize(args.log, args.top, args.outliers)
+    print('%d sessions, %.3f s, %d sends, %d commands, %d replies, %d timeouts' % (
+        summary['sessions'], summary['duration_s'], summary['sends'], summary['commands'], summary['replies'],
+        summary['timeouts']))
+    print('\nhot commands:')
+    for row in summary['hot_commands']:
+        if row['replies']:
+            print('  %-28s %8d  mean %8.3f ms  p99 %8.3f ms  max %8.3f ms' % (
+                row['verb'], row['count'], row['mean_ms'], row['p99_ms'], row['max_ms']))
+        else:
+            print('  %-28s %8d' % (row['verb'], row['count']))
+    print('\nslowest replies:')
+    for row in summary['outliers']:
+        print('  %10.3f s  %8.3f ms  %s%s' % (row['time_s'], row['latency_ms'], row['command'],
+                                           '  (timeout)' if row['timeout'] else ''))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+# Состояние одного канала ЛБП, полученное за один опрос (см. HMP4040.snapshot)
+ChannelState = namedtuple('ChannelState', ['channel', 'voltage', 'current', 'output', 'ovp_tripped', 'fuse_tripped'])
+
+# Запись очереди ошибок SYST:ERR?
+SCPIErrorRecord = namedtuple('SCPIErrorRecord', ['code', 'message'])
+
+# Итог InstrumentConfig.apply: число отправленных команд (с выбором каналов и синхронизацией), число изменений
+# настроек и номер ячейки памяти, восстановленной командой *RCL, или None
+ConfigReport = namedtuple('ConfigReport', ['sent', 'changed', 'recalled'])
+
+# Статистика цикла регулирования (см. Regulator): число итераций, средний период и его разброс (СКО), наибольший
+# период, число итераций, период которых превысил заданный в полтора раза, и среднее время обмена с ЛБП, в секундах
+LoopStats = namedtuple('LoopStats', ['iterations', 'mean_period', 'jitter', 'max_period', 'overruns', 'mean_exchange'])
+
+# Изменение состояния защиты канала: kind - 'ovp' или 'fuse', tripped - сработала (True) или сброшена (False)
+ProtectionEvent = namedtuple('ProtectionEvent', ['channel', 'kind', 'tripped', 'time'])
+
+
+def parse_bool(reply):
+    """
+    :param reply: ответ ЛБП вида '1', '0', 'ON', 'OFF'
+    :return: истина, если ответ означает включенное состояние
+    """
+    return reply.strip().upper() in ('1', 'ON')
+
+
+def parse_float(reply):
+    return float(reply)
+
+
+def parse_int(reply):
+    """
+    :param reply: целое число, в том числе в записи с точкой ('10.000')
+    """
+    try:
+        return int(reply)
+    except ValueError:
+        return int(float(reply))
+
+
+def parse_str(reply):
+    return reply.strip()
+
+
+def parse_pair(reply):
+    """
+    :param reply: ответ на APPL? вида '5.000,1.0000'
+    :return: кортеж (напряжение, ток)
+    """
+    voltage, current = reply.split(',')
+    return float(voltage), float(current)
+
+
+def parse_error(reply):
+    """
+    :param reply: ответ на SYST:ERR? вида '-113,"Undefined header"'
+    :return: SCPIErrorRecord(код, текст)
+    """
+    code, _, message = reply.partition(',')
+    return SCPIErrorRecord(int(code), message.strip().strip('"'))
@@ -0,0 +1,427 @@
+"""
+Выполнение сценариев SCPI на одном или нескольких ЛБП одновременно.
+
+    python -m hmp4040.script setup.scpi --device 10.6.1.4 --device 10.6.1.5:5025 --var V=5
+    hmp4040-script setup.scpi --simulator --dry-run
+
+Без файла сценарий читается из стандартного ввода, а если ввод - терминал, строки выполняются по мере ввода
+(exit - выход). Язык сценария построчный, строка, начинающаяся с '#', - комментарий:
+
+    VOLT ${V + 0.5}          команда или запрос SCPI; ${выражение} подставляет значение арифметического выражения
+    on 1,2 VOLT ${V}; CURR 1  команды через ';' выполняются на каждом из каналов, канал выбирается только при смене
+    set V = 2 * V            переменная
+    for i in 1 2 3 ... end   цикл по значениям
+    for v from 0 to 5 step 0.5 ... end
+    repeat 3 ... end
+    wait 0.5                 дождаться выполнения отправленных команд и выждать 0.5 с
+    sync                     дождаться выполнения отправленных команд
+    call set_voltage 1,2 5   вызов метода HMP4040; аргумент с запятой передается списком
+    step setup               начало шага в отчете о времени
+
+Сценарий разворачивается до подключения: циклы и переменные вычисляются один раз, подряд идущие команды
+собираются в посылки не длиннее max_batch команд, каждая из которых завершается синхронизацией *OPC?. Задержка
+write_delay между командами не выдерживается.
+"""
+import argparse
+import ast
+import math
+import operator
+import re
+import sys
+import time
+from collections import namedtuple
+
+from .HMP4040 import HMP4040
+from .HMP4040Fleet import HMP4040Fleet
+from .HMP4040Simulator import HMP4040Simulator
+from .models import MODELS
+from .validation import normalize_channels
+
+# Время выполнения шага сценария: имя шага, число отправленных команд и посылок, длительность в секундах
+StepTiming = namedtuple('StepTiming', ['step', 'commands', 'batches', 'duration'])
+
+# Ответ на запрос или результат вызова call
+ScriptReply = namedtuple('ScriptReply', ['step', 'command', 'value'])
+
+_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+_SUBSTITUTION = re.compile(r'\$\{([^}]*)\}')
+_SET = re.compile(r'set\s+([A-Za-z_]\w*)\s*=?\s*(.+)$')
+_FOR_IN = re.compile(r'for\s+([A-Za-z_]\w*)\s+in\s+(.+)$')
+_FOR_RANGE = re.compile(r'for\s+([A-Za-z_]\w*)\s+from\s+(.+?)\s+to\s+(.+?)(?:\s+step\s+(.+))?$')
+_BLOCKS = ('for', 'repeat')
+_MAX_CHANNELS = max(model.channels for model in MODELS.values())
+
+
+class ScriptError(Exception):
+    """
+    Ошибка в тексте сценария
+    """
+    def __init__(self, lineno, message):
+        super().__init__('line %d: %s' % (lineno, message))
+        self.lineno = lineno
+
+
+def _evaluate(expr, variables, lineno):
+    """
+    Вычисляет арифметическое выражение над числами и переменными сценария
+    """
+    def visit(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id not in variables:
+                raise ScriptError(lineno, 'undefined variable %r' % node.id)
+            return variables[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](visit(node.operand))
+        raise ScriptError(lineno, 'unsupported expression %r' % expr)
+
+    try:
+        return visit(ast.parse(expr.strip(), mode='eval').body)
+    except (SyntaxError, TypeError, ZeroDivisionError) as exc:
+        raise ScriptError(lineno, '%s in %r' % (exc, expr))
+
+
+def _format(value):
+    return '%.10g' % value if isinstance(value, float) else str(value)
+
+
+def _literal(text):
+    """
+    :return: число, если text - число, иначе сам text
+    """
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _parse(lines):
+    """
+    :param lines: строки сценария
+    :return: дерево сценария: список узлов (номер строки, ключевое слово, аргументы[, тело])
+    """
+    root = []
+    stack = [(0, root)]
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        word = line.split(None, 1)[0]
+        rest = line[len(word):].strip()
+        if word == 'end':
+            if len(stack) == 1:
+                raise ScriptError(lineno, "'end' without a block")
+            stack.pop()
+            continue
+        if word in _BLOCKS:
+            if word == 'repeat':
+                args = (rest,)
+            else:
+                match = _FOR_RANGE.match(line) or _FOR_IN.match(line)
+                if match is None:
+                    raise ScriptError(lineno, 'expected "for NAME in VALUES" or "for NAME from A to B [step S]"')
+                args = match.groups()
+            body = []
+            stack[-1][1].append((lineno, word, args, body))
+            stack.append((lineno, body))
+        elif word == 'set':
+            match = _SET.match(line)
+            if match is None:
+                raise ScriptError(lineno, 'expected "set NAME = EXPRESSION"')
+            stack[-1][1].append((lineno, word, match.groups()))
+        elif word == 'on':
+            channels, _, cmds = rest.partition(' ')
+            if not cmds.strip() or ('$' not in channels and
+                                    normalize_channels([i for i in channels.split(',') if i], _MAX_CHANNELS) is None):
+                raise ScriptError(lineno, 'expected "on CHANNELS COMMAND[; COMMAND...]"')
+            stack[-1][1].append((lineno, word, (channels, cmds)))
+        elif word == 'call':
+            parts = rest.split()
+            if not parts or parts[0].startswith('_') or not callable(getattr(HMP4040, parts[0], None)):
+                raise ScriptError(lineno, 'unknown driver method %r' % rest)
+            stack[-1][1].append((lineno, word, (parts[0], parts[1:])))
+        elif word in ('wait', 'sync', 'step'):
+            stack[-1][1].append((lineno, word, (rest,)))
+        else:
+            stack[-1][1].append((lineno, 'scpi', (line,)))
+    if len(stack) > 1:
+        raise ScriptError(stack[-1][0], "block is not closed with 'end'")
+    return root
+
+
+class Script(object):
+    """
+    Развернутый сценарий: список шагов (имя, действия). Действия - посылки ('batch', [(канал или None, команда)]),
+    паузы ('wait', секунды) и вызовы методов ('call', имя, аргументы, текст).
+    """
+    def __init__(self, steps, max_batch=64):
+        self.steps = steps
+        self.max_batch = max_batch
+
+    @classmethod
+    def compile(cls, text, variables=None, max_batch=64):
+        """
+        :param text: текст сценария
+        :param variables: словарь начальных значений переменных; команды set его дополняют
+        :param max_batch: максимальное число команд в одной посылке
+        :return: Script
+        :raise ScriptError: при ошибке в тексте сценария
+        """
+        steps = [('main', [])]
+        cls._expand(_parse(text.splitlines()), {} if variables is None else variables, steps)
+        return cls([step for step in steps if step[1] or step[0] != 'main'], max_batch)
+
+    @classmethod
+    def _expand(cls, nodes, variables, steps):
+        for node in nodes:
+            lineno, word, args = node[:3]
+            actions = steps[-1][1]
+            substitute = lambda text: _SUBSTITUTION.sub(
+                lambda match: _format(_evaluate(match.group(1), variables, lineno)), text)
+            if word == 'scpi':
+                cls._command(actions, None, substitute(args[0]))
+            elif word == 'on':
+                checked = normalize_channels([i for i in substitute(args[0]).split(',') if i], _MAX_CHANNELS)
+                if checked is None:
+                    raise ScriptError(lineno, 'invalid channels %r' % substitute(args[0]))
+                cmds = [cmd.strip() for cmd in substitute(args[1]).split(';') if cmd.strip()]
+                for i in checked[0]:
+                    for cmd in cmds:
+                        cls._command(actions, i, cmd)
+            elif word == 'set':
+                variables[args[0]] = _evaluate(substitute(args[1]), variables, lineno)
+            elif word == 'wait':
+                seconds = _evaluate(substitute(args[0]), variables, lineno) if args[0] else 0.0
+                actions.append(('wait', float(seconds)))
+            elif word == 'sync':
+                actions.append(('wait', 0.0))
+            elif word == 'step':
+                steps.append((substitute(args[0]) or 'step %d' % len(steps), []))
+            elif word == 'call':
+                values = []
+                for arg in map(substitute, args[1]):
+                    values.append([i for i in arg.split(',') if i] if ',' in arg else _literal(arg))
+                text = ' '.join([args[0]] + [substitute(arg) for arg in args[1]])
+                actions.append(('call', args[0], values, text))
+            elif word == 'repeat':
+                count = _evaluate(substitute(args[0]), variables, lineno)
+                for _ in range(int(count)):
+                    cls._expand(node[3], variables, steps)
+            elif word == 'for':
+                for value in cls._values(args, variables, lineno, substitute):
+                    variables[args[0]] = value
+                    cls._expand(node[3], variables, steps)
+
+    @staticmethod
+    def _values(args, variables, lineno, substitute):
+        if len(args) == 2:
+            return [_evaluate(substitute(value), variables, lineno) for value in args[1].split()]
+        start, stop = (_evaluate(substitute(value), variables, lineno) for value in args[1:3])
+        step = _evaluate(substitute(args[3]), variables, lineno) if args[3] else 1
+        if not step:
+            raise ScriptError(lineno, 'loop step is zero')
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [start + k * step for k in range(max(count, 0))]
+
+    @staticmethod
+    def _command(actions, channel, cmd):
+        if not actions or actions[-1][0] != 'batch':
+            actions.append(('batch', []))
+        actions[-1][1].append((channel, cmd))
+
+    @property
+    def commands(self):
+        """
+        :return: число команд сценария без выбора каналов и синхронизации
+        """
+        return sum(len(action[1]) for _, actions in self.steps for action in actions if action[0] == 'batch')
+
+    def batches(self):
+        """
+        Разбивает посылки сценария на посылки не длиннее max_batch команд
+        :return: генератор (имя шага, действие); для посылок действие - ('batch', команды, запросы сценария)
+        """
+        for name, actions in self.steps:
+            for action in actions:
+                if action[0] != 'batch':
+                    yield name, action
+                    continue
+                events = action[1]
+                for start in range(0, len(events), self.max_batch):
+                    chunk = events[start:start + self.max_batch]
+                    yield name, ('batch', chunk, [cmd for channel, cmd in chunk if cmd.find('?') != -1])
+
+    @staticmethod
+    def _commands(hmp, action):
+        """
+        :return: команды посылки с выбором каналов и синхронизацией *OPC? в конце
+        """
+        cmds = hmp._event_commands(action[1])
+        if cmds[-1].find('?') == -1:
+            cmds.append('*OPC?')
+        return cmds
+
+    def run(self, hmp):
+        """
+        Выполняет сценарий
+        :param hmp: подключенный объект HMP4040
+        :return: пара (список StepTiming, список ScriptReply)
+        """
+        timings = []
+        replies = []
+        current = None
+        for name, action in self.batches():
+            if current is None or current[0] != name:
+                if current is not None:
+                    timings.append(StepTiming(current[0], current[1], current[2], time.monotonic() - current[3]))
+                current = [name, 0, 0, time.monotonic()]
+            if action[0] == 'batch':
+                with hmp.lock:
+                    cmds = self._commands(hmp, action)
+                    answers = hmp.send_batch(cmds)
+                replies.extend(ScriptReply(name, cmd, answer.strip()) for cmd, answer in zip(action[2], answers))
+                current[1] += len(cmds)
+                current[2] += 1
+            elif action[0] == 'wait':
+                if action[1] > 0:
+                    time.sleep(action[1])
+            else:
+                replies.append(ScriptReply(name, action[3], getattr(hmp, action[1])(*action[2])))
+        if current is not None:
+            timings.append(StepTiming(current[0], current[1], current[2], time.monotonic() - current[3]))
+        return timings, replies
+
+
+def _interactive(fleet, variables, max_batch):
+    """
+    Выполняет строки стандартного ввода по мере ввода; блоки for/repeat выполняются после закрывающего end
+    """
+    lines = []
+    depth = 0
+    while True:
+        try:
+            line = input('hmp4040> ' if not depth else '...      ')
+        except EOFError:
+            return
+        if line.strip() in ('exit', 'quit') and not depth:
+            return
+        words = line.split()
+        word = words[0] if words else ''
+        depth += (word in _BLOCKS) - (word == 'end')
+        lines.append(line)
+        if depth > 0:
+            continue
+        depth = 0
+        try:
+            script = Script.compile('\n'.join(lines), variables, max_batch)
+        except ScriptError as exc:
+            print(exc)
+            lines = []
+            continue
+        lines = []
+        for key, result in fleet.run(script.run).items():
+            if result.error is not None:
+                print('%-21s error: %s' % (key, result.error))
+            else:
+                for reply in result.value[1]:
+                    print('%-21s %s' % (key, reply.value))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run SCPI scripts on one or several HMP power supplies')
+    parser.add_argument('script', nargs='?', help='script file, "-" or nothing to read standard input')
+    parser.add_argument('-d', '--device', action='append', default=[], help='supply address ip[:port]')
+    parser.add_argument('-D', '--var', action='append', default=[], help='variable NAME=VALUE')
+    parser.add_argument('--max-batch', type=int, default=64, help='commands per batch')
+    parser.add_argument('--simulator', action='store_true', help='also run on a local HMP4040Simulator')
+    parser.add_argument('--dry-run', action='store_true', help='print compiled batches without connecting')
+    args = parser.parse_args(argv)
+
+    variables = {}
+    for item in args.var:
+        name, _, value = item.partition('=')
+        variables[name.strip()] = _literal(value.strip())
+    interactive = args.script is None and sys.stdin.isatty()
+    script = None
+    if not interactive:
+        if args.script in (None, '-'):
+            text = sys.stdin.read()
+        else:
+            with open(args.script) as f:
+                text = f.read()
+        try:
+            script = Script.compile(text, variables, args.max_batch)
+        except ScriptError as exc:
+            parser.exit(2, '%s: %s\n' % (args.script or '<stdin>', exc))
+
+    if args.dry_run:
+        if script is not None:
+            offline = HMP4040()
+            for name, action in script.batches():
+                if action[0] == 'batch':
+                    cmds = script._commands(offline, action)
+                    for cmd in cmds:
+                        offline._track_state(cmd)
+                    print('%-16s %s' % (name, ' | '.join(cmds)))
+                elif action[0] == 'wait':
+                    print('%-16s wait %g' % (name, action[1]))
+                else:
+                    print('%-16s call %s' % (name, action[3]))
+        return 0
+    if not args.device and not args.simulator:
+        parser.error('no supplies: use --device or --simulator')
+
+    simulator = None
+    fleet = HMP4040Fleet(timeout=None)
+    for device in args.device:
+        ip, _, port = device.partition(':')
+        fleet.add(ip, port or '5025')
+    if args.simulator:
+        simulator = HMP4040Simulator()
+        fleet.add(*simulator.start())
+    failed = 0
+    try:
+        for key, result in fleet.connect().items():
+            if result.error is not None or not result.value:
+                print('%-21s cannot connect: %s' % (key, result.error))
+                failed += 1
+        if interactive:
+            _interactive(fleet, variables, args.max_batch)
+            return failed
+        results = fleet.run(script.run)
+        for key, result in results.items():
+            if result.error is not None:
+                print('%-21s error: %s' % (key, result.error))
+                failed += 1
+                continue
+            for reply in result.value[1]:
+                print('%-21s %-16s %s -> %s' % (key, reply.step, reply.command, reply.value))
+        print('\n%-21s %-16s %8s %8s %12s' % ('device', 'step', 'commands', 'batches', 'time, ms'))
+        for key, result in results.items():
+            for timing in result.value[0] if result.error is None else ():
+                print('%-21s %-16s %8d %8d %12.1f' % (key, timing.step, timing.commands, timing.batches,
+                                                      1000 * timing.duration))
+    finally:
+        fleet.close()
+        if simulator is not None:
+            simulator.stop()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
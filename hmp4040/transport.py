@@ -0,0 +1,94 @@
+import socket
+
+
+class SocketTransport(object):
+    """
+    TCP-соединение с ЛБП: отправка посылок и чтение строк ответа через буфер приема. Ответ, пришедший несколькими
+    сегментами, собирается целиком; байты после терминатора (склеенные ответы) остаются в буфере для следующего
+    чтения.
+    """
+    def __init__(self, connect_timeout=1.0, read_timeout=1.0, keepalive=True):
+        """
+        :param connect_timeout: таймаут установки соединения, в секундах
+        :param read_timeout: таймаут ожидания ответа, в секундах
+        :param keepalive: включить TCP keep-alive, чтобы обрыв связи обнаруживался без обмена командами
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive = keepalive
+        self.sock = None
+        self.stale = False
+        self._rx = bytearray()
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def connect(self, ip, port):
+        """
+        :raise OSError: если соединение установить не удалось
+        """
+        self.close()
+        sock = socket.create_connection((ip, int(port)), self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for option, value in (('TCP_KEEPIDLE', 10), ('TCP_KEEPINTVL', 5), ('TCP_KEEPCNT', 3)):
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        sock.settimeout(self.read_timeout)
+        self.sock = sock
+        self.stale = False
+        self._rx = bytearray()
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+    def send(self, data):
+        if self.sock is None:
+            raise ConnectionError('not connected to HMP4040')
+        self.sock.sendall(data)
+
+    def read_line(self):
+        """
+        Читает одну строку ответа до терминатора '\\n'. Поиск терминатора продолжается с места, где он закончился
+        в прошлый раз, поэтому длинные ответы не просматриваются повторно.
+        :return: строка ответа вместе с завершающим '\\n'
+        """
+        start = 0
+        end = self._rx.find(b'\n')
+        while end == -1:
+            start = len(self._rx)
+            try:
+                chunk = self.sock.recv(4096)
+            except socket.timeout:
+                self.stale = True
+                raise
+            if not chunk:
+                self.close()
+                raise ConnectionError('connection closed by HMP4040')
+            self._rx += chunk
+            end = self._rx.find(b'\n', start)
+        received_data = self._rx[:end + 1].decode()
+        del self._rx[:end + 1]
+        return received_data
+
+    def discard_stale(self):
+        """
+        Сбрасывает опоздавшие ответы, пришедшие после истечения таймаута предыдущего запроса, чтобы они не были
+        приняты за ответ на следующий запрос
+        """
+        self._rx = bytearray()
+        self.sock.setblocking(False)
+        try:
+            while self.sock.recv(4096):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.sock.settimeout(self.read_timeout)
+        self.stale = False
@@ -0,0 +1,67 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def _normalize(key, count):
+    channels = []
+    mask = 0
+    for i in key:
+        try:
+            n = int(i)
+        except (TypeError, ValueError):
+            return None
+        if not 1 <= n <= count:
+            return None
+        channels.append(str(n))
+        mask |= 1 << n
+    return tuple(channels), mask
+
+
+def normalize_channels(channels_, count=4):
+    """
+    Проверяет список каналов и приводит его к каноническому виду. Результат кэшируется, поэтому повторные вызовы с
+    тем же списком не разбирают его заново.
+    :param channels_: список номеров каналов (строки или числа)
+    :param count: число каналов модели
+    :return: пара (кортеж номеров каналов строками в исходном порядке, маска с битом n для канала n) или None,
+    если в списке есть недопустимый канал
+    """
+    try:
+        return _normalize(tuple(channels_), count)
+    except TypeError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def mask_channels(mask):
+    """
+    :return: кортеж номеров каналов маски строками по возрастанию, без повторов
+    """
+    return tuple(str(n) for n in range(1, mask.bit_length()) if mask >> n & 1)
+
+
+def format_number(value, high, fmt='%.3f'):
+    """
+    Проверяет, что значение лежит в диапазоне [0, high], и форматирует его для команды SCPI
+    :param value: значение (строка или число)
+    :param high: верхний предел
+    :param fmt: формат строки
+    :return: строка для команды или None, если значение некорректно
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= number <= high:
+        return None
+    return fmt % number
+
+
+def format_integer(value, high):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= number <= high:
+        return None
+    return str(number)
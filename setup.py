@@ -8,4 +8,5 @@ setup(name='HMP4040',
       author_email='crinitusfeles@gmail.com',
       license='MIT',
       packages=['hmp4040'],
+      entry_points={'console_scripts': ['hmp4040-script = hmp4040.script:main']},
       zip_safe=False)
\ No newline at end of file
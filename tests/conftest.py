@@ -0,0 +1,34 @@
+import pytest
+
+from hmp4040 import HMP4040, HMP4040Simulator
+
+
+@pytest.fixture(scope='module')
+def simulator():
+    with HMP4040Simulator() as simulator:
+        yield simulator
+
+
+@pytest.fixture
+def sim(simulator):
+    simulator.reset()
+    return simulator
+
+
+@pytest.fixture
+def hmp(sim):
+    supply = HMP4040()
+    supply.write_delay = 0
+    supply.backoff_base = 0.01
+    assert supply.connect(*sim.address)
+    supply.enable_stats()
+    yield supply
+    supply.disconnect()
+
+
+@pytest.fixture
+def sent(hmp):
+    """
+    :return: функция, возвращающая число отправленных на ЛБП команд
+    """
+    return lambda: sum(hmp.stats.commands.values())
@@ -0,0 +1,76 @@
+import math
+
+import pytest
+
+from hmp4040 import HMP4040, HMP4040Simulator
+from hmp4040.arbitrary import ARB_MAX_POINTS, arbitrary_digest, format_arbitrary
+
+
+def test_format_points():
+    assert format_arbitrary([(1, 0.5, 0.01), (2.5, 1, 60)]) == '1.000,0.5000,0.01,2.500,1.0000,60.00'
+
+
+@pytest.mark.parametrize('points', [
+    [],
+    [(1, 1)],
+    [(1, 1, 1)] * (ARB_MAX_POINTS + 1),
+    [(-1, 1, 1)],
+    [(31, 1, 1)],
+    [(1, 11, 1)],
+    [(1, 1, 0.001)],
+    [(1, 1, 61)],
+    [(math.nan, 1, 1), (1, 1, 1)],
+    [(1, math.inf, 1)],
+    [(1, 1, math.nan)],
+])
+def test_format_rejects_invalid_points(points):
+    with pytest.raises(ValueError):
+        format_arbitrary(points)
+
+
+def test_format_numpy_table():
+    numpy = pytest.importorskip('numpy')
+    table = numpy.array([[1, 0.5, 0.01], [2.5, 1, 60]])
+    assert format_arbitrary(table) == format_arbitrary(table.tolist())
+    assert format_arbitrary(table.ravel()) == format_arbitrary(table.tolist())
+    table[0, 0] = numpy.nan
+    with pytest.raises(ValueError):
+        format_arbitrary(table)
+
+
+def test_digest_depends_on_content():
+    assert arbitrary_digest('1.000,1.0000,1.00') == arbitrary_digest('1.000,1.0000,1.00')
+    assert arbitrary_digest('1.000,1.0000,1.00') != arbitrary_digest('1.000,1.0000,2.00')
+
+
+def test_upload_is_cached_per_channel(hmp):
+    points = [(1, 1, 1), (2, 1, 1)]
+    assert hmp.upload_arbitrary_sequence(['1', '2'], points) == ['1', '2']
+    assert hmp.upload_arbitrary_sequence(['1', '2', '3'], points) == ['3']
+    assert hmp.stats.commands['ARB:DATA'] == 3
+    assert hmp.upload_arbitrary_sequence(['1'], [(3, 1, 1)]) == ['1']
+    hmp.clear_arbitrary_data(['2'])
+    assert hmp.upload_arbitrary_sequence(['1', '2'], [(3, 1, 1)]) == ['2']
+    hmp.send_command('*RST')
+    assert hmp.upload_arbitrary_sequence(['1'], [(3, 1, 1)]) == ['1']
+
+
+def test_upload_rejects_invalid_table(hmp, sent):
+    before = sent()
+    assert hmp.upload_arbitrary_sequence(['1'], [(math.nan, 1, 1)]) is False
+    assert hmp.upload_arbitrary_sequence(['5'], [(1, 1, 1)]) is False
+    assert sent() == before
+
+
+def test_upload_uses_model_limits():
+    with HMP4040Simulator(model='HMP2030', channels=3) as sim:
+        supply = HMP4040()
+        supply.connect(*sim.address)
+        try:
+            supply.detect_model()
+            assert supply.upload_arbitrary_sequence(['1'], [(5, 10, 1)]) is False
+            assert supply.upload_arbitrary_sequence(['1'], [(5, 5, 1)]) == ['1']
+            assert supply.upload_arbitrary_sequence(['2'], [(32.05, 1, 1)]) == ['2']
+            assert supply.upload_arbitrary_sequence(['2'], [(32.1, 1, 1)]) is False
+        finally:
+            supply.disconnect()
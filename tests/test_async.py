@@ -0,0 +1,115 @@
+import asyncio
+import socket
+
+import pytest
+
+from hmp4040 import AsyncHMP4040
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run(sim, scenario):
+    async def main():
+        supply = AsyncHMP4040()
+        supply.write_delay = 0
+        assert await supply.connect(*sim.address)
+        try:
+            return await scenario(supply)
+        finally:
+            await supply.disconnect()
+    return asyncio.run(main())
+
+
+def test_fuse_links_select_source_channel(sim):
+    async def scenario(supply):
+        await supply.select_on_channel(['3'])
+        assert await supply.set_link_fuse('1', ['2']) is True
+        assert await supply.get_link_fuse('1', ['2', '3']) == [True, False]
+        assert await supply.get_link_fuse('3', ['2']) == [False]
+        assert await supply.unlink_fuse('1', ['2']) is True
+        return await supply.get_link_fuse('1', ['2'])
+    assert run(sim, scenario) == [False]
+
+
+def test_connect_failure():
+    async def main():
+        supply = AsyncHMP4040(connect_timeout=0.5)
+        return await supply.connect('127.0.0.1', closed_port()), supply.connectionStatus
+    assert asyncio.run(main()) == (False, False)
+
+
+def test_channel_commands(sim):
+    async def scenario(supply):
+        assert await supply.set_voltage(['1', '3'], 5) is True
+        assert await supply.set_voltage(['9'], 5) is False
+        return await supply.get_voltage(['1', '2', '3'])
+    assert run(sim, scenario) == [5.0, 0.0, 5.0]
+
+
+def test_pipeline_sends_one_packet(sim):
+    async def scenario(supply):
+        supply.enable_stats()
+        async with supply.pipeline():
+            await supply.check_sound()
+            await supply.set_voltage(['1', '2'], 3)
+            await supply.set_current(['2'], 0.5)
+            assert supply.stats.exchanges == 0
+        assert supply.stats.exchanges == 1
+        return await supply.get_voltage(['1', '2']), await supply.get_current(['2'])
+    assert run(sim, scenario) == ([3.0, 3.0], [0.5])
+
+
+def test_pipeline_discards_on_exception(sim):
+    async def scenario(supply):
+        with pytest.raises(RuntimeError):
+            async with supply.pipeline():
+                await supply.set_voltage(['1'], 7)
+                raise RuntimeError('abort')
+        return await supply.get_voltage(['1'])
+    assert run(sim, scenario) == [0.0]
+
+
+def test_pipeline_holds_connection(sim):
+    async def scenario(supply):
+        order = []
+
+        async def other():
+            await supply.set_voltage(['2'], 2)
+            order.append('other')
+
+        async with supply.pipeline():
+            task = asyncio.ensure_future(other())
+            await asyncio.sleep(0.05)
+            await supply.set_voltage(['1'], 1)
+            order.append('pipeline')
+        await task
+        return order, await supply.get_voltage(['1', '2'])
+    assert run(sim, scenario) == (['pipeline', 'other'], [1.0, 2.0])
+
+
+def test_setpoint_cache(sim):
+    async def scenario(supply):
+        supply.enable_stats()
+        supply.enable_setpoint_cache()
+        await supply.set_voltage(['1'], 4)
+        before = sum(supply.stats.commands.values())
+        assert await supply.get_voltage(['1']) == [4.0]
+        assert sum(supply.stats.commands.values()) == before
+        assert await supply.get_voltage(['1', '2']) == [4.0, 0.0]
+        assert await supply.get_voltage(['2']) == [0.0]
+        assert supply.setpoint_cache.hits == 3
+        await supply.reset_hmp4040()
+        return len(supply.setpoint_cache)
+    assert run(sim, scenario) == 0
+
+
+def test_recording_is_rejected(tmp_path):
+    supply = AsyncHMP4040()
+    with pytest.raises(RuntimeError):
+        supply.start_recording(str(tmp_path / 'session.bin'))
+    with pytest.raises(RuntimeError):
+        supply.stop_recording()
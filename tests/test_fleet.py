@@ -0,0 +1,71 @@
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from hmp4040 import HMP4040Fleet, HMP4040Simulator
+
+
+@pytest.fixture
+def fleet():
+    with HMP4040Simulator() as first, HMP4040Simulator() as second:
+        fleet = HMP4040Fleet([first.address, second.address], timeout=2)
+        for device in fleet.devices.values():
+            device.write_delay = 0
+        assert all(result.value is True for result in fleet.connect().values())
+        yield fleet
+        fleet.close()
+
+
+def test_methods_run_on_every_device(fleet):
+    results = fleet.set_voltage(['1'], 5)
+    assert [result for result in results.values()] == [(True, None)] * 2
+    assert list(results) == list(fleet.devices)
+    assert [result.value for result in fleet.get_voltage(['1']).values()] == [[5.0], [5.0]]
+    with pytest.raises(AttributeError):
+        fleet.no_such_method()
+
+
+def test_devices_run_in_parallel(fleet):
+    barrier = threading.Barrier(len(fleet), timeout=1)
+
+    def operation(device):
+        barrier.wait()
+        return device.get_voltage(['1'])
+    results = fleet.run(operation)
+    assert [result.error for result in results.values()] == [None, None]
+
+
+def test_errors_are_reported_per_device(fleet):
+    failing = list(fleet.devices)[0]
+
+    def operation(device):
+        if device is fleet.devices[failing]:
+            raise ValueError('broken')
+        return device.get_voltage(['2'])
+    results = fleet.run(operation)
+    assert isinstance(results[failing].error, ValueError)
+    assert results[failing].value is None
+    assert [result for key, result in results.items() if key != failing] == [([0.0], None)]
+
+
+def test_timeout_and_busy_devices(fleet):
+    slow = list(fleet.devices)[1]
+    release = threading.Event()
+
+    def operation(device):
+        if device is fleet.devices[slow]:
+            release.wait(2)
+        return True
+    start = time.monotonic()
+    results = fleet.run(operation, timeout=0.1)
+    assert time.monotonic() - start < 1
+    assert isinstance(results[slow].error, TimeoutError)
+    assert 'did not answer' in str(results[slow].error)
+    results = fleet.run(lambda device: True)
+    assert 'still busy' in str(results[slow].error)
+    assert [result for key, result in results.items() if key != slow] == [(True, None)]
+    release.set()
+    fleet._busy[slow].result(1)
+    assert all(result == (True, None) for result in fleet.run(lambda device: True).values())
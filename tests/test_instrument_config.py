@@ -0,0 +1,89 @@
+import pytest
+
+from hmp4040 import HMP4040, ChannelConfig, InstrumentConfig
+
+
+def test_diff_order():
+    current = InstrumentConfig({
+        '1': ChannelConfig(voltage=5, ovp=10, output=True),
+        '2': ChannelConfig(voltage=5, current=1, ovp=10, output=False),
+        '3': ChannelConfig(voltage=5, ovp=10, output=True),
+    }, output=True)
+    target = InstrumentConfig({
+        '1': ChannelConfig(output=False),
+        '2': ChannelConfig(voltage=15, current=2, ovp=20, output=True),
+        '3': ChannelConfig(voltage=2, ovp=3),
+    }, output=True)
+    assert target.diff(HMP4040(), current) == [
+        ('1', 'OUTP:SEL 0'),
+        ('2', 'VOLT:PROT 20.000'),
+        ('2', 'APPL 15.000,2.0000'),
+        ('3', 'VOLT 2.000'),
+        ('3', 'VOLT:PROT 3.000'),
+        ('2', 'OUTP:SEL 1'),
+    ]
+
+
+def test_diff_general_output_and_unknown_fields():
+    target = InstrumentConfig({'1': ChannelConfig(fuse=True, fuse_links=['2'])}, output=False)
+    current = InstrumentConfig({'1': ChannelConfig(fuse=True)}, output=True)
+    assert target.diff(HMP4040(), current) == [
+        (None, 'OUTP:GEN 0'), ('1', 'FUSE:LINK 2'), ('1', 'FUSE:UNL 3'), ('1', 'FUSE:UNL 4'),
+    ]
+    assert InstrumentConfig(output=True).diff(HMP4040(), InstrumentConfig()) == [(None, 'OUTP:GEN 1')]
+
+
+@pytest.mark.parametrize('config', [
+    {'1': {'voltage': 99}},
+    {'1': {'ovp_mode': 'LOW'}},
+    {'1': {'fuse_links': ['1']}},
+    {'9': {'voltage': 1}},
+])
+def test_diff_rejects_invalid_values(config):
+    assert InstrumentConfig(config).diff(HMP4040(), InstrumentConfig()) is None
+
+
+def test_apply_sends_only_changes(hmp, sim):
+    config = InstrumentConfig({'1': {'voltage': 3, 'current': 0.5, 'output': True},
+                               '2': {'ovp': 12, 'fuse_links': ['3']}}, output=True)
+    report = config.apply(hmp)
+    assert report.changed == 5
+    assert report.recalled is None
+    assert (sim.channels[0].voltage, sim.channels[0].current, sim.channels[0].selected) == (3, 0.5, True)
+    assert sim.channels[1].ovp == 12 and sim.channels[1].links == {3}
+    assert sim.output
+    assert config.apply(hmp) == (0, 0, None)
+    assert InstrumentConfig.read(hmp, ['1'], ['voltage', 'output']) == \
+        InstrumentConfig({'1': {'voltage': 3.0, 'output': True}}, output=True)
+
+
+def test_apply_recalls_cheapest_slot(hmp, sim):
+    wide = {str(i): {'voltage': i, 'current': 0.5, 'ovp': 20, 'fuse_delay': 5 * i} for i in range(1, 5)}
+    stored = InstrumentConfig(wide)
+    assert stored.store(hmp, 3)
+    InstrumentConfig({str(i): {'voltage': 0} for i in range(1, 5)}).store(hmp, 4)
+    assert sorted(hmp.memory_slots) == [3, 4]
+    hmp.reset_hmp4040()
+    report = stored.apply(hmp)
+    assert report.recalled == 3
+    assert report.changed == 0
+    assert [channel.voltage for channel in sim.channels] == [1, 2, 3, 4]
+    assert [channel.fuse_delay for channel in sim.channels] == [5, 10, 15, 20]
+    assert InstrumentConfig.read(hmp, fields=['voltage']).channels['4'].voltage == 4.0
+
+
+def test_store_rejects_invalid_slot(hmp):
+    assert InstrumentConfig({'1': {'voltage': 1}}).store(hmp, 10) is False
+    assert hmp.memory_slots == {}
+
+
+def test_dump_and_load(tmp_path):
+    config = InstrumentConfig({1: ChannelConfig(voltage=1.5, ovp_mode='meas', fuse_links=[3, 2]),
+                               '2': {'output': False}}, output=True)
+    path = str(tmp_path / 'config.json')
+    config.dump(path)
+    loaded = InstrumentConfig.load(path)
+    assert loaded == config
+    assert loaded.channels['1'].fuse_links == ('2', '3')
+    assert loaded.channels['1'].ovp_mode == 'MEAS'
+    assert loaded.channels['2'].voltage is None
@@ -0,0 +1,82 @@
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from hmp4040 import HMP4040, HMP4040Simulator, MetricsExporter, SharedHMP4040
+
+
+def scrape(exporter, path='/metrics'):
+    with urllib.request.urlopen('http://%s:%d%s' % (exporter.address + (path,)), timeout=5) as response:
+        assert response.headers['Content-Type'].startswith('text/plain')
+        return response.read().decode()
+
+
+def samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_metric_families(hmp, sim):
+    sim.channels[0].load = 10.0
+    hmp.set_channel_params(['1'], 5, 1)
+    hmp.select_on_channel(['1'])
+    hmp.turn_on_selected_channels()
+    hmp.send_command('FOO')
+    with MetricsExporter({'psu': hmp}, port=0, max_age=0) as exporter:
+        text = scrape(exporter)
+    for family in ('up', 'polls_total', 'poll_failures_total', 'general_output_enabled', 'voltage_volts',
+                   'current_amperes', 'output_enabled', 'ovp_tripped', 'fuse_tripped', 'scpi_errors_total'):
+        assert '# TYPE hmp4040_%s ' % family in text
+    assert text.count('# TYPE hmp4040_voltage_volts ') == 1
+    values = samples(text)
+    assert values['hmp4040_up{device="psu"}'] == '1'
+    assert values['hmp4040_general_output_enabled{device="psu"}'] == '1'
+    assert float(values['hmp4040_voltage_volts{device="psu",channel="1"}']) == 5.0
+    assert float(values['hmp4040_current_amperes{device="psu",channel="1"}']) == 0.5
+    assert values['hmp4040_output_enabled{device="psu",channel="2"}'] == '0'
+    assert values['hmp4040_scpi_errors_total{device="psu",code="-113"}'] == '1'
+    assert values['hmp4040_scpi_last_error_code{device="psu"}'] == '-113'
+
+
+def test_unknown_path(hmp):
+    with MetricsExporter([hmp], port=0) as exporter:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            scrape(exporter, '/')
+    assert error.value.code == 404
+
+
+def test_concurrent_scrapes_poll_once():
+    with HMP4040Simulator(latency=0.01) as sim:
+        supply = HMP4040()
+        supply.connect(*sim.address)
+        try:
+            with MetricsExporter([supply], port=0, max_age=60) as exporter:
+                barrier = threading.Barrier(8)
+                texts = []
+
+                def worker():
+                    barrier.wait()
+                    texts.append(scrape(exporter))
+                threads = [threading.Thread(target=worker) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                assert len(texts) == 8
+                assert exporter.devices[0].polls == 1
+                assert exporter.scrapes == 8
+                assert all('hmp4040_polls_total{device="%s:%s"} 1' % sim.address in text for text in texts)
+        finally:
+            supply.disconnect()
+
+
+def test_shared_devices_and_failures(hmp):
+    with SharedHMP4040(hmp) as shared, MetricsExporter({'shared': shared}, port=0, max_age=0) as exporter:
+        assert samples(scrape(exporter))['hmp4040_up{device="shared"}'] == '1'
+        hmp.auto_reconnect = False
+        hmp.transport.sock.close()
+        values = samples(scrape(exporter))
+    assert values['hmp4040_up{device="shared"}'] == '0'
+    assert values['hmp4040_poll_failures_total{device="shared"}'] == '1'
+    assert 'hmp4040_voltage_volts{device="shared",channel="1"}' in values
@@ -0,0 +1,47 @@
+import pytest
+
+from hmp4040.records import (ChannelState, SCPIErrorRecord, parse_bool, parse_error, parse_float, parse_int,
+                             parse_pair, parse_str)
+
+
+@pytest.mark.parametrize('reply, value', [('1\n', True), ('ON', True), ('on\n', True), ('0\n', False),
+                                          ('OFF', False)])
+def test_parse_bool(reply, value):
+    assert parse_bool(reply) is value
+
+
+def test_parse_numbers():
+    assert parse_float('5.000\n') == 5.0
+    assert parse_int('10\n') == 10
+    assert parse_int('10.000\n') == 10
+    assert parse_str(' 1.1\n') == '1.1'
+    assert parse_pair('5.000,1.0000\n') == (5.0, 1.0)
+
+
+def test_parse_error():
+    assert parse_error('-113,"Undefined header"\n') == SCPIErrorRecord(-113, 'Undefined header')
+    assert parse_error('0,"No error"') == SCPIErrorRecord(0, 'No error')
+
+
+def test_getters_return_typed_values(hmp):
+    assert hmp.set_channel_params(['1', '2'], '5.0', '0.5') is True
+    assert hmp.get_voltage(['1', '2']) == [5.0, 5.0]
+    assert hmp.get_current(['1']) == [0.5]
+    assert hmp.get_channel_params(['2']) == [(5.0, 0.5)]
+    assert hmp.set_fuse_delay(['1'], 100) is True
+    assert hmp.get_fuse_delay(['1']) == [100]
+    assert hmp.is_output_turned_on() is False
+    assert hmp.get_active_channel(['1']) == [False]
+    assert hmp.get_errors() == SCPIErrorRecord(0, 'No error')
+
+
+def test_snapshot(hmp):
+    hmp.set_channel_params(['3'], '2.0', '1.0')
+    hmp.select_on_channel(['3'])
+    hmp.turn_on_selected_channels()
+    state, = hmp.snapshot(['3'])
+    assert isinstance(state, ChannelState)
+    assert state.channel == 3
+    assert state.output is True
+    assert state.ovp_tripped is False and state.fuse_tripped is False
+    assert state.voltage == pytest.approx(2.0, abs=0.05)
@@ -0,0 +1,77 @@
+import pytest
+
+from hmp4040 import Delay, Output, PowerSequence, Ramp, Set, WaitFor
+
+
+def commands(compiled):
+    return [(offset, tick) for events, _ in compiled for offset, tick in events]
+
+
+def test_set_and_output_share_one_batch(hmp):
+    compiled = PowerSequence([Set(1, voltage=5, current=0.5), Set('2', voltage=3), Output(['1', '2'])]).compile(hmp)
+    assert commands(compiled) == [(0.0, [('1', 'APPL 5.000,0.5000'), ('2', 'VOLT 3.000'), ('1', 'OUTP:SEL 1'),
+                                         ('2', 'OUTP:SEL 1'), (None, 'OUTP:GEN 1')])]
+
+
+def test_schedule_follows_after(hmp):
+    plan = PowerSequence([Set('1', voltage=1, name='a'), Delay(0.1, name='d'), Set('2', voltage=2, after='d'),
+                          Set('3', voltage=3, after=())])
+    assert [(offset, [cmd for _, cmd in tick]) for offset, tick in commands(plan.compile(hmp))] == [
+        (0.0, ['VOLT 1.000', 'VOLT 3.000']), (0.1, ['VOLT 2.000'])]
+
+
+def test_ramp_with_start_steps_from_start_and_restores_step(hmp):
+    hmp.set_voltage(['1'], '3.0')
+    plan = PowerSequence([Ramp('1', 5.0, 0.2, start=0.0, resolution=0.05)])
+    events = commands(plan.compile(hmp))
+    assert events[0] == (0.0, [('1', 'VOLT 0.000'), ('1', 'VOLT:STEP 1.250')])
+    assert [tick for _, tick in events[1:4]] == [[('1', 'VOLT UP')]] * 3
+    assert events[-1] == (0.2, [('1', 'VOLT 5.000'), ('1', 'VOLT:STEP 1.000')])
+    plan.run(hmp)
+    assert hmp.get_voltage(['1']) == [5.0]
+    assert hmp.stats.commands['VOLT:STEP'] == 2
+    hmp.invalidate_setpoints()
+    assert hmp.get_step_voltage() == 1.0
+
+
+def test_ramp_without_start_reads_channel(hmp):
+    hmp.set_voltage(['2'], '4.0')
+    plan = PowerSequence([Ramp('2', 2.0, 0.1, resolution=0.05)])
+    events = commands(plan.compile(hmp))
+    assert events[0] == (0.0, [('2', 'VOLT:STEP 1.000')])
+    assert events[1] == (0.05, [('2', 'VOLT DOWN')])
+
+
+def test_parallel_ramps_use_absolute_values(hmp):
+    plan = PowerSequence([Ramp('1', 2.0, 0.1, start=0, resolution=0.05),
+                          Ramp('2', 4.0, 0.1, start=0, resolution=0.05, after=())])
+    assert commands(plan.compile(hmp)) == [
+        (0.0, [('1', 'VOLT 0.000'), ('2', 'VOLT 0.000')]),
+        (0.05, [('1', 'VOLT 1.000'), ('2', 'VOLT 2.000')]),
+        (0.1, [('1', 'VOLT 2.000'), ('2', 'VOLT 4.000')])]
+
+
+@pytest.mark.parametrize('step', [Set('9', voltage=1), Set('1', voltage=99), Set('1', current=11),
+                                  Ramp('1', 40, 1), Ramp('1', 5, 1, start=-1), Output(['1', '5']),
+                                  WaitFor('0')])
+def test_compile_rejects_invalid_steps(hmp, sent, step):
+    before = sent()
+    with pytest.raises(ValueError):
+        PowerSequence([step]).compile(hmp)
+    assert sent() == before
+
+
+def test_wait_for_measured_voltage(hmp):
+    plan = PowerSequence([Set('1', voltage=2.0, current=1.0), Output(['1']),
+                          WaitFor('1', target=2.0, tolerance=0.1, timeout=1.0), Set('2', voltage=1.0)])
+    compiled = plan.compile(hmp)
+    assert [wait is not None for _, wait in compiled] == [True, False]
+    report = plan.run(hmp)
+    assert report.batches >= 4
+    assert hmp.get_voltage(['2']) == [1.0]
+
+
+def test_wait_for_times_out(hmp):
+    plan = PowerSequence([Set('1', voltage=2.0), WaitFor('1', target=2.0, timeout=0.05, poll=0.01)])
+    with pytest.raises(TimeoutError):
+        plan.run(hmp)
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from hmp4040 import ProtectionMonitor
+
+
+@pytest.fixture
+def powered(hmp):
+    hmp.set_overvoltage_protection_value(['1', '2'], 5)
+    hmp.set_voltage(['1', '2'], 3)
+    hmp.select_on_channel(['1', '2'])
+    hmp.turn_on_selected_channels()
+    return hmp
+
+
+def test_overvoltage_trip_and_clear(powered):
+    events = []
+    monitor = ProtectionMonitor(powered, ['1', '2'], on_trip=events.append)
+    monitor.arm()
+    assert monitor.poll() == []
+    powered.set_voltage(['2'], 6)
+    assert [event[:3] for event in monitor.poll()] == [(2, 'ovp', True)]
+    assert monitor.tripped() == ['2']
+    assert monitor.poll() == []
+    powered.set_voltage(['2'], 3)
+    powered.select_on_channel(['2'])
+    assert [event[:3] for event in monitor.poll()] == [(2, 'ovp', False)]
+    assert monitor.tripped() == []
+    assert [event[:3] for event in events] == [(2, 'ovp', True), (2, 'ovp', False)]
+
+
+def test_fuse_trip(powered, sim):
+    sim.channels[0].load = 1.0
+    monitor = ProtectionMonitor(powered, ['1', '2'])
+    monitor.arm()
+    powered.set_current(['1'], 1)
+    powered.set_on_fuse_channels(['1'])
+    events = monitor.poll()
+    assert [event[:3] for event in events] == [(1, 'fuse', True)]
+    assert monitor.tripped('fuse') == ['1']
+    assert monitor.tripped('ovp') == []
+
+
+def test_trip_cleared_between_polls_is_reported(powered):
+    monitor = ProtectionMonitor(powered, ['2'])
+    monitor.arm()
+    powered.set_voltage(['2'], 6)
+    powered.set_voltage(['2'], 3)
+    powered.select_on_channel(['2'])
+    assert [event[:3] for event in monitor.poll()] == [(2, 'ovp', True), (2, 'ovp', False)]
+
+
+def test_background_monitor_fires_callbacks(powered):
+    tripped = threading.Event()
+    cleared = threading.Event()
+
+    def on_trip(event):
+        (tripped if event.tripped else cleared).set()
+    with ProtectionMonitor(powered, ['1'], interval=0.01, on_trip=on_trip) as monitor:
+        powered.set_voltage(['1'], 6)
+        assert tripped.wait(2)
+        powered.set_voltage(['1'], 3)
+        powered.select_on_channel(['1'])
+        assert cleared.wait(2)
+    assert not monitor.running
+    assert monitor.error is None
+
+
+def test_invalid_channels(hmp):
+    with pytest.raises(ValueError):
+        ProtectionMonitor(hmp, ['7'])
@@ -0,0 +1,105 @@
+import socket
+
+import pytest
+
+from hmp4040 import HMP4040, HMP4040Simulator
+from hmp4040.recording import REPLY, SENT, SESSION, TIMEOUT, ReplayMismatch, ReplayTransport, read_log, summarize
+
+
+def replayer(log, strict=True):
+    supply = HMP4040()
+    supply.write_delay = 0
+    supply.transport = ReplayTransport(log, strict)
+    supply.connect()
+    return supply
+
+
+@pytest.fixture
+def log(tmp_path):
+    return str(tmp_path / 'session.hmplog')
+
+
+def test_replay_recorded_session(hmp, log):
+    hmp.set_voltage(['1'], '4.0')
+    hmp.start_recording(log)
+    recorded = hmp.measure_voltage(['1']), hmp.get_voltage(['1', '2'])
+    hmp.stop_recording()
+
+    replay = replayer(log)
+    assert (replay.measure_voltage(['1']), replay.get_voltage(['1', '2'])) == recorded
+    assert replay.transport.remaining == 0
+
+
+def test_recording_started_mid_connection_writes_session(hmp, log):
+    hmp.measure_voltage(['2'])
+    hmp.start_recording(log)
+    hmp.measure_voltage(['2'])
+    hmp.stop_recording()
+    kinds = [record.kind for record in read_log(log)]
+    assert kinds == [SESSION, SENT, REPLY]
+    assert replayer(log).measure_voltage(['2']) == [0.0]
+
+
+def test_strict_replay_rejects_different_commands(hmp, log):
+    hmp.start_recording(log)
+    hmp.measure_voltage(['1'])
+    hmp.stop_recording()
+    with pytest.raises(ReplayMismatch):
+        replayer(log).measure_voltage(['2'])
+
+
+def test_loose_replay_returns_recorded_replies(hmp, log):
+    hmp.set_voltage(['1'], '4.0')
+    hmp.start_recording(log)
+    hmp.get_voltage(['1'])
+    hmp.stop_recording()
+    assert replayer(log, strict=False).get_voltage(['2']) == [4.0]
+
+
+def test_replay_past_end_of_session(hmp, log):
+    hmp.start_recording(log)
+    hmp.get_voltage(['1'])
+    hmp.stop_recording()
+    replay = replayer(log)
+    replay.get_voltage(['1'])
+    with pytest.raises(ReplayMismatch):
+        replay.get_current(['1'])
+
+
+def test_timeouts_are_recorded_and_replayed(log):
+    with HMP4040Simulator(drop_rate=1.0) as sim:
+        supply = HMP4040(read_timeout=0.05)
+        supply.connect(*sim.address)
+        supply.start_recording(log)
+        with pytest.raises(socket.timeout):
+            supply.get_voltage(['1'])
+        supply.stop_recording()
+        supply.disconnect()
+    assert TIMEOUT in [record.kind for record in read_log(log)]
+    with pytest.raises(socket.timeout):
+        replayer(log).get_voltage(['1'])
+
+
+def test_summarize(hmp, log):
+    hmp.start_recording(log)
+    hmp.measure_voltage(['1', '2'])
+    hmp.measure_voltage(['1'])
+    hmp.get_errors()
+    hmp.stop_recording()
+    summary = summarize(log, outliers=1)
+    assert summary['sessions'] == 1
+    assert summary['sends'] == 3
+    assert summary['replies'] == 4 and summary['timeouts'] == 0
+    hot = {row['verb']: row for row in summary['hot_commands']}
+    assert (hot['MEAS:VOLT?']['count'], hot['MEAS:VOLT?']['replies']) == (3, 3)
+    assert (hot['INST']['count'], hot['INST']['replies'], hot['INST']['mean_ms']) == (3, 0, None)
+    assert hot['SYST:ERR?']['count'] == 1
+    assert len(summary['outliers']) == 1
+    assert len(summarize(log, top=1)['hot_commands']) == 1
+
+
+def test_read_log_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'not a log')
+    with pytest.raises(ValueError):
+        list(read_log(str(path)))
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from hmp4040 import PILaw, Regulator
+
+
+@pytest.fixture
+def loaded(hmp, sim):
+    for channel in sim.channels[:2]:
+        channel.load = 10.0
+        channel.lead = 1.0
+    hmp.set_channel_params(['1', '2'], 1, 2)
+    hmp.select_on_channel(['1', '2'])
+    hmp.turn_on_selected_channels()
+    return hmp
+
+
+def wait_converged(regulator, tolerance, timeout=3):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if regulator.converged(tolerance):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_voltage_at_load(loaded, sim):
+    with Regulator(loaded, {'1': 5, '2': 2}, rate=100, max_slew=50) as regulator:
+        assert wait_converged(regulator, 0.005)
+    assert regulator.error is None
+    assert sim.channels[0].voltage == pytest.approx(5.5, abs=0.01)
+    assert sim.channels[1].voltage == pytest.approx(2.2, abs=0.01)
+    assert regulator.stats().iterations > 0
+
+
+def test_current(loaded, sim):
+    with Regulator(loaded, {'1': 0.4}, quantity='curr', law=PILaw(ki=200), rate=100,
+                   max_slew=50) as regulator:
+        assert wait_converged(regulator, 0.001)
+    assert sim.channels[0].voltage == pytest.approx(4.4, abs=0.02)
+
+
+def test_setpoint_is_limited_by_overvoltage_protection(loaded, sim):
+    loaded.set_overvoltage_protection_value(['1'], 4)
+    regulator = Regulator(loaded, {'1': 10}, ovp_margin=0.5, max_slew=None)
+    regulator.prepare()
+    for _ in range(5):
+        regulator.step()
+    assert regulator.setpoints['1'] == 3.5
+    assert sim.channels[0].voltage == 3.5
+    assert not sim.channels[0].ovp_tripped
+
+
+@pytest.mark.parametrize('quantity', ['POW', 'MEAS:VOLT', ''])
+def test_invalid_quantity(hmp, quantity):
+    with pytest.raises(ValueError):
+        Regulator(hmp, {'1': 1}, quantity=quantity)
+
+
+def test_invalid_channels(hmp):
+    with pytest.raises(ValueError):
+        Regulator(hmp, {'9': 1}).prepare()
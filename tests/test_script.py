@@ -0,0 +1,101 @@
+import pytest
+
+from hmp4040.script import Script, ScriptError, main
+
+
+def events(script):
+    return [action[1] for _, actions in script.steps for action in actions if action[0] == 'batch']
+
+
+def test_commands_on_channels_and_variables():
+    script = Script.compile('set V = 2\non 1,2 VOLT ${V * 1.5}; CURR 1\nOUTP:GEN ${V - 1}')
+    assert events(script) == [[('1', 'VOLT 3'), ('1', 'CURR 1'), ('2', 'VOLT 3'), ('2', 'CURR 1'),
+                               (None, 'OUTP:GEN 1')]]
+
+
+def test_loops_and_steps():
+    text = '\n'.join(['step ramp', 'for v from 0 to 1 step 0.5', 'on 1 VOLT ${v}', 'end', 'wait 0.1',
+                      'step repeat', 'repeat 2', 'for i in 1 2', 'on ${i} OUTP:SEL 1', 'end', 'end'])
+    script = Script.compile(text)
+    (ramp, ramp_actions), (repeat, repeat_actions) = script.steps
+    assert (ramp, repeat) == ('ramp', 'repeat')
+    assert ramp_actions == [('batch', [('1', 'VOLT 0'), ('1', 'VOLT 0.5'), ('1', 'VOLT 1')]), ('wait', 0.1)]
+    assert [channel for channel, cmd in repeat_actions[0][1]] == ['1', '2', '1', '2']
+    assert script.commands == 7
+
+
+def test_initial_variables_and_calls():
+    script = Script.compile('call set_voltage 1,2 ${V}', {'V': 5})
+    assert script.steps == [('main', [('call', 'set_voltage', [['1', '2'], 5], 'set_voltage 1,2 5')])]
+
+
+@pytest.mark.parametrize('text, lineno', [
+    ('for i in 1 2\nVOLT 1', 1),
+    ('end', 1),
+    ('VOLT 1\non 9 VOLT 1', 2),
+    ('set i = 1\non ${i + 8} VOLT 1', 2),
+    ('VOLT ${x}', 1),
+    ('call _exchange', 1),
+    ('call no_such_method', 1),
+    ('for v from 0 to 1 step 0\nend', 1),
+    ('VOLT ${__import__("os")}', 1),
+])
+def test_errors_report_line(text, lineno):
+    with pytest.raises(ScriptError) as info:
+        Script.compile(text)
+    assert info.value.lineno == lineno
+
+
+def test_batches_are_split_and_synchronized(hmp):
+    script = Script.compile('on 1 VOLT 1\non 2 VOLT 2\nVOLT?\non 3 VOLT 3', max_batch=2)
+    batches = [action for _, action in script.batches()]
+    assert [len(batch[1]) for batch in batches] == [2, 2]
+    assert batches[0][2] == [] and batches[1][2] == ['VOLT?']
+    assert Script._commands(hmp, batches[0]) == ['INST OUT1', 'VOLT 1', 'INST OUT2', 'VOLT 2', '*OPC?']
+    assert Script._commands(hmp, batches[1]) == ['VOLT?', 'INST OUT3', 'VOLT 3', '*OPC?']
+
+
+def test_raw_selection_is_tracked(hmp, sim):
+    script = Script.compile('on 1 VOLT 2\nINST OUT2\non 1 VOLT 1\n*RST\non 1 CURR 0.5')
+    batch = next(action for _, action in script.batches())
+    assert Script._commands(hmp, batch) == ['INST OUT1', 'VOLT 2', 'INST OUT2', 'INST OUT1', 'VOLT 1', '*RST',
+                                            'INST OUT1', 'CURR 0.5', '*OPC?']
+    script = Script.compile('on 1 VOLT 2\nINST OUT2\non 1 VOLT 1')
+    script.run(hmp)
+    assert hmp.get_voltage(['1', '2']) == [1.0, 0.0]
+
+
+def test_run_reports_replies_and_timings(hmp):
+    script = Script.compile('step set\non 1,2 VOLT 4\nstep read\non 2 VOLT?\ncall get_voltage 1,2')
+    timings, replies = script.run(hmp)
+    assert [(timing.step, timing.batches) for timing in timings] == [('set', 1), ('read', 1)]
+    assert timings[0].commands == 5
+    assert [(reply.step, reply.command, reply.value) for reply in replies] == [
+        ('read', 'VOLT?', '4.000'), ('read', 'get_voltage 1,2', [4.0, 4.0])]
+
+
+def test_dry_run(tmp_path, capsys):
+    path = tmp_path / 'setup.scpi'
+    path.write_text('on 1,2 VOLT ${V}\nwait 0.5\non 2 CURR 1\ncall get_voltage 1\n')
+    assert main([str(path), '--dry-run', '--var', 'V=3']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == ['main             INST OUT1 | VOLT 3 | INST OUT2 | VOLT 3 | *OPC?',
+                     'main             wait 0.5',
+                     'main             CURR 1 | *OPC?',
+                     'main             call get_voltage 1']
+
+
+def test_script_errors_exit_with_status_2(tmp_path, capsys):
+    path = tmp_path / 'bad.scpi'
+    path.write_text('for i in 1\n')
+    with pytest.raises(SystemExit) as info:
+        main([str(path), '--dry-run'])
+    assert info.value.code == 2
+    assert 'line 1' in capsys.readouterr().err
+
+
+def test_run_on_simulator(tmp_path, capsys):
+    path = tmp_path / 'setup.scpi'
+    path.write_text('on 3 VOLT 2.5\non 3 VOLT?\n')
+    assert main([str(path), '--simulator']) == 0
+    assert '-> 2.500' in capsys.readouterr().out
@@ -0,0 +1,43 @@
+def selections(hmp):
+    return hmp.stats.commands['INST']
+
+
+def test_repeated_commands_select_channel_once(hmp):
+    hmp.set_voltage(['2'], '3.0')
+    hmp.measure_voltage(['2'])
+    hmp.get_current(['2'])
+    assert selections(hmp) == 1
+
+
+def test_selection_changes_only_where_needed(hmp):
+    hmp.measure_voltage(['1', '2', '3'])
+    assert selections(hmp) == 3
+    hmp.measure_current(['3', '1'])
+    assert selections(hmp) == 4
+
+
+def test_reset_and_raw_commands_forget_selection(hmp):
+    hmp.measure_voltage(['1'])
+    hmp.send_command('*RST')
+    hmp.measure_voltage(['1'])
+    assert selections(hmp) == 2
+    hmp.send_command('INST OUT3')
+    hmp.measure_voltage(['1'])
+    assert selections(hmp) == 4
+
+
+def test_cache_can_be_disabled(hmp):
+    hmp.cache_selection = False
+    hmp.measure_voltage(['1'])
+    hmp.measure_voltage(['1'])
+    assert selections(hmp) == 2
+
+
+def test_cached_selection_addresses_right_channel(hmp, sim):
+    hmp.set_voltage(['1'], '1.0')
+    hmp.set_voltage(['2'], '2.0')
+    hmp.set_voltage(['2', '1'], '4.0')
+    hmp.set_current(['1'], '0.5')
+    assert [c.voltage for c in sim.channels[:2]] == [4.0, 4.0]
+    assert hmp.get_current(['1', '2']) == [0.5, sim.channels[1].current]
+    assert sim.channels[1].current != 0.5
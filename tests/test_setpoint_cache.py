@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+from hmp4040.cache import MISS, SetpointCache
+
+
+@pytest.fixture
+def cached(hmp):
+    hmp.enable_setpoint_cache()
+    return hmp
+
+
+def test_writes_fill_cache(cached, sent):
+    cached.set_voltage(['1', '2'], 5)
+    cached.set_current(['1'], 0.5)
+    cached.set_channel_params(['3'], 2, 1)
+    before = sent()
+    assert cached.get_voltage(['1', '2', '3']) == [5.0, 5.0, 2.0]
+    assert cached.get_current(['1', '3']) == [0.5, 1.0]
+    assert cached.get_channel_params(['3']) == [(2.0, 1.0)]
+    assert sent() == before
+
+
+def test_reads_fill_cache(cached, sent):
+    assert cached.get_voltage(['1']) == [0.0]
+    before = sent()
+    assert cached.get_voltage(['1']) == [0.0]
+    assert sent() == before
+    assert cached.get_voltage(['1', '2']) == [0.0, 0.0]
+    assert sent() == before + 2
+
+
+def test_measurements_are_not_cached(cached, sent):
+    cached.measure_voltage(['1'])
+    before = sent()
+    cached.measure_voltage(['1'])
+    assert sent() > before
+
+
+def test_entries_expire():
+    cache = SetpointCache(ttl=0.05)
+    cache.put('1', 'VOLT', 1.0)
+    assert cache.get('1', 'VOLT') == 1.0
+    time.sleep(0.06)
+    assert cache.get('1', 'VOLT') is MISS
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize('cmd', ['VOLT UP', 'VOLT DOWN', 'VOLT MAX', 'VOLT MIN', 'VOLTAGE 3', 'SOUR:VOLT 3'])
+def test_relative_and_long_commands_invalidate(cmd):
+    cache = SetpointCache()
+    cache.put('1', 'VOLT', 1.0)
+    cache.put('2', 'VOLT', 1.0)
+    cache.track('1', cmd)
+    assert cache.get('1', 'VOLT') is MISS
+    assert cache.get('2', 'VOLT') == 1.0
+
+
+def test_unknown_channel_invalidates_all():
+    cache = SetpointCache()
+    cache.put('1', 'VOLT', 1.0)
+    cache.track(None, 'VOLT 2')
+    assert len(cache) == 0
+
+
+def test_harmless_commands_keep_entries():
+    cache = SetpointCache()
+    cache.put('1', 'VOLT', 1.0)
+    cache.track('1', 'FUSE:LINK 2')
+    cache.track('1', 'VOLT?')
+    cache.track('1', 'OUTP:SEL 1')
+    assert cache.get('1', 'VOLT') == 1.0
+
+
+def test_up_and_down_are_reread(cached, sim):
+    cached.set_voltage(['1'], 5)
+    cached.voltage_up(['1'])
+    assert cached.get_voltage(['1']) == [6.0]
+    cached.current_down(['1'])
+    assert cached.get_current(['1']) == [pytest.approx(sim.channels[0].current)]
+
+
+def test_reset_and_recall_invalidate(cached):
+    cached.set_voltage(['1'], 5)
+    cached.send_command('*SAV 1')
+    cached.reset_hmp4040()
+    assert cached.get_voltage(['1']) == [0.0]
+    cached.send_command('*RCL 1')
+    assert cached.get_voltage(['1']) == [5.0]
+    cached.send_command('*RST')
+    assert cached.get_voltage(['1']) == [0.0]
+
+
+def test_failed_write_invalidates(cached):
+    cached.auto_reconnect = False
+    cached.set_voltage(['1'], 5)
+    cached.transport.sock.close()
+    with pytest.raises(OSError):
+        cached.set_voltage(['1'], 6)
+    assert len(cached.setpoint_cache) == 0
+
+
+def test_invalidate_setpoints(cached):
+    cached.set_voltage(['1', '2'], 5)
+    cached.invalidate_setpoints(['1'])
+    assert cached.setpoint_cache.get('1', 'VOLT') is MISS
+    assert cached.setpoint_cache.get('2', 'VOLT') == 5.0
+    cached.invalidate_setpoints()
+    assert len(cached.setpoint_cache) == 0
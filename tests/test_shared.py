@@ -0,0 +1,160 @@
+import threading
+import time
+
+import pytest
+
+from hmp4040 import SharedHMP4040
+
+
+def run_threads(target, count):
+    errors = []
+
+    def guarded(n):
+        try:
+            target(n)
+        except Exception as exc:
+            errors.append(exc)
+    threads = [threading.Thread(target=guarded, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_threads_do_not_interleave_selection(hmp, sim):
+    def worker(n):
+        channel = str(n + 1)
+        for step in range(20):
+            voltage = n + step / 10
+            assert hmp.set_voltage([channel], voltage) is True
+            assert hmp.get_voltage([channel]) == [pytest.approx(voltage)]
+            assert hmp.send_batch(['INST OUT' + channel, 'INST:NSEL?', 'VOLT?']) == \
+                ['%s\n' % channel, '%.3f\n' % voltage]
+    run_threads(worker, 4)
+    assert [channel.voltage for channel in sim.channels] == [pytest.approx(n + 1.9) for n in range(4)]
+
+
+@pytest.fixture
+def shared(hmp):
+    with SharedHMP4040(hmp) as shared:
+        yield shared
+
+
+def blocked(shared):
+    """
+    :return: событие, до установки которого поток ввода-вывода занят, чтобы следующие запросы накопились в очереди
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def wait(hmp):
+        started.set()
+        release.wait(2)
+    shared.submit(wait)
+    assert started.wait(2)
+    return release
+
+
+def test_shared_threads_get_their_own_replies(shared):
+    def worker(n):
+        channel = str(n + 1)
+        for step in range(10):
+            voltage = '%.3f' % (n + step / 10)
+            shared.submit_channels([channel], 'VOLT ' + voltage).result(2)
+            assert shared.submit_channels([channel], 'VOLT?').result(2) == [voltage + '\n']
+    run_threads(worker, 4)
+
+
+def test_batches_are_coalesced(shared):
+    release = blocked(shared)
+    futures = [shared.submit_channels([str(n)], 'VOLT %d' % n, 'VOLT?') for n in range(1, 5)]
+    futures.append(shared.submit_batch(['*OPC?']))
+    exchanges = shared.exchanges
+    release.set()
+    assert [future.result(2) for future in futures] == [['%d.000\n' % n] for n in range(1, 5)] + [['1\n']]
+    assert shared.exchanges == exchanges + 1
+
+
+def test_coalescing_limits(hmp):
+    with SharedHMP4040(hmp, max_coalesce=4) as shared:
+        release = blocked(shared)
+        futures = [shared.submit_batch(['*OPC?']) for _ in range(6)]
+        futures += [shared.submit_batch(['*OPC?'], priority=shared.BULK) for _ in range(2)]
+        release.set()
+        assert [future.result(2) for future in futures] == [['1\n']] * 8
+        assert shared.exchanges == 4
+
+
+def test_methods_are_not_coalesced(shared, hmp):
+    release = blocked(shared)
+    first = shared.submit_batch(['*OPC?'])
+    voltage = shared.get_voltage(['1'])
+    second = shared.submit_batch(['*OPC?'])
+    release.set()
+    assert (first.result(2), voltage.result(2), second.result(2)) == (['1\n'], [0.0], ['1\n'])
+    assert shared.exchanges == 2
+
+
+def test_failed_exchange_fails_every_request(shared, hmp):
+    release = blocked(shared)
+    futures = [shared.submit_batch(['*OPC?']) for _ in range(2)]
+    hmp.auto_reconnect = False
+    hmp.transport.sock.close()
+    release.set()
+    for future in futures:
+        with pytest.raises(OSError):
+            future.result(2)
+
+
+def test_priority_and_deadline_order(shared):
+    order = []
+
+    def record(hmp, name):
+        order.append(name)
+    release = blocked(shared)
+    futures = [
+        shared.submit(record, 'bulk', priority=shared.BULK),
+        shared.submit(record, 'telemetry', priority=shared.TELEMETRY),
+        shared.submit(record, 'control late', timeout=5),
+        shared.submit(record, 'control soon', timeout=1),
+        shared.submit(record, 'control'),
+        shared.submit(record, 'emergency', priority=shared.EMERGENCY),
+    ]
+    release.set()
+    for future in futures:
+        future.result(2)
+    assert order == ['emergency', 'control soon', 'control late', 'control', 'telemetry', 'bulk']
+
+
+def test_expired_requests_are_not_sent(shared, sent):
+    release = blocked(shared)
+    expired = shared.submit_batch(['SYST:BEEP'], timeout=0.01)
+    kept = shared.submit_batch(['*OPC?'], timeout=2)
+    before = sent()
+    threading.Event().wait(0.05)
+    release.set()
+    with pytest.raises(TimeoutError):
+        expired.result(2)
+    assert kept.result(2) == ['1\n']
+    assert sent() == before + 1
+    assert shared.expired == 1
+
+
+def test_rate_limit(hmp):
+    with SharedHMP4040(hmp, rate=50, burst=2) as shared:
+        start = time.monotonic()
+        futures = [shared.submit_batch(['*OPC?'], priority=shared.BULK) for _ in range(7)]
+        for future in futures:
+            future.result(2)
+        assert time.monotonic() - start >= 0.09
+        release = blocked(shared)
+        start = time.monotonic()
+        futures = [shared.submit_batch(['*OPC?'], priority=shared.BULK) for _ in range(2)]
+        emergency = shared.emergency_off()
+        release.set()
+        assert emergency.result(2) == ['1\n']
+        assert not futures[-1].done()
+        assert time.monotonic() - start < 0.1
+        for future in futures:
+            future.result(2)
@@ -0,0 +1,102 @@
+import socket
+import time
+
+import pytest
+
+from hmp4040 import HMP4040, HMP4040Simulator
+
+
+def connected(sim, **kwargs):
+    supply = HMP4040(**kwargs)
+    supply.write_delay = 0
+    assert supply.connect(*sim.address)
+    return supply
+
+
+def test_latency_delays_replies():
+    with HMP4040Simulator(latency=0.1) as sim:
+        supply = connected(sim)
+        start = time.monotonic()
+        supply.get_identification_info()
+        assert time.monotonic() - start >= 0.1
+        supply.disconnect()
+
+
+def test_fragmented_replies_are_reassembled():
+    with HMP4040Simulator(fragment=3, fragment_delay=0.001) as sim:
+        supply = connected(sim)
+        assert supply.get_identification_info() == 'ROHDE&SCHWARZ,HMP4040,000000000,HW50020001/SW2.51'
+        assert supply.get_voltage(['1', '2']) == [0.0, 0.0]
+        supply.disconnect()
+
+
+def test_dropped_replies_time_out():
+    with HMP4040Simulator(drop_rate=1.0) as sim:
+        supply = connected(sim, read_timeout=0.05)
+        with pytest.raises(socket.timeout):
+            supply.get_voltage(['1'])
+        supply.disconnect()
+
+
+def test_injected_errors_are_reproducible():
+    def errors(seed):
+        sim = HMP4040Simulator(error_rate=0.5, seed=seed)
+        for _ in range(20):
+            sim.execute('VOLT 1')
+        return list(sim.errors)
+    assert errors(1) == errors(1)
+    assert set(errors(1)) <= {-100, -350}
+    assert 0 < len(errors(1)) <= 10
+
+
+def test_scpi_errors():
+    sim = HMP4040Simulator()
+    assert sim.execute('VOLT 99') is None
+    assert sim.execute('FOO') is None
+    assert sim.execute('*ESR?;SYST:ERR?;SYST:ERR?;SYST:ERR?') == '48;-222,"Data out of range";' \
+                                                                 '-113,"Undefined header";0,"No error"'
+
+
+def test_resistive_load_and_current_limit():
+    sim = HMP4040Simulator()
+    sim.channels[0].load = 10.0
+    sim.channels[0].lead = 1.0
+    sim.execute('INST OUT1;APPL 11,2;OUTP:SEL 1;OUTP:GEN 1')
+    assert sim.execute('MEAS:VOLT?;MEAS:CURR?') == '10.0000;1.0000'
+    sim.execute('CURR 0.5')
+    assert sim.execute('MEAS:VOLT?;MEAS:CURR?') == '5.0000;0.5000'
+    sim.execute('OUTP:GEN 0')
+    assert sim.execute('MEAS:VOLT?') == '0.0000'
+
+
+def test_overvoltage_trip():
+    sim = HMP4040Simulator()
+    sim.execute('INST OUT1;VOLT 5;VOLT:PROT 6;OUTP:SEL 1;OUTP:GEN 1')
+    assert sim.execute('VOLT:PROT:TRIP?') == '0'
+    sim.execute('VOLT 7')
+    assert sim.execute('VOLT:PROT:TRIP?;OUTP:SEL?;MEAS:VOLT?') == '1;0;0.0000'
+    assert sim.execute('STAT:QUES:INST:ISUM1:COND?') == str(1 << 9)
+    sim.execute('VOLT 5;OUTP:SEL 1')
+    assert sim.execute('VOLT:PROT:TRIP?;OUTP:SEL?') == '0;1'
+
+
+def test_measured_overvoltage_mode_uses_load_voltage():
+    sim = HMP4040Simulator()
+    sim.channels[0].load = 1.0
+    sim.channels[0].lead = 1.0
+    sim.execute('INST OUT1;VOLT:PROT 6;VOLT:PROT:MODE MEAS;APPL 10,10;OUTP:SEL 1;OUTP:GEN 1')
+    assert sim.execute('VOLT:PROT:TRIP?') == '0'
+    sim.execute('VOLT:PROT:MODE PROT')
+    assert sim.execute('VOLT:PROT:TRIP?') == '1'
+
+
+def test_fuse_trip_switches_off_linked_channels():
+    sim = HMP4040Simulator()
+    sim.channels[0].load = 1.0
+    sim.execute('INST OUT2;VOLT 1;OUTP:SEL 1')
+    sim.execute('INST OUT1;FUSE:LINK 2;FUSE 1;VOLT 5;CURR 1;OUTP:SEL 1')
+    assert sim.execute('FUSE:TRIP?') == '0'
+    sim.execute('OUTP:GEN 1')
+    assert sim.execute('FUSE:TRIP?;OUTP:SEL?') == '1;0'
+    assert sim.execute('STAT:QUES:INST:ISUM1:COND?') == str(1 << 10)
+    assert sim.execute('INST OUT2;OUTP:SEL?;FUSE:TRIP?') == '0;0'
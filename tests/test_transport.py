@@ -0,0 +1,91 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from hmp4040 import HMP4040, HMP4040Pool
+
+
+def drop(hmp):
+    hmp.transport.sock.shutdown(socket.SHUT_RDWR)
+
+
+def test_reconnects_and_restores_selection(hmp, sim):
+    hmp.set_voltage(['2'], '3.0')
+    hmp.send_command('INST OUT2')
+    drop(hmp)
+    assert hmp.get_voltage(['2']) == [3.0]
+    assert hmp.connectionStatus is True
+    assert hmp.stats.commands['INST'] == 3
+
+
+def test_does_not_repeat_non_replayable_commands(hmp, sim):
+    hmp.set_voltage(['1'], '1.0')
+    hmp.set_step_voltage('1.0')
+    drop(hmp)
+    with pytest.raises(OSError):
+        hmp.voltage_up(['1'])
+    assert sim.channels[0].voltage == 1.0
+
+
+def test_never_connected_driver_does_not_reconnect():
+    supply = HMP4040('127.0.0.1', '1')
+    started = time.monotonic()
+    with pytest.raises(OSError):
+        supply.measure_voltage(['1'])
+    assert time.monotonic() - started < supply.backoff_base
+    assert supply.connectionStatus is False
+
+
+def test_disconnected_driver_does_not_reconnect(hmp):
+    hmp.disconnect()
+    with pytest.raises(OSError):
+        hmp.measure_voltage(['1'])
+    assert hmp.connectionStatus is False
+
+
+def test_pool_keeps_channel_commands_on_their_channel(sim):
+    pool = HMP4040Pool(*sim.address, size=3)
+
+    def worker(channel):
+        for n in range(50):
+            with pool.connection() as supply:
+                supply.write_delay = 0
+                supply.set_voltage([channel], channel + '.0')
+                if n % 10 == 0:
+                    supply.get_status_byte()
+
+    threads = [threading.Thread(target=worker, args=(channel,)) for channel in '123']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert [c.voltage for c in sim.channels] == [1.0, 2.0, 3.0, 0.0]
+    finally:
+        pool.close()
+
+
+def test_pool_keeps_selection_and_queries_together(sim):
+    pool = HMP4040Pool(*sim.address, size=2)
+    with pool.connection() as supply:
+        supply.unlink_fuse('1', ['2', '3', '4'])
+        supply.unlink_fuse('3', ['1', '2', '4'])
+        supply.set_link_fuse('1', ['2'])
+    wrong = []
+
+    def worker(source, expected):
+        for _ in range(200):
+            with pool.connection() as supply:
+                linked = supply.get_link_fuse(source, ['2'])
+                if linked != expected:
+                    wrong.append((source, linked))
+
+    threads = [threading.Thread(target=worker, args=args) for args in (('1', [True]), ('3', [False]))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+    assert wrong == []
@@ -0,0 +1,62 @@
+import pytest
+
+from hmp4040 import HMP4040, HMP4040Simulator
+
+
+@pytest.mark.parametrize('voltage', ['-0.1', '32.06', '40', 'abc', None])
+def test_set_voltage_rejects_out_of_range(hmp, sim, sent, voltage):
+    before = sent()
+    assert hmp.set_voltage(['1'], voltage) is False
+    assert sent() == before
+    assert sim.channels[0].voltage == 0.0
+
+
+@pytest.mark.parametrize('current', ['-1', '10.01', 'x'])
+def test_set_current_rejects_out_of_range(hmp, sent, current):
+    before = sent()
+    assert hmp.set_current(['1'], current) is False
+    assert sent() == before
+
+
+@pytest.mark.parametrize('delay', [-1, 251, '1.5', 'abc'])
+def test_set_fuse_delay_rejects_out_of_range(hmp, sent, delay):
+    before = sent()
+    assert hmp.set_fuse_delay(['1'], delay) is False
+    assert sent() == before
+
+
+def test_set_fuse_delay_accepts_range(hmp):
+    assert hmp.set_fuse_delay(['1', '2'], 0) is True
+    assert hmp.set_fuse_delay(['3'], 250) is True
+    assert hmp.get_fuse_delay(['1', '2', '3']) == [0, 0, 250]
+
+
+@pytest.mark.parametrize('channels_', [['5'], ['0'], ['1', 'x'], [None], 5])
+def test_invalid_channels_are_rejected(hmp, sent, channels_):
+    before = sent()
+    assert hmp.set_voltage(channels_, '1.0') is False
+    assert hmp.measure_voltage(channels_) is False
+    assert sent() == before
+
+
+def test_one_bad_argument_rejects_whole_call(hmp, sim):
+    assert hmp.set_channel_params(['1'], '5.0', '11.0') is False
+    assert hmp.set_channel_params(['1'], '33.0', '1.0') is False
+    assert sim.channels[0].voltage == 0.0
+    assert hmp.set_channel_params(['1'], '5.0', '1.0') is True
+    assert hmp.get_channel_params(['1']) == [(5.0, 1.0)]
+
+
+def test_limits_follow_detected_model():
+    with HMP4040Simulator(model='HMP2030', channels=3) as sim:
+        supply = HMP4040()
+        supply.write_delay = 0
+        supply.connect(*sim.address)
+        try:
+            assert supply.detect_model().name == 'HMP2030'
+            assert supply.set_current(['1'], '6.0') is False
+            assert supply.set_voltage(['4'], '1.0') is False
+            assert supply.upload_arbitrary_sequence(['1'], [(5.0, 10.0, 1.0)]) is False
+            assert supply.set_current(['3'], '5.0') is True
+        finally:
+            supply.disconnect()